@@ -0,0 +1,192 @@
+# description: headless batch solver, it reads puzzles from a file or the standard input and writes one JSON result per line
+# author: Seminara Luigi
+# date: 2023-02-18
+# tags: python, puzzle, puzzle_solver, cli, batch, jsonl
+
+import sys
+import json
+import itertools
+import argparse
+
+# Input formats: 'lines' has a whole puzzle on every line, 'grid' has n lines of n tiles per puzzle (the format
+# of experiments/, consecutive puzzles may be separated by blank lines), 'auto' tells them apart line by line.
+INPUT_FORMATS = ("auto", "lines", "grid")
+
+# Number of puzzles read before the workers are started, the heuristic tables of their sizes are loaded once
+# and shared by all the workers. The tables of a size first seen later are loaded by every worker on its own.
+PRELOAD_WINDOW = 1024
+
+
+
+def parse_arguments(argv=None):
+    """ It parses the command line arguments. """
+    parser = argparse.ArgumentParser(description="Solve puzzles without the GUI, one JSON result per line.")
+    parser.add_argument("input", type=str, nargs="?", help="File of the puzzles, the standard input if missing or -", default="-")
+    parser.add_argument("--output", type=str, help="File of the results, the standard output if missing or -", default="-")
+    parser.add_argument("--algorithm", type=str, help="Search algorithm (e.g. IDA*, BiBFS) or auto", default="auto")
+    parser.add_argument("--heuristic", type=str, help="Heuristic of the informed algorithms. Defaults to the one picked by auto", default=None)
+    parser.add_argument("--goal", type=str, help="Goal of the puzzles, its tiles separated by blanks or commas. Defaults to the tiles in order followed by the blank", default=None)
+    parser.add_argument("--format", type=str, choices=INPUT_FORMATS, help="Format of the input", default="auto")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, the puzzles are solved in this process without it", default=None)
+    parser.add_argument("--unordered", action="store_true", help="With --workers, write the results as soon as they are ready instead of in input order")
+    parser.add_argument("--timeout", type=float, help="With --workers, time limit of a puzzle in seconds", default=None)
+    parser.add_argument("--memory-limit", type=int, help="With --workers, memory limit of a worker in MB", default=None)
+    parser.add_argument("--cache", type=str, help="Path of the solution cache, the optimal solutions are looked up and stored there", default=None)
+    parser.add_argument("--log-level", type=str, help="Level of the log written to the standard error (e.g. INFO)", default=None)
+    args = parser.parse_args(argv)
+    if args.workers and args.algorithm == "PIDA*":
+        parser.error("PIDA* cannot be used with --workers, its workers cannot start processes of their own")
+    return args
+
+
+
+def read_puzzles(lines, fmt="auto"):
+    """
+        It yields the puzzles read from the lines, tiles may be separated by blanks or commas.
+        With the 'auto' format a line holding a square number n of tiles, at least 9, is a whole puzzle unless it
+        is the first of n lines of n tiles that together hold every tile of an n x n board once, the grid is read
+        then. Any other line is the first row of a grid with as many rows as tiles.
+
+        Args:
+            lines: this is an iterable of lines.
+            fmt: this is the input format (see INPUT_FORMATS). Defaults to 'auto'.
+
+        Returns:
+            generator: the tuples (number of the first line of the puzzle, list of the tiles, None) and, for
+                the input that cannot be read, (number of the line, None, error message). The reading goes on
+                from the line after an error.
+    """
+    # pending keeps the lines of a grid that may still turn out to be whole puzzles (see the 'auto' format).
+    rows, pending, seen, width, start = [], [], set(), 0, 0
+    for number, line in enumerate(lines, 1):
+        try:
+            tiles = [int(tile) for tile in line.replace(",", " ").split()]
+        except ValueError:
+            yield from pending
+            yield number, None, "the line does not hold integers"
+            rows, pending = [], []
+            continue
+        if not tiles:
+            continue
+        if pending and (len(tiles) != width or any(tile in seen or tile >= width * width for tile in tiles)):
+            # The lines read so far cannot be the rows of a grid: each of them is a whole puzzle.
+            yield from pending
+            rows, pending = [], []
+        if not rows:
+            if fmt == "lines":
+                yield number, tiles, None
+                continue
+            size = int(round(len(tiles) ** 0.5))
+            whole = fmt == "auto" and size * size == len(tiles) and len(tiles) >= 9
+            width, start, seen = len(tiles), number, set()
+        elif len(tiles) != width:
+            yield number, None, f"expected a row of {width} tiles"
+            rows = []
+            continue
+        if whole:
+            pending.append((number, tiles, None))
+            seen.update(tiles)
+        rows += tiles
+        if len(rows) == width * width:
+            yield start, rows, None
+            rows, pending = [], []
+    if pending:
+        yield from pending
+    elif rows:
+        yield start, None, "the input ends in the middle of a puzzle"
+
+
+
+def solve_each(puzzles, args):
+    """
+        It solves the puzzles one after the other in the current process.
+
+        Args:
+            puzzles: this is the result of read_puzzles.
+            args: this is the result of parse_arguments.
+
+        Returns:
+            generator: the tuples (line, result).
+    """
+    from puzzle.puzzle_batch import solve_puzzle
+    from utils.solution_cache import SolutionCache
+
+    cache = SolutionCache(args.cache) if args.cache else None
+    for line, tiles, error in puzzles:
+        if error is None:
+            yield line, solve_puzzle(tiles, args.algorithm, args.heuristic, cache, args.goal)
+        else:
+            yield line, {"status": "error", "error": error}
+
+
+
+def solve_many(puzzles, args):
+    """
+        It solves the puzzles on a pool of args.workers processes.
+
+        Args:
+            puzzles: this is the result of read_puzzles.
+            args: this is the result of parse_arguments.
+
+        Returns:
+            generator: the tuples (line, result).
+    """
+    from puzzle.puzzle_batch import solve_batch
+
+    # The sizes to preload are those of the first PRELOAD_WINDOW puzzles, the rest of the input is still read lazily.
+    puzzles = iter(puzzles)
+    head = list(itertools.islice(puzzles, PRELOAD_WINDOW))
+    sizes = set()
+    for _, tiles, error in head:
+        n = int(round(len(tiles) ** 0.5)) if error is None else 0
+        if n > 1 and n * n == len(tiles):
+            sizes.add(n)
+
+    # The input is read by the pool while the results are written, the lines and errors are kept by index.
+    lines = {}
+
+    def tasks():
+        for index, (line, tiles, error) in enumerate(itertools.chain(head, puzzles)):
+            lines[index] = (line, error)
+            yield tiles
+
+    for index, result in solve_batch(tasks(), args.algorithm, args.heuristic, args.workers, not args.unordered,
+                                     args.timeout, args.memory_limit, sizes=sorted(sizes), cache_path=args.cache, goal=args.goal):
+        line, error = lines.pop(index)
+        yield line, result if error is None else {"status": "error", "error": error}
+
+
+
+def main(argv=None):
+    """ It solves the puzzles of the input and writes one JSON result per line. """
+    args = parse_arguments(argv)
+    if args.goal is not None:
+        args.goal = [int(tile) for tile in args.goal.replace(",", " ").split()]
+    if args.log_level:
+        import logging
+        logging.basicConfig(format='%(levelname)s %(message)s', level=getattr(logging, args.log_level.upper()))
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    target = sys.stdout if args.output == "-" else open(args.output, "w")
+    failures = 0
+    try:
+        if args.workers:
+            results = solve_many(read_puzzles(source, args.format), args)
+        else:
+            results = solve_each(read_puzzles(source, args.format), args)
+        for line, result in results:
+            if result["status"] == "error":
+                failures += 1
+            target.write(json.dumps(dict(line=line, **result)) + "\n")
+            target.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    return 1 if failures else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
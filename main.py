@@ -7,14 +7,30 @@ import os
 import logging
 import time
 import argparse
-from puzzle.puzzle_solver import PuzzleSolver
+from puzzle.puzzle_solver import PuzzleSolver, INFORMED_ALGORITHMS
+from utils.tracing import TRACE_LEVELS, TRACE_FORMATS, enable_tracing, disable_tracing
+from utils.progress import TqdmSink, enable_progress
 import sys
-import numpy as np
+import random
 import glob as glob
 from PyQt5.QtWidgets import QApplication, QWidget, QGridLayout, QPushButton, QComboBox, QLineEdit
 
 
-def create_logger():
+def parse_arguments():
+    """ It parses the command line arguments. """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ps", type=int, help="Size of the puzzle (e.g. 3 for a 3x3 puzzle)", default=3)
+    parser.add_argument("--ts", type=int, help="Size of the tiles (e.g. 50 for 50x50 pixels)", default=50)
+    parser.add_argument("--log-level", type=str, help="Level of the log file (e.g. DEBUG, INFO, WARNING)", default="INFO")
+    parser.add_argument("--trace", type=str, help="Path of the search trace file, tracing is off without it", default=None)
+    parser.add_argument("--trace-level", type=str, choices=list(TRACE_LEVELS), help="What the trace records", default="nodes")
+    parser.add_argument("--trace-format", type=str, choices=TRACE_FORMATS, help="Format of the trace file", default="jsonl")
+    parser.add_argument("--trace-sample", type=int, help="Record one expanded node every this many", default=1)
+    return parser.parse_args()
+
+
+
+def create_logger(level="INFO"):
     """ It creates the logger. """
     
     # check if logs sirectory exists otherwise create it
@@ -24,7 +40,7 @@ def create_logger():
     logging.basicConfig(filename=f"./logs/run_{time.time()}.log",
                         filemode='w',
                         format='%(levelname)s %(message)s',
-                        level=logging.DEBUG)
+                        level=getattr(logging, level.upper()))
 
 
 class PuzzleWidget(QWidget):
@@ -64,10 +80,7 @@ class PuzzleWidget(QWidget):
         # create the buttons grid layout
         self.grid_layout = QGridLayout(self)
         
-        parser = argparse.ArgumentParser()
-        parser.add_argument("--ps", type=int, help="Size of the puzzle (e.g. 3 for a 3x3 puzzle)", default=3)
-        parser.add_argument("--ts", type=int, help="Size of the tiles (e.g. 50 for 50x50 pixels)", default=50)
-        args = parser.parse_args()
+        args = parse_arguments()
         
         self.puzzle_size = int(args.ps)
         self.size = int(args.ts)
@@ -139,8 +152,8 @@ class PuzzleWidget(QWidget):
     def create_random_puzzle(self):
         for _ in range(self.random_walks):
             empty_row, empty_col = self.get_empty_tile()
-            row = np.random.randint(0, self.puzzle_size)
-            col = np.random.randint(0, self.puzzle_size)
+            row = random.randrange(self.puzzle_size)
+            col = random.randrange(self.puzzle_size)
             if abs(row - empty_row) + abs(col - empty_col) == 1:
                 self.number_of_walks += 1
                 self.buttons[empty_row][empty_col].setText(self.buttons[row][col].text())
@@ -186,7 +199,7 @@ class PuzzleWidget(QWidget):
     
     def create_algorithm_combo_box(self):
         self.algorithm_combo_box = QComboBox(self)
-        self.algorithm_combo_box.addItems(['BFS', 'DFS', 'A*', 'IDA*', 'BA*'])
+        self.algorithm_combo_box.addItems(['BFS', 'LayerBFS', 'ExternalBFS', 'BiBFS', 'DFS', 'A*', 'IDA*', 'PIDA*', 'BA*', 'BatchA*', 'auto'])
         self.algorithm_combo_box.currentIndexChanged.connect(self.algorithm_changed)
         self.algorithm_combo_box.setCurrentIndex(0)
         self.algorithm_combo_box.setFixedSize(self.size, self.size)
@@ -197,14 +210,16 @@ class PuzzleWidget(QWidget):
     def algorithm_changed(self):
         self.chosen_algorithm = self.algorithm_combo_box.currentText()
         print(f"Selected {self.chosen_algorithm} algorithm.")
-        if(self.chosen_algorithm == 'A*' or self.chosen_algorithm == 'IDA*' or self.chosen_algorithm == 'BA*'):
+        if(self.chosen_algorithm in INFORMED_ALGORITHMS):
             value = input(
                 "Please choose a heuristic fucntion:"    +
                 "\n[1] Manhattan Distance"               +
                 "\n[2] Euclidean Distance"               +
                 "\n[3] Linear Conflict"                  +
                 "\n[4] Misplaced Tiles"                  +   
-                "\n[5] Linear Manhattan Conflict\n"
+                "\n[5] Linear Manhattan Conflict"         +
+                "\n[6] Pattern Database"                 +
+                "\n[7] Walking Distance\n"
             )
             if(value == str(1)):
                 self.chosen_heuristic = "manhattan_distance"
@@ -216,6 +231,10 @@ class PuzzleWidget(QWidget):
                 self.chosen_heuristic = "misplaced_tiles"
             elif(value == str(5)):
                 self.chosen_heuristic = "linear_manhattan_conflict"
+            elif(value == str(6)):
+                self.chosen_heuristic = "pattern_database"
+            elif(value == str(7)):
+                self.chosen_heuristic = "walking_distance"
             else: 
                 raise Exception("Wrong input heuristic function!") 
 
@@ -322,8 +341,17 @@ class PuzzleWidget(QWidget):
 
 
 if __name__ == '__main__':
-    create_logger()
-    app = QApplication(sys.argv)
-    widget = PuzzleWidget()
-    widget.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    args = parse_arguments()
+    create_logger(args.log_level)
+    enable_progress(TqdmSink())
+    if args.trace:
+        enable_tracing(args.trace, args.trace_level, args.trace_format, args.trace_sample)
+    try:
+        app = QApplication(sys.argv)
+        widget = PuzzleWidget()
+        widget.show()
+        status = app.exec_()
+    finally:
+        # The trace file is buffered: it is flushed and closed however the GUI ends.
+        disable_tracing()
+    sys.exit(status)
\ No newline at end of file
@@ -0,0 +1,116 @@
+# description: This file contains the PuzzleAnalysis class, the pre-search stage of the solver.
+# author: Seminara Luigi
+# date: 2023-02-14
+# tags: python, puzzle, solvability, parity, lower_bound, routing
+
+import os
+from utils.pattern_database import DEFAULT_PARTITIONS, pattern_database_path
+from utils.distance_metrics import WALKING_DISTANCE_MAX_SIZE
+
+# Lower bound up to which the bidirectional BFS is routed to on boards bigger than 3x3:
+# each of its frontiers stays around half of this depth.
+BIBFS_MAX_BOUND = 16
+
+
+
+def permutation_parity(config, goal):
+    """
+        It returns the parity (0 or 1) of the permutation taking goal to config, blank included.
+        The cycles of the permutation are walked once, so it runs in O(n*n).
+
+        Args:
+            config: this is the configuration of the puzzle.
+            goal: this is the goal state of the puzzle.
+    """
+    goal_position = [0] * len(goal)
+    for i, tile in enumerate(goal):
+        goal_position[tile] = i
+    visited = [False] * len(config)
+    cycles = 0
+    for i in range(len(config)):
+        if not visited[i]:
+            cycles += 1
+            j = i
+            while not visited[j]:
+                visited[j] = True
+                j = goal_position[config[j]]
+    return (len(config) - cycles) & 1
+
+
+
+class PuzzleAnalysis(object):
+
+    def __init__(self, config, goal, n):
+        """
+            The constructor of the PuzzleAnalysis class. It checks the input, its solvability and
+            computes a lower bound on the cost of the solution together with cheap difficulty features.
+
+            Args:
+                config: this is the configuration of the puzzle.
+                goal: this is the goal state of the puzzle.
+                n: this is the dimension of the puzzle.
+
+            Raises:
+                ValueError: if config or goal is not a permutation of the tiles 0 .. n*n-1.
+        """
+        self.config = tuple(map(int, config))
+        self.goal = tuple(map(int, goal))
+        self.n = n
+        tiles = list(range(n * n))
+        if sorted(self.config) != tiles or sorted(self.goal) != tiles:
+            raise ValueError(f"The configuration and the goal must be permutations of the tiles 0 .. {n*n-1}.")
+
+        goal_position = [0] * (n * n)
+        for i, tile in enumerate(self.goal):
+            goal_position[tile] = i
+
+        def distance(tile, i):
+            return abs(i // n - goal_position[tile] // n) + abs(i % n - goal_position[tile] % n)
+
+        # Every move changes the parity of the permutation and moves the blank by one cell, so only
+        # the configurations whose permutation parity matches the blank distance parity are reachable.
+        self.blank_distance = distance(0, self.config.index(0))
+        self.solvable = permutation_parity(self.config, self.goal) == self.blank_distance & 1
+        self.solved = self.config == self.goal
+
+        # Every move brings a single tile one cell closer at best: the Manhattan distance of the
+        # tiles without the blank is a lower bound on the cost of the solution.
+        self.manhattan = sum(distance(tile, i) for i, tile in enumerate(self.config) if tile != 0)
+        self.misplaced = sum(1 for tile, goal_tile in zip(self.config, self.goal) if tile != 0 and tile != goal_tile)
+        self.lower_bound = self.manhattan
+
+        self.algorithm, self.heuristic = self.route()
+
+
+
+    def route(self):
+        """
+            It picks the search algorithm and the heuristic expected to be the fastest on the puzzle.
+            Small boards and easy puzzles use the bidirectional BFS, harder ones IDA* with the pattern
+            database when its file is available (building it would cost more than most searches). Otherwise
+            IDA* uses the walking distance up to 4x4, whose tables are small, or the linear conflict + Manhattan
+            distance: both are admissible, unlike the Manhattan distance with the blank.
+
+            Returns:
+                tuple: the name of the algorithm and the name of the heuristic (None for uninformed algorithms).
+        """
+        if self.n <= 3 or self.lower_bound <= BIBFS_MAX_BOUND:
+            return 'BiBFS', None
+        if self.n in DEFAULT_PARTITIONS and os.path.exists(pattern_database_path(self.n, self.goal, DEFAULT_PARTITIONS[self.n])):
+            return 'IDA*', 'pattern_database'
+        if self.n <= WALKING_DISTANCE_MAX_SIZE:
+            return 'IDA*', 'walking_distance'
+        return 'IDA*', 'linear_manhattan_conflict'
+
+
+
+    def features(self):
+        """
+            It returns the difficulty features of the puzzle.
+
+            Returns:
+                dict: the features by name.
+        """
+        return {"dimension": self.n, "solvable": self.solvable, "solved": self.solved,
+                "lower_bound": self.lower_bound, "manhattan": self.manhattan, "misplaced": self.misplaced,
+                "blank_distance": self.blank_distance, "algorithm": self.algorithm, "heuristic": self.heuristic}
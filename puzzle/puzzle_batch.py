@@ -0,0 +1,215 @@
+# description: This file contains the batch API, which solves many puzzles on a pool of processes.
+# author: Seminara Luigi
+# date: 2023-02-20
+# tags: python, puzzle, puzzle_solver, batch, multiprocessing, timeout
+
+import os
+import time
+import signal
+import resource
+from puzzle.puzzle_solver import PuzzleSolver, path_actions
+from puzzle.puzzle_state import PuzzleState
+from utils.distance_metrics import get_distance_tables, get_walking_distance, walking_distance_path
+from utils.pattern_database import DEFAULT_PARTITIONS, pattern_database_path, get_pattern_database
+from utils.tracing import disable_tracing
+from utils.progress import disable_progress
+from utils.solution_cache import SolutionCache
+
+# Number of puzzles sent to a worker at once, the timeout still applies to every puzzle.
+CHUNK_SIZE = 8
+
+# State of a worker process, filled by init_worker.
+_worker = {}
+
+
+
+class SolveTimeout(BaseException):
+    """ Raised by the alarm of a worker when a puzzle exceeds its time limit. It is not an Exception,
+        so the handlers of the solver do not mistake it for an error of the puzzle. """
+
+
+
+def default_goal(n):
+    """
+        It returns the default goal of a puzzle: the tiles in order, followed by the blank.
+
+        Args:
+            n: this is the dimension of the puzzle.
+    """
+    return list(range(1, n * n)) + [0]
+
+
+
+def solve_puzzle(tiles, algorithm='auto', heuristic=None, cache=None, goal=None):
+    """
+        It solves a puzzle and returns its result.
+
+        Args:
+            tiles: this is the list of the tiles of the puzzle, 0 is the blank tile.
+            algorithm: this is the search algorithm. Defaults to 'auto'.
+            heuristic: this is the heuristic. Defaults to None.
+            cache: this is the SolutionCache of the optimal solutions. Defaults to None.
+            goal: this is the list of the tiles of the goal. Defaults to None (the default_goal of the puzzle size).
+
+        Returns:
+            dict: the status of the search, the moves of the solution and the statistics of the search.
+    """
+    n = int(round(len(tiles) ** 0.5))
+    result = {"n": n, "puzzle": list(tiles)}
+    start_time = time.perf_counter()
+    try:
+        solver = PuzzleSolver(tiles, list(goal) if goal is not None else default_goal(n), algorithm, heuristic, cache=cache)
+        result.update(algorithm=solver.algorithm, heuristic=solver.heuristic_name, lower_bound=solver.analysis.lower_bound)
+        results = solver.search()
+    except MemoryError:
+        result["status"] = "memory"
+        return result
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+        return result
+    if results is None:
+        result["status"] = "unsolvable" if not solver.analysis.solvable else "failed"
+    else:
+        final_state, nodes_expanded, max_search_depth = results
+        result.update(status="solved", moves=path_actions(final_state), cost=final_state.cost, nodes_expanded=nodes_expanded,
+                      max_search_depth=max_search_depth)
+    result["time"] = time.perf_counter() - start_time
+    return result
+
+
+
+def preload(sizes, goal=None):
+    """
+        It loads the read-only data of the heuristics in the current process, so that the workers forked
+        afterwards share it instead of building their own copy. Only the pattern databases are memory-mapped files,
+        whose pages are shared by every process mapping them. The DistanceTables and the walking distance tables
+        are plain objects in the memory of this process: the workers only share them through the copy-on-write pages
+        of fork, a worker started with spawn or forkserver loads its own copy on its first use.
+        A pattern database (see utils.pdb_builder) or a walking distance table is only loaded if its file exists:
+        build it beforehand, or every worker builds it on its first use.
+
+        Args:
+            sizes: this is the list of the dimensions of the puzzles.
+            goal: this is the list of the tiles of the goal, its size is loaded with it and the other sizes with their
+                default_goal. Defaults to None (the default_goal of every size).
+    """
+    for n in sizes:
+        target = tuple(goal) if goal is not None and len(goal) == n * n else tuple(default_goal(n))
+        state = PuzzleState(target, n, target, None)
+        tables = get_distance_tables(state)
+        if n in DEFAULT_PARTITIONS and os.path.exists(pattern_database_path(n, target, DEFAULT_PARTITIONS[n])):
+            get_pattern_database(state)
+        for line in {tables.blank_row, tables.blank_col}:
+            if os.path.exists(walking_distance_path(n, line)):
+                get_walking_distance(n, line)
+
+
+
+def init_worker(algorithm, heuristic, timeout, memory_limit, cache_path=None, goal=None):
+    """
+        It initializes a worker process.
+
+        Args:
+            algorithm: this is the search algorithm.
+            heuristic: this is the heuristic.
+            timeout: this is the time limit of a puzzle in seconds, None for no limit.
+            memory_limit: this is the limit of the address space of the worker in MB, None for no limit.
+            cache_path: this is the path of the solution cache, None for no cache. Defaults to None.
+            goal: this is the list of the tiles of the goal, None for the default_goal of every puzzle. Defaults to None.
+    """
+    _worker["algorithm"] = algorithm
+    _worker["goal"] = goal
+    _worker["heuristic"] = heuristic
+    _worker["timeout"] = timeout
+    _worker["cache"] = SolutionCache(cache_path) if cache_path else None
+    if memory_limit:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # The trace file and the progress sinks belong to the parent process.
+    disable_tracing(close=False)
+    disable_progress()
+
+    def alarm(signum, frame):
+        raise SolveTimeout()
+
+    signal.signal(signal.SIGALRM, alarm)
+
+
+
+def solve_task(task):
+    """
+        It solves a puzzle of the batch within the time limit of the worker.
+
+        Args:
+            task: this is the tuple (index of the puzzle, list of the tiles).
+
+        Returns:
+            tuple: the index of the puzzle and its result, None for a None puzzle.
+    """
+    index, tiles = task
+    if tiles is None:
+        return index, None
+    timeout = _worker["timeout"]
+    try:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            result = solve_puzzle(tiles, _worker["algorithm"], _worker["heuristic"], _worker["cache"], _worker["goal"])
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except SolveTimeout:
+        n = int(round(len(tiles) ** 0.5))
+        result = {"n": n, "puzzle": list(tiles), "status": "timeout", "time": timeout}
+    return index, result
+
+
+
+def solve_batch(puzzles, algorithm='auto', heuristic=None, workers=None, ordered=True, timeout=None, memory_limit=None,
+                sizes=(), chunk_size=CHUNK_SIZE, cache_path=None, goal=None):
+    """
+        It solves the puzzles on a pool of worker processes. The puzzles are consumed lazily, so the input can be
+        a stream. PIDA* is rejected because the workers cannot start processes of their own.
+        The workers are always forked, also where spawn is the default start method (macOS), because the heuristic
+        data loaded by preload reaches them only as the copy-on-write memory of fork: it needs a platform with fork
+        (not Windows).
+
+        Args:
+            puzzles: this is an iterable of puzzles, each one the list of its tiles. A None puzzle is skipped,
+                its result is None (e.g. a placeholder for input that could not be read).
+            algorithm: this is the search algorithm. Defaults to 'auto'.
+            heuristic: this is the heuristic. Defaults to None.
+            workers: this is the number of worker processes. Defaults to the number of cores.
+            ordered: if True the results are yielded in the order of the puzzles, else as soon as they are ready. Defaults to True.
+            timeout: this is the time limit of a puzzle in seconds. Defaults to None (no limit).
+            memory_limit: this is the memory limit of a worker in MB. Defaults to None (no limit).
+            sizes: this is the list of the dimensions of the puzzles whose heuristic data is loaded before
+                the workers are started, to be shared by all of them. Defaults to none.
+            chunk_size: this is the number of puzzles sent to a worker at once. Defaults to CHUNK_SIZE.
+            cache_path: this is the path of the solution cache shared by the workers. Defaults to None (no cache).
+            goal: this is the list of the tiles of the goal of the puzzles. Defaults to None (the default_goal of every puzzle).
+
+        Returns:
+            generator: the tuples (index of the puzzle, result), see solve_puzzle for the result. The status
+                of a result is one of solved, unsolvable, failed, timeout, memory and error.
+
+        Raises:
+            ValueError: if algorithm is PIDA*.
+    """
+    if algorithm == 'PIDA*':
+        raise ValueError("PIDA* cannot be used by solve_batch: its workers cannot start processes of their own.")
+
+    # The checks above run when solve_batch is called, the pool is started by the first request of a result.
+    def results():
+        # Imported here, so that solving a single puzzle with cli.py does not pay for it.
+        import multiprocessing
+
+        preload(sizes, goal)
+        # The workers are forked, so they inherit the data loaded by preload.
+        context = multiprocessing.get_context("fork")
+        initargs = (algorithm, heuristic, timeout, memory_limit, cache_path, goal)
+        with context.Pool(workers or os.cpu_count() or 1, initializer=init_worker, initargs=initargs) as pool:
+            mapper = pool.imap if ordered else pool.imap_unordered
+            for index, result in mapper(solve_task, enumerate(puzzles), chunk_size):
+                yield index, result
+
+    return results()
@@ -4,44 +4,125 @@
 # tags: python, puzzle, solver, BFS, DFS, A*
 
 from utils.distance_metrics import manhattan_distance, eculidean_distance, linear_conflict_single, misplaced_tiles, linear_manhattan_conflict
-from utils.BFS import BFS
-from utils.DFS import DFS
-from utils.A_STAR import A_STAR
-from utils.IDA_STAR import IDA_STAR
-from utils.BA_STAR import BA_STAR
+from utils.distance_metrics import manhattan_distance_state, euclidean_distance_state
+from utils.distance_metrics import manhattan_distance_delta, euclidean_distance_delta, linear_conflict_delta, misplaced_tiles_delta, linear_manhattan_conflict_delta
+from utils.distance_metrics import walking_distance, walking_distance_delta, WALKING_DISTANCE_MAX_SIZE
+from utils.pattern_database import pattern_database, pattern_database_delta
+from utils.priority_queue import OPEN_LISTS
+from utils.progress import get_progress
 from puzzle.puzzle_state import PuzzleState
+from puzzle.puzzle_analysis import PuzzleAnalysis
+from utils.IDA_STAR import replay
 import math
 import time
+import importlib
 import resource
 import logging
 
+# Module and function of the search algorithms supported by set_algorithm, besides 'auto'.
+# The module of an algorithm is imported the first time it is used (PIDA* pulls in multiprocessing, LayerBFS, ExternalBFS and BatchA* NumPy).
+SEARCH_FUNCTIONS = {
+    'BFS': ('utils.BFS', 'BFS'),
+    'LayerBFS': ('utils.LAYER_BFS', 'LAYER_BFS'),
+    'ExternalBFS': ('utils.EXTERNAL_BFS', 'EXTERNAL_BFS'),
+    'BiBFS': ('utils.BiBFS', 'BiBFS'),
+    'DFS': ('utils.DFS', 'DFS'),
+    'A*': ('utils.A_STAR', 'A_STAR'),
+    'IDA*': ('utils.IDA_STAR', 'IDA_STAR'),
+    'PIDA*': ('utils.PIDA_STAR', 'PIDA_STAR'),
+    'BA*': ('utils.BA_STAR', 'BA_STAR'),
+    'BatchA*': ('utils.BATCH_A_STAR', 'BATCH_A_STAR'),
+}
+ALGORITHMS = tuple(SEARCH_FUNCTIONS)
+
+# Search algorithms that need a heuristic.
+INFORMED_ALGORITHMS = ('A*', 'IDA*', 'BA*', 'PIDA*', 'BatchA*')
+
+# Heuristics supported by assign_heuristic.
+HEURISTICS = ('manhattan_distance', 'euclidean_distance', 'linear_conflict', 'misplaced_tiles', 'linear_manhattan_conflict', 'pattern_database', 'walking_distance')
+
+# Heuristics of BatchA*, the ones with a vectorized kernel (see utils.BATCH_A_STAR).
+BATCH_HEURISTICS = ('manhattan_distance', 'euclidean_distance', 'linear_conflict', 'misplaced_tiles', 'linear_manhattan_conflict')
+
+# Heuristics that never overestimate the distance from the goal.
+ADMISSIBLE_HEURISTICS = ('pattern_database', 'walking_distance', 'linear_conflict', 'linear_manhattan_conflict')
+
+# Search algorithms that find optimal solutions without a heuristic, and with an admissible one.
+# A* reopens the explored states reached by a shorter path, so it is optimal with the pattern database too.
+OPTIMAL_ALGORITHMS = ('BFS', 'LayerBFS', 'ExternalBFS', 'BiBFS')
+OPTIMAL_INFORMED_ALGORITHMS = ('A*', 'IDA*', 'PIDA*', 'BA*', 'BatchA*')
+
+# Search algorithms that can stop at a state of the solution cache instead of the goal.
+SHORTCUT_ALGORITHMS = ('A*', 'IDA*')
+
+def path_actions(final_state):
+    """
+        It returns the actions of the path from the initial state to final_state.
+
+        Args:
+            final_state: this is the last state of the path, linked to the initial one through the parents.
+    """
+    actions = []
+    state = final_state
+    while state.parent is not None:
+        actions.append(state.action)
+        state = state.parent
+    actions.reverse()
+    return actions
+
+
+
 class PuzzleSolver(object):
 
-    def __init__(self, initial_state, goal, algorithm='BFS', heuristic= None):
+    def __init__(self, initial_state, goal, algorithm='BFS', heuristic= None, tie_breaking='deepest', open_list='heap', cache=None):
         """ The constructor of the PuzzleSolver class.
 
             Args:
                 initial_state: this is the initial state of the puzzle.
                 goal: this is the goal state of the puzzle.
-                algorithm: this is the search algorithm. Defaults to 'BFS'.
-                heuristic: this is the heuristics. Defaults to None.
+                algorithm: this is the search algorithm, 'auto' lets the analysis of the puzzle pick it. Defaults to 'BFS'.
+                heuristic: this is the heuristics. With 'auto' it is kept if the picked algorithm is informed,
+                    otherwise the analysis picks it as well. Defaults to None.
+                tie_breaking: this is the policy used by A* and BA* to order nodes with the same f
+                    ('deepest', 'fifo', 'lifo' or None, see utils.priority_queue.TIE_BREAKING). Defaults to 'deepest'.
+                open_list: this is the frontier implementation used by A* ('heap' or 'bucket'). Defaults to 'heap'.
+                cache: this is the SolutionCache of the optimal solutions (see utils.solution_cache). Defaults to None.
 
             Raises:
-                NotImplementedError: if the algorithm or heuristic is not supported.
+                NotImplementedError: if the algorithm, heuristic or open list is not supported.
                 AttributeError: if the heuristic is not provided in case of using A* Search.
+                ValueError: if the initial state or the goal is not a permutation of the tiles.
         """
         # Assign the initial state of the puzzle.
         self.initial_state = initial_state
 
+        # Check the puzzle and compute its lower bound before anything is searched.
+        size = int(math.sqrt(len(initial_state)))
+        self.analysis = PuzzleAnalysis(initial_state, goal, size)
+        if algorithm == 'auto':
+            algorithm = self.analysis.algorithm
+            if heuristic is None or algorithm not in INFORMED_ALGORITHMS:
+                heuristic = self.analysis.heuristic
+
         # Assign the search algorithm that will be used in the solver.
         self.set_algorithm(algorithm)
 
         # Assign the heuristic algorithm that will be used in the solver.
         self.assign_heuristic(heuristic, algorithm)
+
+        # Assign the tie-breaking policy of the priority queues.
+        self.tie_breaking = tie_breaking
+
+        # Assign the open list implementation used by A*.
+        if open_list not in OPEN_LISTS:
+            raise NotImplementedError("No such open list is supported.")
+        self.open_list = open_list
+
+        # Assign the cache of the optimal solutions.
+        self.cache = cache
         
         # Create a Puzzle State Object with the inputs for Solver.
         initial_state = tuple(map(int, initial_state))
-        size = int(math.sqrt(len(initial_state)))
         self.puzzle_state = PuzzleState(initial_state, size, goal, self.calculate_total_cost)
 
 
@@ -53,18 +134,11 @@ class PuzzleSolver(object):
             Args:
                 algorithm: this is the search algorithm.
         """
-        if(algorithm == 'BFS'): 
-            self.search_alg = BFS
-        elif(algorithm == 'DFS'):
-            self.search_alg = DFS
-        elif(algorithm == 'A*'):
-            self.search_alg = A_STAR
-        elif(algorithm == 'IDA*'):
-            self.search_alg = IDA_STAR
-        elif(algorithm == 'BA*'):
-            self.search_alg = BA_STAR
-        else:
+        if algorithm not in SEARCH_FUNCTIONS:
             raise NotImplementedError("No such algorithm is supported.")
+        module, function = SEARCH_FUNCTIONS[algorithm]
+        self.search_alg = getattr(importlib.import_module(module), function)
+        self.algorithm = algorithm
 
 
 
@@ -80,25 +154,49 @@ class PuzzleSolver(object):
                 NotImplementedError: if the heuristic is not supported.
                 AttributeError: if the heuristic is not provided in case of using A* Search.
         """
-        if(heuristic == None and (algorithm == 'A*' or algorithm == 'IDA*' or algorithm == 'BA*')):
+        self.heuristic_name = heuristic
+        if(heuristic == None and algorithm in INFORMED_ALGORITHMS):
             raise AttributeError("Required Attribute `heuristic` in case of useing A* Search.")
+
+        elif(algorithm == 'BatchA*' and heuristic not in BATCH_HEURISTICS):
+            raise NotImplementedError("No such Heuristic is supported.")
         
         elif(heuristic == 'manhattan_distance'):
             self.dist_metric = manhattan_distance
+            self.heuristic = manhattan_distance_state
+            self.heuristic_delta = manhattan_distance_delta
         
         elif(heuristic == 'euclidean_distance'):
             self.dist_metric = eculidean_distance
+            self.heuristic = euclidean_distance_state
+            self.heuristic_delta = euclidean_distance_delta
         
         elif(heuristic == 'linear_conflict'):
             self.dist_metric = linear_conflict_single
+            self.heuristic = linear_conflict_single
+            self.heuristic_delta = linear_conflict_delta
         
         elif(heuristic == 'misplaced_tiles'):
             self.dist_metric = misplaced_tiles
+            self.heuristic = misplaced_tiles
+            self.heuristic_delta = misplaced_tiles_delta
         
         elif(heuristic == 'linear_manhattan_conflict'):
             self.dist_metric = linear_manhattan_conflict
+            self.heuristic = linear_manhattan_conflict
+            self.heuristic_delta = linear_manhattan_conflict_delta
+        
+        elif(heuristic == 'pattern_database'):
+            self.dist_metric = pattern_database
+            self.heuristic = pattern_database
+            self.heuristic_delta = pattern_database_delta
+
+        elif(heuristic == 'walking_distance'):
+            self.dist_metric = walking_distance
+            self.heuristic = walking_distance
+            self.heuristic_delta = walking_distance_delta
             
-        elif(heuristic == None and algorithm != 'A*' and algorithm != 'IDA*' and algorithm != 'BA*'):
+        elif(heuristic == None and algorithm not in INFORMED_ALGORITHMS):
             pass
         
         else:
@@ -106,25 +204,31 @@ class PuzzleSolver(object):
  
  
     
-    def calculate_total_cost(self, state):
+    def calculate_total_cost(self, state, heuristic=None):
         """
             Calculate the total estimated cost of a state.
+            The result is cached on the state as f. The heuristic is evaluated from scratch only
+            when the state does not carry it yet, the search algorithms fill it incrementally through heuristic_delta.
         
             Args:
                 state: this is the state of the puzzle.
+                heuristic: this is the heuristic function. Defaults to the one of the solver.
         """
-        sum_heuristic = 0
-        if self.dist_metric == manhattan_distance or self.dist_metric == eculidean_distance:
-            for i, item in enumerate(state.config):
-                current_row = i // state.n
-                current_col = i % state.n
-                goal_idx = state.goal.index(item)
-                goal_row = goal_idx // state.n
-                goal_col = goal_idx % state.n
-                sum_heuristic += self.dist_metric(current_row,current_col,goal_row,goal_col)
-        else:
-            sum_heuristic = self.dist_metric(state)
-        return sum_heuristic + state.cost
+        if state.f is None:
+            if state.h is None:
+                state.h = (heuristic or self.heuristic)(state)
+            state.f = state.h + state.cost
+        return state.f
+
+
+
+    def goal_state(self):
+        """
+            It returns the root of the backward search of the bidirectional algorithms: the goal
+            configuration, whose goal is the initial configuration.
+        """
+        goal = tuple(map(int, self.puzzle_state.goal))
+        return PuzzleState(goal, self.puzzle_state.n, self.puzzle_state.config, self.calculate_total_cost)
 
 
 
@@ -189,12 +293,102 @@ class PuzzleSolver(object):
 
 
 
+    def is_optimal(self):
+        """ It returns True if the search algorithm finds optimal solutions with the heuristic. """
+        if self.algorithm in OPTIMAL_ALGORITHMS:
+            return True
+        return self.algorithm in OPTIMAL_INFORMED_ALGORITHMS and self.heuristic_name in ADMISSIBLE_HEURISTICS
+
+
+
+    def backward_heuristic(self):
+        """
+            It returns the (heuristic, heuristic_delta) pair of the backward search of BA*, whose goal is the initial
+            board: None to use the heuristic of the solver. A pattern database is only used forward, since the one
+            of the initial board would be built for this puzzle alone; the backward search uses the walking distance
+            instead, or the linear conflict + Manhattan distance on the boards too big for it.
+        """
+        if self.heuristic_name != 'pattern_database':
+            return None
+        if self.puzzle_state.n <= WALKING_DISTANCE_MAX_SIZE:
+            heuristic, heuristic_delta = walking_distance, walking_distance_delta
+        else:
+            heuristic, heuristic_delta = linear_manhattan_conflict, linear_manhattan_conflict_delta
+        return (lambda state: self.calculate_total_cost(state, heuristic)), heuristic_delta
+
+
+
+    def search(self):
+        """
+            It runs the search algorithm, unless the analysis of the puzzle or the solution cache already answers.
+            With a cache, A* and IDA* stop at the first cached state they reach and the path is completed with
+            its cached solution, and the optimal solutions found are stored in the cache.
+
+            Returns:
+                tuple: the final state, the number of nodes expanded and the maximum search depth,
+                    None if the puzzle cannot be solved.
+        """
+        # Skip the search for the puzzles the analysis already answers.
+        logging.info(f"Analysis: {self.analysis.features()}")
+        if not self.analysis.solvable:
+            return None
+        
+        # Run the search algorithm.
+        progress = get_progress()
+        if progress is not None:
+            progress.start(self.algorithm)
+        n = self.puzzle_state.n
+        goal = self.puzzle_state.goal
+        cached = self.cache.lookup(self.puzzle_state.config, goal, n) if self.cache is not None and not self.analysis.solved else None
+        shortcuts = None
+        if self.cache is not None and cached is None and not self.analysis.solved and self.algorithm in SHORTCUT_ALGORITHMS:
+            shortcuts = self.cache.shortcuts(goal, n)
+        if self.analysis.solved:
+            results = (self.puzzle_state, 0, 0)
+        elif cached is not None:
+            logging.info(f"Solution cache: {len(cached)} moves")
+            results = (replay(self.puzzle_state, cached), 0, 0)
+        elif(self.algorithm == 'A*'):
+            results = self.search_alg(self.puzzle_state, self.calculate_total_cost, self.heuristic_delta, self.tie_breaking, self.open_list, shortcuts)
+        elif(self.algorithm == 'IDA*'):
+            results = self.search_alg(self.puzzle_state, self.calculate_total_cost, self.heuristic_delta, shortcuts)
+        elif(self.algorithm == 'PIDA*'):
+            results = self.search_alg(self.puzzle_state, self.calculate_total_cost, self.heuristic_delta)
+        elif(self.algorithm == 'BA*'):
+            results = self.search_alg(self.puzzle_state, self.goal_state(), self.calculate_total_cost, self.heuristic_delta, self.tie_breaking,
+                                      self.backward_heuristic())
+        elif(self.algorithm == 'BiBFS'):
+            results = self.search_alg(self.puzzle_state, self.goal_state())
+        elif(self.algorithm == 'BatchA*'):
+            results = self.search_alg(self.puzzle_state, self.heuristic_name)
+        else: 
+            results = self.search_alg(self.puzzle_state)
+        if shortcuts is not None and results is not None and not results[0].is_goal():
+            # The search stopped at a cached state, the rest of the path is its cached solution.
+            final_state, nodes_expanded, max_search_depth = results
+            rest = self.cache.lookup(final_state.config, goal, n)
+            if rest is None:
+                # It has been evicted in the meantime.
+                if self.algorithm == 'A*':
+                    results = self.search_alg(self.puzzle_state, self.calculate_total_cost, self.heuristic_delta, self.tie_breaking, self.open_list)
+                else:
+                    results = self.search_alg(self.puzzle_state, self.calculate_total_cost, self.heuristic_delta)
+            else:
+                results = (replay(final_state, rest), nodes_expanded, max_search_depth)
+        if self.cache is not None and results is not None and cached is None and not self.analysis.solved and self.is_optimal():
+            self.cache.store(self.puzzle_state.config, goal, n, path_actions(results[0]))
+        if progress is not None:
+            progress.finish(results[1] if results is not None else None)
+        return results
+
+
+
     def solve(self):
         """
             It solves the puzzle using the search algorithm and the heuristic algorithm.
             
             Returns:
-                list: path to reach the goal state.
+                list: path to reach the goal state, None if the puzzle cannot be solved.
         """
         # Start the timer.
         start_time = time.time()
@@ -203,15 +397,7 @@ class PuzzleSolver(object):
         mem_init = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
         
         # Run the search algorithm.
-        if(self.search_alg == A_STAR):
-            results = A_STAR(self.puzzle_state, self.calculate_total_cost)
-        elif(self.search_alg == IDA_STAR):
-            results = IDA_STAR(self.puzzle_state, self.calculate_total_cost)
-        elif(self.search_alg == BA_STAR):
-            goal_state = PuzzleState(tuple(map(int, self.puzzle_state.goal)), self.puzzle_state.n, self.puzzle_state.config, self.calculate_total_cost)
-            results = BA_STAR(self.puzzle_state, goal_state, self.calculate_total_cost)
-        else: 
-            results = self.search_alg(self.puzzle_state)
+        results = self.search()
         
         # Get the final time.
         running_time = time.time() - start_time
@@ -219,7 +405,10 @@ class PuzzleSolver(object):
         # Get the final memory usage.
         mem_final = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
         ram_usage = (mem_final - mem_init) / 1024
+        if results is None:
+            if not self.analysis.solvable:
+                print("The puzzle is not solvable: the parity of its permutation does not match the goal.\n")
+            return None
         
         # Return the path to reach the goal state.
         return self.writeOutput(results, running_time, ram_usage)
- 
\ No newline at end of file
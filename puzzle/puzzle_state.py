@@ -3,16 +3,59 @@
 # date: 2023-01-18
 # tags: python, puzzle, puzzle_state, puzzle_solver
 
-import time
-import resource
-import sys
-import math
 import logging
 
+
+
+def tile_bits(n):
+    """
+        It returns the number of bits used to store a single tile of a n x n board.
+        Boards up to 4x4 use 4 bits per tile, bigger boards use the smallest width that fits n*n-1.
+
+        Args:
+            n: this is the dimension of the puzzle.
+    """
+    return 4 if n <= 4 else (n * n - 1).bit_length()
+
+
+
+def pack_config(config, n):
+    """
+        It packs a board configuration into a single integer. The tile at position i
+        is stored in the bit field [i*bits, (i+1)*bits).
+
+        Args:
+            config: this is the configuration of the puzzle.
+            n: this is the dimension of the puzzle.
+    """
+    bits = tile_bits(n)
+    packed = 0
+    for i, item in enumerate(config):
+        packed |= int(item) << (i * bits)
+    return packed
+
+
+
+def unpack_config(packed, n):
+    """
+        It unpacks an integer produced by pack_config into a configuration tuple.
+
+        Args:
+            packed: this is the packed configuration of the puzzle.
+            n: this is the dimension of the puzzle.
+    """
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    return tuple((packed >> (i * bits)) & mask for i in range(n * n))
+
+
+
 class PuzzleState(object):
 
+    __slots__ = ('packed', 'blank', 'n', 'cost', 'h', 'f', 'parent', 'action', 'goal', 'goal_packed', 'cost_function')
+
     def __init__(self, config, n, goal, cost_function, parent=None, action="Initial", cost=0):
-        """ 
+        """
             The constructor of the PuzzleState class.
 
             Args:
@@ -23,7 +66,7 @@ class PuzzleState(object):
                 parent: this is the parent of the current state. Defaults to None.
                 action: this is the action that led to the current state. Defaults to "Initial".
                 cost: this is the cost of the current state. Defaults to 0.
-                
+
             Raises:
                 AttributeError: if the length of config is not correct or less than required.
         """
@@ -32,158 +75,243 @@ class PuzzleState(object):
 
         self.n = n
         self.cost = cost
+        self.h = None
+        self.f = None
         self.parent = parent
         self.action = action
-        self.dimension = n
-        self.config = config
-        self.children = []
+        self.packed = pack_config(config, n)
+        self.blank = list(config).index(0)
         self.goal = goal
+        self.goal_packed = pack_config(goal, n)
         self.cost_function = cost_function
 
-        for i, item in enumerate(self.config):
-            if item == 0:
-                self.blank_row = i // self.n
-                self.blank_col = i % self.n
-                break
+
+
+    @property
+    def config(self):
+        """ It returns the configuration of the puzzle as a tuple. """
+        return unpack_config(self.packed, self.n)
+
+
+
+    @property
+    def dimension(self):
+        """ It returns the dimension of the puzzle. """
+        return self.n
+
+
+
+    @property
+    def blank_row(self):
+        """ It returns the row of the blank tile. """
+        return self.blank // self.n
+
+
+
+    @property
+    def blank_col(self):
+        """ It returns the column of the blank tile. """
+        return self.blank % self.n
 
 
 
     def get_blank_tile(self):
         """ It returns the position of the blank tile. """
-        for i, item in enumerate(self.config):
-            if item == 0:
-                self.blank_row = i // self.n
-                self.blank_col = i % self.n
-                break
-        return self.blank_row, self.blank_col, i
+        return self.blank // self.n, self.blank % self.n, self.blank
+
+
+
+    def tile_at(self, index):
+        """ It returns the tile stored at the given position of the board. """
+        bits = tile_bits(self.n)
+        return (self.packed >> (index * bits)) & ((1 << bits) - 1)
 
 
 
     def display_log(self):
         """ It displays the current state of the puzzle. """
+        config = self.config
         for i in range(self.n):
-            line = []
-            offset = i * self.n
-            for j in range(self.n):
-                line.append(self.config[offset + j])
-            logging.info(line)
-    
-    
-    
+            logging.info(list(config[i * self.n:(i + 1) * self.n]))
+
+
+
     def display(self, log):
         """ It displays the current state of the puzzle. """
+        config = self.config
         for i in range(self.n):
-            line = []
-            offset = i * self.n
-            for j in range(self.n):
-                line.append(self.config[offset + j])
-            log += line.__str__() + "\n"
+            log += list(config[i * self.n:(i + 1) * self.n]).__str__() + "\n"
         return log
 
 
 
+    def slide(self, target, action):
+        """
+            It moves the blank tile to the target position without checking that the move is legal.
+
+            Args:
+                target: this is the index the blank tile moves to.
+                action: this is the name of the move.
+
+            Returns:
+                PuzzleState: the child state.
+        """
+        bits = tile_bits(self.n)
+        tile = (self.packed >> (target * bits)) & ((1 << bits) - 1)
+        child = PuzzleState.__new__(PuzzleState)
+        child.packed = self.packed ^ (tile << (target * bits)) ^ (tile << (self.blank * bits))
+        child.blank = target
+        child.n = self.n
+        child.cost = self.cost + 1
+        child.h = None
+        child.f = None
+        child.parent = self
+        child.action = action
+        child.goal = self.goal
+        child.goal_packed = self.goal_packed
+        child.cost_function = self.cost_function
+        return child
+
+
+
     def move_left(self):
         """ It moves the blank tile to the left. If it is not possible, it returns None."""
-        if self.blank_col == 0:
+        if self.blank % self.n == 0:
             return None
-        else:
-            blank_index = self.blank_row * self.n + self.blank_col
-            target = blank_index - 1
-            new_config = list(self.config)
-            new_config[blank_index], new_config[target] = new_config[target], new_config[blank_index]
-            return PuzzleState(tuple(new_config), self.n, self.goal, self.cost_function, parent=self, action="Left", cost=self.cost + 1)
+        return self.slide(self.blank - 1, "Left")
 
 
 
     def move_right(self):
         """ It moves the blank tile to the right. If it is not possible, it returns None. """
-        if self.blank_col == self.n - 1:
+        if self.blank % self.n == self.n - 1:
             return None
-        else:
-            blank_index = self.blank_row * self.n + self.blank_col
-            target = blank_index + 1
-            new_config = list(self.config)
-            new_config[blank_index], new_config[target] = new_config[target], new_config[blank_index]
-            return PuzzleState(tuple(new_config), self.n, self.goal, self.cost_function, parent=self, action="Right", cost=self.cost + 1)
+        return self.slide(self.blank + 1, "Right")
 
 
 
     def move_up(self):
         """ It moves the blank tile up. If it is not possible, it returns None. """
-        if self.blank_row == 0:
+        if self.blank < self.n:
             return None
-        else:
-            blank_index = self.blank_row * self.n + self.blank_col
-            target = blank_index - self.n
-            new_config = list(self.config)
-            new_config[blank_index], new_config[target] = new_config[target], new_config[blank_index]
-            return PuzzleState(tuple(new_config), self.n, self.goal, self.cost_function, parent=self, action="Up", cost=self.cost + 1)
+        return self.slide(self.blank - self.n, "Up")
 
 
 
     def move_down(self):
         """ It moves the blank tile down. If it is not possible, it returns None. """
-        if self.blank_row == self.n - 1:
+        if self.blank >= self.n * (self.n - 1):
             return None
-        else:
-            blank_index = self.blank_row * self.n + self.blank_col
-            target = blank_index + self.n
-            new_config = list(self.config)
-            new_config[blank_index], new_config[target] = new_config[target], new_config[blank_index]
-            return PuzzleState(tuple(new_config), self.n, self.goal, self.cost_function, parent=self, action="Down", cost=self.cost + 1)
+        return self.slide(self.blank + self.n, "Down")
 
 
 
     def expand(self, RLDU=True):
         """
-            It expands the node by adding all possible children to the list of children.
-            
+            It expands the node and returns the list of all possible children.
+            The children are not cached on the node, so they can be released as soon as the caller drops them.
+
             Args:
                 RLDU: this is the order of the children. Defaults to True.
         """
-        if len(self.children) == 0:
-            if RLDU:  #RLDU    
-                right_child = self.move_right()
-                if right_child is not None:
-                    self.children.append(right_child)
-                left_child = self.move_left()
-                if left_child is not None:
-                    self.children.append(left_child)
-                down_child = self.move_down()
-                if down_child is not None:
-                    self.children.append(down_child)
-                up_child = self.move_up()
-                if up_child is not None:
-                    self.children.append(up_child)
-            else: #UDLR
-                up_child = self.move_up()
-                if up_child is not None:
-                    self.children.append(up_child)
-                down_child = self.move_down()
-                if down_child is not None:
-                    self.children.append(down_child)
-                left_child = self.move_left()
-                if left_child is not None:
-                    self.children.append(left_child)
-                right_child = self.move_right()
-                if right_child is not None:
-                    self.children.append(right_child)        
-        return self.children
-                
+        if RLDU:  #RLDU
+            moves = (self.move_right, self.move_left, self.move_down, self.move_up)
+        else: #UDLR
+            moves = (self.move_up, self.move_down, self.move_left, self.move_right)
+        children = []
+        for move in moves:
+            child = move()
+            if child is not None:
+                children.append(child)
+        return children
+
 
 
     def is_goal(self):
         """ It checks if the current state is the goal state. """
-        return list(self.config) == self.goal
+        return self.packed == self.goal_packed
+
+
+
+    def __hash__(self):
+        """ It hashes the state by its packed board. """
+        return hash(self.packed)
+
+
+
+    def __eq__(self, other):
+        """ Two states are equal when they hold the same board. """
+        return isinstance(other, PuzzleState) and self.packed == other.packed
 
 
 
     def __lt__(self, other):
-        """ It compares the cost of two states. Ti is the overloaded less than operator. """
-        return self.cost_function(self) < self.cost_function(other)
+        """ It compares the cached total cost f of two states. Ti is the overloaded less than operator. """
+        return self.f < other.f
 
 
 
     def __le__(self, other):
-        """ It compares the cost of two states. It is the overloaded less than or equal operator. """
-        return self.cost_function(self) <= self.cost_function(other)
\ No newline at end of file
+        """ It compares the cached total cost f of two states. It is the overloaded less than or equal operator. """
+        return self.f <= other.f
+
+
+
+class MutableBoard(object):
+    """
+        A single board that is modified in place by slide. It exposes the attributes of PuzzleState
+        read by the heuristics (n, blank, goal, goal_packed, config and tile_at), so the *_delta
+        functions of utils.distance_metrics can be evaluated on it without allocating a state per move.
+    """
+
+    __slots__ = ('board', 'packed', 'blank', 'n', 'bits', 'goal', 'goal_packed')
+
+    def __init__(self, state):
+        """
+            The constructor of the MutableBoard class.
+
+            Args:
+                state: this is the PuzzleState the board starts from.
+        """
+        self.board = list(state.config)
+        self.packed = state.packed
+        self.blank = state.blank
+        self.n = state.n
+        self.bits = tile_bits(state.n)
+        self.goal = state.goal
+        self.goal_packed = state.goal_packed
+
+
+
+    @property
+    def config(self):
+        """ It returns the configuration of the puzzle, the list is modified by the following moves. """
+        return self.board
+
+
+
+    def tile_at(self, index):
+        """ It returns the tile stored at the given position of the board. """
+        return self.board[index]
+
+
+
+    def slide(self, target):
+        """
+            It moves the blank tile to the target position in place. Undoing a move is sliding the blank back.
+
+            Args:
+                target: this is the index the blank tile moves to.
+        """
+        board = self.board
+        tile = board[target]
+        board[self.blank] = tile
+        board[target] = 0
+        self.packed ^= (tile << (target * self.bits)) ^ (tile << (self.blank * self.bits))
+        self.blank = target
+
+
+
+    def is_goal(self):
+        """ It checks if the current board is the goal state. """
+        return self.packed == self.goal_packed
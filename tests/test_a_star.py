@@ -0,0 +1,22 @@
+import unittest
+from puzzle.puzzle_solver import PuzzleSolver
+
+GOAL = [1, 2, 3, 4, 5, 6, 7, 8, 0]
+
+
+
+class AStarTest(unittest.TestCase):
+
+    def test_pattern_database_is_optimal(self):
+        # The pattern database is admissible but not consistent: without reopening the explored states A* found 23 moves.
+        config = [4, 5, 6, 3, 8, 0, 1, 2, 7]
+        cost = PuzzleSolver(config, GOAL, 'IDA*', 'linear_manhattan_conflict').search()[0].cost
+        for open_list in ('heap', 'bucket'):
+            solver = PuzzleSolver(config, GOAL, 'A*', 'pattern_database', open_list=open_list)
+            self.assertTrue(solver.is_optimal())
+            self.assertEqual(solver.search()[0].cost, cost)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+import utils.BA_STAR
+from puzzle.puzzle_solver import PuzzleSolver
+from utils.priority_queue import IndexedPriorityQueue
+
+GOAL = [1, 2, 3, 4, 5, 6, 7, 8, 0]
+
+
+
+class ReopeningQueue(IndexedPriorityQueue):
+    """ It counts the states appended again to the frontier they have been popped from. """
+
+    reopened = 0
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.popped = set()
+
+    def pop(self):
+        state = super().pop()
+        self.popped.add(state.packed)
+        return state
+
+    def append(self, state):
+        if state.packed in self.popped:
+            ReopeningQueue.reopened += 1
+        super().append(state)
+
+
+
+class BAStarTest(unittest.TestCase):
+
+    def optimal_cost(self, config):
+        return PuzzleSolver(config, GOAL, 'BiBFS').search()[0].cost
+
+
+
+    def test_costs_match_bibfs(self):
+        for config in ([1, 2, 3, 4, 5, 6, 0, 7, 8], [8, 6, 7, 2, 5, 4, 3, 0, 1], [4, 5, 6, 3, 8, 0, 1, 2, 7], [7, 5, 2, 4, 0, 3, 8, 1, 6]):
+            for heuristic in ('linear_manhattan_conflict', 'walking_distance', 'pattern_database'):
+                final_state = PuzzleSolver(config, GOAL, 'BA*', heuristic).search()[0]
+                self.assertTrue(final_state.is_goal())
+                self.assertEqual(final_state.cost, self.optimal_cost(config))
+
+
+
+    def test_reopened_states_keep_the_cost_optimal(self):
+        # The pattern database is not consistent: states explored by the forward search are reached again with a lower g.
+        config = [6, 1, 5, 0, 8, 3, 2, 7, 4]
+        ReopeningQueue.reopened = 0
+        with mock.patch.object(utils.BA_STAR, 'IndexedPriorityQueue', ReopeningQueue):
+            final_state = PuzzleSolver(config, GOAL, 'BA*', 'pattern_database').search()[0]
+        self.assertGreater(ReopeningQueue.reopened, 0)
+        self.assertEqual(final_state.cost, self.optimal_cost(config))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
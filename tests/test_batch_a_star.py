@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from puzzle.puzzle_state import PuzzleState
+from puzzle.puzzle_solver import PuzzleSolver, path_actions
+from utils.BATCH_A_STAR import BATCH_A_STAR
+from utils.solution_cache import SolutionCache
+
+GOAL = [1, 2, 3, 4, 5, 6, 7, 8, 0]
+
+
+
+class BatchAStarTest(unittest.TestCase):
+
+    def optimal_cost(self, config):
+        return PuzzleSolver(config, GOAL, 'IDA*', 'linear_manhattan_conflict').search()[0].cost
+
+
+
+    def test_goal_waits_for_the_lower_f_nodes_of_its_batch(self):
+        # The goal used to be returned as soon as it was popped, before the nodes of its batch with a lower f were expanded.
+        for config, batch_size in (([1, 2, 6, 3, 0, 5, 4, 7, 8], 5), ([7, 1, 6, 5, 3, 0, 2, 4, 8], 5),
+                                   ([7, 5, 2, 4, 0, 3, 8, 1, 6], 5), ([7, 5, 2, 4, 0, 3, 8, 1, 6], 9)):
+            state = PuzzleState(config, 3, GOAL, None)
+            final_state, _, _ = BATCH_A_STAR(state, 'linear_manhattan_conflict', batch_size)
+            self.assertTrue(final_state.is_goal())
+            self.assertEqual(final_state.cost, self.optimal_cost(config))
+
+
+
+    def test_every_batch_size_is_optimal(self):
+        config = [8, 6, 7, 2, 5, 4, 3, 0, 1]
+        cost = self.optimal_cost(config)
+        for batch_size in (1, 2, 5, 9, 128):
+            final_state, _, _ = BATCH_A_STAR(PuzzleState(config, 3, GOAL, None), 'linear_manhattan_conflict', batch_size)
+            self.assertEqual(final_state.cost, cost)
+
+    def test_solutions_are_cached(self):
+        config = [8, 6, 7, 2, 5, 4, 3, 0, 1]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SolutionCache(os.path.join(directory, "solutions.sqlite"))
+            solver = PuzzleSolver(config, GOAL, 'BatchA*', 'linear_manhattan_conflict', cache=cache)
+            self.assertTrue(solver.is_optimal())
+            final_state = solver.search()[0]
+            self.assertEqual(cache.lookup(config, GOAL, 3), path_actions(final_state))
+            cache.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
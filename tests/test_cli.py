@@ -0,0 +1,24 @@
+import unittest
+from cli import read_puzzles
+
+
+
+class ReadPuzzlesTest(unittest.TestCase):
+
+    def test_auto_reads_a_grid_of_nine_tile_rows(self):
+        # The first row of a 9x9 grid used to be read as a whole 8-puzzle.
+        tiles = list(range(1, 81)) + [0]
+        lines = [" ".join(str(tile) for tile in tiles[i:i + 9]) for i in range(0, 81, 9)]
+        self.assertEqual(list(read_puzzles(lines)), [(1, tiles, None)])
+
+
+
+    def test_auto_reads_consecutive_whole_puzzles(self):
+        lines = ["1 2 3 4 5 6 0 7 8", "1,2,3,4,5,6,7,0,8", "", "1 2 3", "4 5 6", "7 8 0"]
+        self.assertEqual(list(read_puzzles(lines)), [(1, [1, 2, 3, 4, 5, 6, 0, 7, 8], None), (2, [1, 2, 3, 4, 5, 6, 7, 0, 8], None),
+                                                     (4, [1, 2, 3, 4, 5, 6, 7, 8, 0], None)])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
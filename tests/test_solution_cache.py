@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from puzzle.puzzle_state import PuzzleState, pack_config
+from puzzle.puzzle_solver import PuzzleSolver, path_actions
+from utils.IDA_STAR import replay
+from utils.solution_cache import SolutionCache, reflect
+
+GOAL = [1, 2, 3, 4, 5, 6, 7, 8, 0]
+CONFIG = [8, 6, 7, 2, 5, 4, 3, 0, 1]
+
+
+
+class SolutionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SolutionCache(os.path.join(self.directory.name, "solutions.sqlite"))
+        self.actions = path_actions(PuzzleSolver(CONFIG, GOAL, 'BiBFS').search()[0])
+
+
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+
+
+    def solves(self, config, actions):
+        return replay(PuzzleState(config, 3, GOAL, None), actions).is_goal()
+
+
+
+    def test_reflected_board_reads_the_reflected_path(self):
+        self.cache.store(CONFIG, GOAL, 3, self.actions)
+        self.assertEqual(self.cache.lookup(CONFIG, GOAL, 3), self.actions)
+        reflected = list(reflect(CONFIG, GOAL, 3))
+        self.assertNotEqual(reflected, CONFIG)
+        actions = self.cache.lookup(reflected, GOAL, 3)
+        self.assertEqual(len(actions), len(self.actions))
+        self.assertTrue(self.solves(reflected, actions))
+
+
+
+    def test_suffix_states_are_stored(self):
+        self.cache.store(CONFIG, GOAL, 3, self.actions)
+        state = PuzzleState(CONFIG, 3, GOAL, None)
+        for i in range(1, len(self.actions)):
+            state = replay(state, self.actions[i - 1:i])
+            self.assertEqual(self.cache.lookup(list(state.config), GOAL, 3), self.actions[i:])
+
+
+
+    def test_eviction_keeps_max_entries(self):
+        self.cache.max_entries = 5
+        self.cache.store(CONFIG, GOAL, 3, self.actions)
+        count = self.cache.connect().execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        self.assertEqual(count, 5)
+        # The newest entries are kept: the states closest to the goal, written last.
+        self.assertIsNone(self.cache.lookup(CONFIG, GOAL, 3))
+        self.assertEqual(self.cache.lookup(list(replay(PuzzleState(CONFIG, 3, GOAL, None), self.actions[:-1]).config), GOAL, 3),
+                         self.actions[-1:])
+
+
+
+    def test_shortcuts_are_loaded_incrementally(self):
+        self.assertEqual(self.cache.shortcuts(GOAL, 3), {})
+        self.cache.store(CONFIG, GOAL, 3, self.actions)
+        distances = self.cache.shortcuts(GOAL, 3)
+        self.assertEqual(distances[pack_config(CONFIG, 3)], len(self.actions))
+        self.assertEqual(distances[pack_config(reflect(CONFIG, GOAL, 3), 3)], len(self.actions))
+        other = [1, 2, 3, 4, 5, 6, 0, 7, 8]
+        self.cache.store(other, GOAL, 3, ["Right", "Right"])
+        self.assertIs(self.cache.shortcuts(GOAL, 3), distances)
+        self.assertEqual(distances[pack_config(other, 3)], 2)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import random
+import unittest
+from puzzle.puzzle_state import PuzzleState, pack_config
+from utils.state_table import PackedTable, StateTable
+
+
+
+class PackedTableTest(unittest.TestCase):
+
+    def test_insert_lookup_and_update_across_resizes(self):
+        table = PackedTable(8)
+        rng = random.Random(0)
+        keys = list({rng.getrandbits(64) | 1 for _ in range(1000)})
+        for i, key in enumerate(keys):
+            table[key] = i
+        self.assertEqual(len(table), len(keys))
+        self.assertGreater(len(table.keys), 8)
+        for i, key in enumerate(keys):
+            table[key] = 2 * i
+        self.assertEqual(len(table), len(keys))
+        self.assertTrue(all(table.get(key) == 2 * i and key in table for i, key in enumerate(keys)))
+        self.assertIsNone(table.get(12345))
+        self.assertNotIn(12345, table)
+
+
+
+    def test_key_zero_is_not_a_board(self):
+        # The key 0 marks the empty slots: no board packs to it and the table refuses it.
+        for n in (2, 3, 4):
+            goal = list(range(1, n * n)) + [0]
+            self.assertNotEqual(pack_config([0] + goal[:-1], n), 0)
+            self.assertNotEqual(pack_config(goal, n), 0)
+        table = PackedTable(8)
+        self.assertRaises(ValueError, table.__setitem__, 0, 1)
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.get(0))
+
+
+
+class StateTableTest(unittest.TestCase):
+
+    def walk(self, n, length):
+        # A random walk that never goes back to a state, recorded in a StateTable.
+        rng = random.Random(n)
+        goal = list(range(1, n * n)) + [0]
+        state = PuzzleState(goal, n, goal, None)
+        table = StateTable(n)
+        table.put(state.packed, 0)
+        actions = []
+        while len(actions) < length:
+            children = [child for child in state.expand() if child.packed not in table]
+            if not children:
+                break
+            state = rng.choice(children)
+            table.put(state.packed, state.cost, state.action)
+            actions.append(state.action)
+        return table, state, actions
+
+
+
+    def test_path_is_rebuilt_from_the_moves(self):
+        for n in (3, 4, 5):
+            table, state, actions = self.walk(n, 60)
+            self.assertIsInstance(table.table, PackedTable if n <= 4 else dict)
+            self.assertEqual(table.cost(state.packed), len(actions))
+            self.assertEqual(table.path(state.packed, state.blank, state.cost), actions)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
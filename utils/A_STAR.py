@@ -3,45 +3,62 @@
 # date: 2023-01-18
 # tags: python, A*, search, algorithm
 
-import logging
-from tqdm import tqdm
-from utils.priority_queue import PriorityQueue
+from utils.priority_queue import OPEN_LISTS
+from utils.state_table import StateTable
+from utils.IDA_STAR import replay
+from utils.tracing import get_tracer
+from utils.progress import get_progress
 
-def A_STAR(initial_state,heuristic):
-    """A * search"""
-    frontier = PriorityQueue('min',heuristic)
+def A_STAR(initial_state, heuristic, heuristic_delta, tie_breaking='deepest', open_list='heap', shortcuts=None):
+    """A * search, the heuristic of each child is derived from its parent through heuristic_delta
+    and nodes with the same f are ordered by tie_breaking. The frontier is the open_list
+    implementation of OPEN_LISTS ('heap' or 'bucket'). shortcuts maps packed states to their exact
+    distance from the goal (see utils.solution_cache): their h is the exact distance and the search
+    stops at the first of them it pops, returning it instead of the goal.
+    Every state reached is recorded with its cost and last move in a StateTable, so the states of the
+    frontier do not keep their parents and the path is rebuilt from the table at the end.
+    An explored state reached again by a shorter path is reopened, so the solution is optimal with any
+    admissible heuristic."""
+    frontier = OPEN_LISTS[open_list]('min', heuristic, tie_breaking)
     frontier.append(initial_state)
-    frontier_config = {}
-    frontier_config[tuple(initial_state.config)] = True
-    explored = set()
+    table = StateTable(initial_state.n)
+    table.put(initial_state.packed, 0)
     nodes_expanded = 0
     max_search_depth = 0
-    log = ""
+    tracer = get_tracer()
+    progress = get_progress()
+    report = progress.every if progress is not None else float("inf")
+    trace = tracer.start("A*", initial_state) if tracer is not None else None
 
-    def generator():
-        while frontier:
-            yield
-
-    for _ in tqdm(generator()):
+    while frontier:
         state = frontier.pop()
-        log += "****** State ******\n"
-        log = state.display(log)
-        explored.add(state)
-        if state.is_goal():
-            logging.info(log)
-            return (state, nodes_expanded, max_search_depth)
+        if trace is not None:
+            trace(state.packed, state.cost, state.h)
+        if state.is_goal() or (shortcuts is not None and state.packed in shortcuts):
+            actions = table.path(state.packed, state.blank, state.cost)
+            return (replay(initial_state, actions), nodes_expanded, max_search_depth)
 
         nodes_expanded += 1
+        if nodes_expanded >= report:
+            report = progress.update(nodes_expanded, len(frontier), len(table) - len(frontier), state.f)
         for neigbhor in state.expand(RLDU= False):
-            if neigbhor not in explored and tuple(neigbhor.config) not in frontier_config:
+            neigbhor.parent = None
+            neigbhor.h = state.h + heuristic_delta(state, neigbhor.blank)
+            if shortcuts is not None and neigbhor.packed in shortcuts:
+                neigbhor.h = shortcuts[neigbhor.packed]
+            cost = table.cost(neigbhor.packed)
+            if cost is None:
                 frontier.append(neigbhor)
-                frontier_config[tuple(neigbhor.config)] = True
+                table.put(neigbhor.packed, neigbhor.cost, neigbhor.action)
                 if neigbhor.cost > max_search_depth:
                     max_search_depth = neigbhor.cost
-            elif neigbhor in frontier:
-                if heuristic(neigbhor) < frontier[neigbhor]:
-                    frontier.__delitem__(neigbhor)
+            elif neigbhor.cost < cost:
+                # A shorter path to a state already reached: it is moved up in the frontier, or reopened if it has
+                # been explored, which keeps the search optimal with the heuristics that are admissible but not consistent.
+                if neigbhor in frontier:
+                    frontier.decrease_key(neigbhor)
+                else:
                     frontier.append(neigbhor)
+                table.put(neigbhor.packed, neigbhor.cost, neigbhor.action)
     
-    logging.info(log)
     return None
\ No newline at end of file
@@ -0,0 +1,230 @@
+# description: Batched A* search algorithm with vectorized heuristics
+# author: Seminara Luigi
+# date: 2023-02-23
+# tags: python, A*, batch, numpy, vectorized, search, algorithm
+
+import heapq
+import numpy as np
+from puzzle.puzzle_state import pack_config
+from utils.distance_metrics import get_distance_tables
+from utils.state_table import MOVES, move_offsets
+from utils.IDA_STAR import replay
+from utils.tracing import get_tracer
+from utils.progress import get_progress
+
+# Number of nodes popped from the open list and expanded together.
+DEFAULT_BATCH_SIZE = 128
+
+# The vectorized heuristics (puzzle.puzzle_solver.BATCH_HEURISTICS) score a whole batch at once: the ones that are
+# a sum over the positions of the board of a [tile][position] table by a single table lookup and a sum, the linear
+# conflict by summing the signature of every row and column and looking them up (see utils.distance_metrics).
+
+
+
+def table_kernel(table):
+    """
+        It returns the kernel of the sum of a [tile][position] table: a function from the 2-D array of the boards,
+        one per row, to the array of their heuristic values.
+
+        Args:
+            table: this is a [tile][position] table of DistanceTables.
+    """
+    table = np.array(table, dtype=np.int32)
+    positions = np.arange(table.shape[1])
+
+    def kernel(boards):
+        return table[boards, positions].sum(axis=1)
+    return kernel
+
+
+
+def linear_conflict_kernel(tables):
+    """
+        It returns the kernel of linear_conflict_single (see table_kernel). The signatures of the lines are looked up
+        in an array, or, when they are evaluated on demand (utils.distance_metrics.LineConflicts), once per distinct
+        signature of the batch.
+
+        Args:
+            tables: this is the DistanceTables of the puzzle.
+    """
+    n = tables.n
+    rows = np.array(tables.row_signature, dtype=np.int64)
+    cols = np.array(tables.col_signature, dtype=np.int64)
+    positions = np.arange(n * n)
+    conflicts = tables.line_conflicts
+    dense = np.array(conflicts, dtype=np.int32) if isinstance(conflicts, list) else None
+
+    def kernel(boards):
+        # One column per row and per column of the board.
+        signatures = np.concatenate((rows[boards, positions].reshape(-1, n, n).sum(axis=2),
+                                     cols[boards, positions].reshape(-1, n, n).sum(axis=1)), axis=1)
+        if dense is not None:
+            return dense[signatures].sum(axis=1)
+        unique, inverse = np.unique(signatures, return_inverse=True)
+        moves = np.array([conflicts[signature] for signature in unique.tolist()], dtype=np.int32)
+        return moves[inverse.reshape(signatures.shape)].sum(axis=1)
+    return kernel
+
+
+
+def heuristic_kernel(tables, heuristic):
+    """
+        It returns the kernel of a vectorized heuristic (see table_kernel).
+
+        Args:
+            tables: this is the DistanceTables of the puzzle.
+            heuristic: this is the name of the heuristic.
+
+        Raises:
+            NotImplementedError: if the heuristic has no vectorized kernel.
+    """
+    if heuristic == 'manhattan_distance':
+        return table_kernel(tables.manhattan)
+    if heuristic == 'euclidean_distance':
+        return table_kernel(tables.euclidean)
+    if heuristic == 'misplaced_tiles':
+        return table_kernel(tables.misplaced)
+    if heuristic == 'linear_conflict':
+        return linear_conflict_kernel(tables)
+    if heuristic == 'linear_manhattan_conflict':
+        conflict, manhattan = linear_conflict_kernel(tables), table_kernel(tables.tile_manhattan)
+        return lambda boards: conflict(boards) + manhattan(boards)
+    raise NotImplementedError("No such Heuristic is supported.")
+
+
+
+def expand_batch(boards, blanks, n):
+    """
+        It generates the children of a batch of boards.
+
+        Args:
+            boards: this is the 2-D array of the boards, one per row.
+            blanks: this is the array of the positions of their blanks.
+            n: this is the dimension of the puzzle.
+
+        Returns:
+            tuple: the 2-D array of the children, the index of the parent of every child and the code
+                of the move that generated it (see utils.state_table.MOVES).
+    """
+    rows, cols = blanks // n, blanks % n
+    legal = (rows > 0, rows < n - 1, cols > 0, cols < n - 1)
+    children, parents, codes = [], [], []
+    for code, offset in enumerate(move_offsets(n)):
+        parent = np.flatnonzero(legal[code])
+        child = boards[parent]
+        blank = blanks[parent]
+        target = blank + offset
+        index = np.arange(len(parent))
+        child[index, blank] = child[index, target]
+        child[index, target] = 0
+        children.append(child)
+        parents.append(parent)
+        codes.append(np.full(len(parent), code, dtype=np.int64))
+    return np.concatenate(children), np.concatenate(parents), np.concatenate(codes)
+
+
+
+def path(table, key, dtype, n, offsets):
+    """
+        It rebuilds the actions of the path to a state by undoing the moves stored in the table.
+
+        Args:
+            table: this is the dict of the entries (cost << 2 | move) by board.
+            key: this is the board of the state, as bytes.
+            dtype: this is the NumPy type of a tile.
+            n: this is the dimension of the puzzle.
+            offsets: this is the result of utils.state_table.move_offsets.
+
+        Returns:
+            list: the actions from the initial state to the state.
+    """
+    board = np.frombuffer(key, dtype=dtype).copy()
+    blank = int(np.argmin(board))
+    actions = []
+    entry = table[key]
+    while entry >> 2:
+        move = entry & 3
+        actions.append(MOVES[move])
+        previous = blank - offsets[move]
+        board[blank], board[previous] = board[previous], 0
+        blank = previous
+        entry = table[board.tobytes()]
+    actions.reverse()
+    return actions
+
+
+
+def BATCH_A_STAR(initial_state, heuristic, batch_size=DEFAULT_BATCH_SIZE):
+    """Batched A * search: the batch_size best nodes of the open list are popped together, their children are
+    generated into a 2-D NumPy array of boards and scored at once by the vectorized kernel of heuristic (the name of
+    one of BATCH_HEURISTICS). Duplicate children of a batch are merged by sorting, keeping the cheapest, before they are
+    looked up in the table of the states reached. A node of a batch may be expanded before a cheaper path to it is
+    found, so a state reached again with a lower cost is reopened. The boards themselves, as bytes, are the keys
+    of the table and the entries of the open list, ordered by f and then by the deepest node. The goal is only accepted
+    when no node with a lower f is left unexpanded, in the batch or in the open list."""
+    n = initial_state.n
+    size = n * n
+    dtype = np.uint8 if size <= 256 else np.uint16
+    kernel = heuristic_kernel(get_distance_tables(initial_state), heuristic)
+    offsets = move_offsets(n)
+
+    start = np.array(initial_state.config, dtype=dtype)
+    goal = np.array(initial_state.goal, dtype=dtype).tobytes()
+    h = int(kernel(start[np.newaxis])[0])
+    # Cost and move of every state reached, entry = cost << 2 | move as in utils.state_table.
+    table = {start.tobytes(): 0}
+    frontier = [(h, 0, start.tobytes())]
+    nodes_expanded = 0
+    max_search_depth = 0
+    tracer = get_tracer()
+    progress = get_progress()
+    report = progress.every if progress is not None else float("inf")
+    trace = tracer.start("BatchA*", initial_state) if tracer is not None else None
+
+    while frontier:
+        batch, costs = [], []
+        while frontier and len(batch) < batch_size:
+            bound, g, key = heapq.heappop(frontier)
+            g = -g
+            if table[key] >> 2 != g:
+                # A cheaper path to the state was found after this entry was pushed.
+                continue
+            if trace is not None:
+                trace(pack_config(np.frombuffer(key, dtype=dtype), n), g, bound - g)
+            if key == goal:
+                if not batch or bound <= lowest:
+                    return (replay(initial_state, path(table, key, dtype, n, offsets)), nodes_expanded, max_search_depth)
+                # Nodes of the batch with a lower f have not been expanded yet, a shorter path may go through them:
+                # the goal goes back to the open list until they are.
+                heapq.heappush(frontier, (bound, -g, key))
+                break
+            if not batch:
+                lowest = bound
+            batch.append(key)
+            costs.append(g)
+        if not batch:
+            break
+
+        nodes_expanded += len(batch)
+        if nodes_expanded >= report:
+            report = progress.update(nodes_expanded, len(frontier), len(table) - len(frontier), bound)
+        boards = np.frombuffer(b"".join(batch), dtype=dtype).reshape(len(batch), size)
+        children, parents, codes = expand_batch(boards, np.argmin(boards, axis=1), n)
+        g = np.array(costs, dtype=np.int64)[parents] + 1
+
+        # Merge the duplicates of the batch, the cheapest first.
+        order = np.argsort(g, kind="stable")
+        children, g, codes = children[order], g[order], codes[order]
+        keys = np.ascontiguousarray(children).view(np.dtype((np.void, size * children.itemsize))).ravel()
+        _, first = np.unique(keys, return_index=True)
+        children, g, codes = children[first], g[first], codes[first]
+
+        f = g + kernel(children)
+        max_search_depth = max(max_search_depth, int(g.max()))
+        for key, cost, score, code in zip(keys[first].tolist(), g.tolist(), f.tolist(), codes.tolist()):
+            entry = table.get(key)
+            if entry is None or cost < entry >> 2:
+                table[key] = cost << 2 | code
+                heapq.heappush(frontier, (score, -cost, key))
+
+    return None
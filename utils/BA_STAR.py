@@ -1,177 +1,134 @@
 # description: BA* search algorithm
 # author: Seminara Luigi
 # date: 2023-01-24
-# tags: python, BA*, search, algorithm
+# tags: python, BA*, MM, search, algorithm
 
 import logging
-from tqdm import tqdm
-from utils.priority_queue import PriorityQueue
-
-def BA_STAR(initial_state, goal_state, heuristic):
-    """Bidirectional A* algorithm"""
-    # Create the start and goal state priority queues
-    start_frontier = PriorityQueue('min',heuristic)
-    goal_frontier = PriorityQueue('min',heuristic)
-    start_frontier.append(initial_state)
-    goal_frontier.append(goal_state)
-    start_frontier_config = {}
-    goal_frontier_config = {}
-    start_frontier_config[tuple(initial_state.config)] = True
-    goal_frontier_config[tuple(goal_state.config)] = True
-    explored = set()
-    nodes_expanded_from_start = 0
-    nodes_expanded_from_goal = 0
-    max_search_depth_from_start = 0
-    max_search_depth_from_goal = 0
-    log = ""
-    
-    def generator():
-        while start_frontier and goal_frontier:
-            yield
-
-    for _ in tqdm(generator()):
-        start_state = start_frontier.pop()
-        goal_state = goal_frontier.pop()
-        log += "****** Start State ******\n"
-        log = start_state.display(log)
-        log += "****** Goal State ******\n"
-        log = goal_state.display(log)
-        explored.add(start_state)
-        explored.add(goal_state)
-        if start_state.is_goal():
-            logging.info(log)
-            return (start_state, nodes_expanded_from_start, max_search_depth_from_start)
-        if goal_state.is_goal():
-            logging.info(log)
-            return (goal_state, nodes_expanded_from_goal, max_search_depth_from_goal)
-        
-        result = start_frontier_direction(start_state, heuristic, start_frontier, goal_frontier, start_frontier_config, goal_frontier_config, explored, nodes_expanded_from_start + 1, max_search_depth_from_goal)
-        
-        if result[0]:
-            max_search_depth = max_search_depth_from_start if max_search_depth_from_start > max_search_depth_from_goal else max_search_depth_from_goal
-            logging.info(log)
-            return (result[1], result[2], max_search_depth)
-        
-        nodes_expanded_from_start, max_search_depth_from_start = result[1], result[2]
-        
-        result = goal_frontier_direction(goal_state, heuristic, start_frontier, goal_frontier, start_frontier_config, goal_frontier_config, explored, nodes_expanded_from_start + 1, max_search_depth_from_goal)
-        
-        if result[0]:
-            max_search_depth = max_search_depth_from_start if max_search_depth_from_start > max_search_depth_from_goal else max_search_depth_from_goal
-            logging.info(log)
-            return (result[1], result[2], max_search_depth)
-        
-        nodes_expanded_from_goal, max_search_depth_from_goal = result[1], result[2]
-        
-    logging.info(log)
-    return None
-
-
-
-def start_frontier_direction(start_state, heuristic, start_frontier, goal_frontier, start_frontier_config, goal_frontier_config, explored, nodes_expanded, max_search_depth):
-    for neighbor in start_state.expand(RLDU= False):
-        if neighbor not in explored and tuple(neighbor.config) not in start_frontier_config:
-            start_frontier.append(neighbor)
-            start_frontier_config[tuple(neighbor.config)] = True
-            if neighbor.cost > max_search_depth:
-                max_search_depth = neighbor.cost
-        elif neighbor in start_frontier:
-            if heuristic(neighbor) < start_frontier[neighbor]:
-                start_frontier.__delitem__(neighbor)
-                start_frontier.append(neighbor)
-        elif tuple(neighbor.config) in goal_frontier_config:
-            return find_intersection_from_start(neighbor, goal_frontier, explored, nodes_expanded, max_search_depth)
-    return (False, nodes_expanded, max_search_depth)
+from utils.priority_queue import IndexedPriorityQueue
+from utils.IDA_STAR import replay
+from puzzle.puzzle_state import MutableBoard
+from utils.tracing import get_tracer
+from utils.progress import get_progress
+
+
+
+def action_name(blank, target, n):
+    """
+        It returns the name of the move that takes the blank from blank to target.
+
+        Args:
+            blank: this is the position of the blank.
+            target: this is the adjacent position the blank moves to.
+            n: this is the dimension of the puzzle.
+    """
+    if target == blank - n:
+        return "Up"
+    if target == blank + n:
+        return "Down"
+    if target == blank - 1:
+        return "Left"
+    return "Right"
+
+
+
+def trace(state, table):
+    """
+        It follows the parent moves of a table from a state back to the root of its direction.
 
+        Args:
+            state: this is the state the walk starts from.
+            table: this is the dict mapping a packed state to (g, position of the blank in the parent).
 
+        Returns:
+            list: the positions of the blank from the state to the root.
+    """
+    board = MutableBoard(state)
+    blanks = [board.blank]
+    parent_blank = table[board.packed][1]
+    while parent_blank is not None:
+        board.slide(parent_blank)
+        blanks.append(parent_blank)
+        parent_blank = table[board.packed][1]
+    return blanks
 
-def goal_frontier_direction(goal_state, heuristic, start_frontier, goal_frontier, start_frontier_config, goal_frontier_config, explored, nodes_expanded, max_search_depth):
-    for neighbor in goal_state.expand(RLDU= False):
-        if neighbor not in explored and tuple(neighbor.config) not in goal_frontier_config:
-            goal_frontier.append(neighbor)
-            goal_frontier_config[tuple(neighbor.config)] = True
+
+
+def BA_STAR(initial_state, goal_state, heuristic, heuristic_delta, tie_breaking='deepest', backward=None):
+    """Bidirectional A* algorithm meeting in the middle (MM).
+    Each direction keeps a hash table mapping every generated state to its g and the position of
+    the blank in its parent, so the frontiers meet in O(1) and the path is stitched from the tables.
+    A node is expanded in order of max(f, 2g) and the search stops when the best meeting cost U is
+    not above the smallest priority C of the two frontiers, which keeps the result optimal.
+    backward is the (heuristic, heuristic_delta) pair of the backward search, whose goal is the
+    initial state, the forward pair by default."""
+    if initial_state.is_goal():
+        return (initial_state, 0, 0)
+
+    heuristics = ((heuristic, heuristic_delta), backward if backward is not None else (heuristic, heuristic_delta))
+
+    def priority(side):
+        estimate = heuristics[side][0]
+        return lambda state: max(estimate(state), 2 * state.cost)
+
+    priorities = (priority(0), priority(1))
+    frontiers = (IndexedPriorityQueue('min', priorities[0], tie_breaking), IndexedPriorityQueue('min', priorities[1], tie_breaking))
+    tables = ({initial_state.packed: (0, None)}, {goal_state.packed: (0, None)})
+    frontiers[0].append(initial_state)
+    frontiers[1].append(goal_state)
+    best_cost = float("inf")
+    meeting = None
+    nodes_expanded = 0
+    max_search_depth = 0
+    tracer = get_tracer()
+    progress = get_progress()
+    report = progress.every if progress is not None else float("inf")
+    record = tracer.start("BA*", initial_state) if tracer is not None else None
+
+    while frontiers[0] and frontiers[1]:
+        c_forward = priorities[0](frontiers[0].peek())
+        c_backward = priorities[1](frontiers[1].peek())
+        if best_cost <= min(c_forward, c_backward):
+            break
+
+        # Expand the direction with the smallest priority, the smallest frontier on ties.
+        if c_forward < c_backward or (c_forward == c_backward and len(frontiers[0]) <= len(frontiers[1])):
+            side = 0
+        else:
+            side = 1
+        frontier, table, other = frontiers[side], tables[side], tables[1 - side]
+        delta = heuristics[side][1]
+        state = frontier.pop()
+        nodes_expanded += 1
+        if nodes_expanded >= report:
+            report = progress.update(nodes_expanded, len(frontiers[0]) + len(frontiers[1]),
+                                     len(tables[0]) + len(tables[1]) - len(frontiers[0]) - len(frontiers[1]), min(c_forward, c_backward))
+        if record is not None:
+            record(state.packed, state.cost, state.h)
+        parent_blank = table[state.packed][1]
+        for neighbor in state.expand(RLDU= False):
+            if neighbor.blank == parent_blank:
+                continue
+            known = table.get(neighbor.packed)
+            if known is not None and known[0] <= neighbor.cost:
+                continue
+            table[neighbor.packed] = (neighbor.cost, state.blank)
+            neighbor.h = state.h + delta(state, neighbor.blank)
+            frontier.append(neighbor)
             if neighbor.cost > max_search_depth:
                 max_search_depth = neighbor.cost
-        elif neighbor in goal_frontier:
-            if heuristic(neighbor) < goal_frontier[neighbor]:
-                goal_frontier.__delitem__(neighbor)
-                goal_frontier.append(neighbor)
-        elif tuple(neighbor.config) in start_frontier_config:
-            return find_intersection_from_goal(neighbor, start_frontier, explored, nodes_expanded, max_search_depth)
-    return (False, nodes_expanded, max_search_depth)
-
-
-
-def find_intersection_from_start(neighbor, goal_frontier, explored, nodes_expanded, max_search_depth):
-    if neighbor in explored:
-        for node in explored:
-            if tuple(node.config) == tuple(neighbor.config):
-                r = []
-                parent = node.parent
-                while parent:
-                    r.append(parent)
-                    parent = parent.parent
-                while r[0].parent.config == neighbor.config:
-                    neighbor = neighbor.parent
-                r[0].parent = neighbor
-                for n in r[1:]:
-                    n.parent = r[r.index(n)-1]
-                for n in r:
-                    n.cost = n.parent.cost + 1
-                return (True, r[-1], nodes_expanded, max_search_depth)
-    
-    while goal_frontier:
-        node = goal_frontier.pop()
-        if tuple(node.config) == tuple(neighbor.config):
-            r = []
-            parent = node.parent
-            while parent:
-                r.append(parent)
-                parent = parent.parent
-            while r[0].parent.config == neighbor.config:
-                neighbor = neighbor.parent
-            r[0].parent = neighbor
-            for n in r[1:]:
-                n.parent = r[r.index(n)-1]
-            for n in r:
-                n.cost = n.parent.cost + 1
-            return (True, r[-1], nodes_expanded, max_search_depth)
-        return (False, nodes_expanded, max_search_depth)
-        
-        
-        
-def find_intersection_from_goal(neighbor, start_frontier, explored, nodes_expanded, max_search_depth):
-    if neighbor in explored:
-        for node in explored:
-            if tuple(node.config) == tuple(neighbor.config):
-                r = []
-                parent = neighbor.parent
-                while parent:
-                    r.append(parent)
-                    parent = parent.parent
-                while r[0].parent.config == neighbor.config:
-                    neighbor = neighbor.parent
-                r[0].parent = node
-                for n in r[1:]:
-                    n.parent = r[r.index(n)-1]
-                for n in r:
-                    n.cost = n.parent.cost + 1
-                return (True, r[-1], nodes_expanded, max_search_depth)
-         
-    while start_frontier:
-        node = start_frontier.pop()
-        if tuple(node.config) == tuple(neighbor.config):
-            r = []
-            parent = neighbor.parent
-            while parent:
-                r.append(parent)
-                parent = parent.parent
-            while r[0].parent.config == neighbor.config:
-                neighbor = neighbor.parent
-            r[0].parent = node
-            for n in r[1:]:
-                n.parent = r[r.index(n)-1]
-            for n in r:
-                n.cost = n.parent.cost + 1
-            return (True, r[-1], nodes_expanded, max_search_depth)
-    return (False, nodes_expanded, max_search_depth)
\ No newline at end of file
+            opposite = other.get(neighbor.packed)
+            if opposite is not None and neighbor.cost + opposite[0] < best_cost:
+                best_cost = neighbor.cost + opposite[0]
+                meeting = neighbor
+
+    if meeting is None:
+        return None
+    logging.info(f"BA* frontiers met with cost {best_cost}")
+    if tracer is not None:
+        tracer.event("meeting", cost=best_cost, nodes_expanded=nodes_expanded)
+
+    # Stitch the path: start -> meeting from the forward table, meeting -> goal from the backward table.
+    blanks = trace(meeting, tables[0])[::-1] + trace(meeting, tables[1])[1:]
+    n = initial_state.n
+    actions = [action_name(blank, target, n) for blank, target in zip(blanks, blanks[1:])]
+    return (replay(initial_state, actions), nodes_expanded, max_search_depth)
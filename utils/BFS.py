@@ -3,36 +3,48 @@
 # date: 2023-01-18
 # tags: python, BFS, search, algorithm
 
-import logging
-import queue
-from tqdm import tqdm
+from collections import deque
+from puzzle.puzzle_state import tile_bits
+from utils.IDA_STAR import successors, replay
+from utils.state_table import StateTable
+from utils.tracing import get_tracer
+from utils.progress import get_progress
 
 def BFS(initial_state):
-    frontier = queue.Queue() 
-    frontier.put(initial_state)
-    frontier_config = {}
-    frontier_config[tuple(initial_state.config)] = True
-    explored = set()
+    """BFS search on packed states. The frontier holds (packed state, blank, cost) and every state
+    reached is recorded with its cost and last move in a StateTable, which rebuilds the path once the goal is found."""
+    n = initial_state.n
+    bits = tile_bits(n)
+    mask = (1 << bits) - 1
+    moves = successors(n)
+    goal = initial_state.goal_packed
+    frontier = deque()
+    frontier.append((initial_state.packed, initial_state.blank, 0))
+    table = StateTable(n)
+    table.put(initial_state.packed, 0)
     nodes_expanded = 0
     max_search_depth = 0
+    tracer = get_tracer()
+    progress = get_progress()
+    report = progress.every if progress is not None else float("inf")
+    trace = tracer.start("BFS", initial_state) if tracer is not None else None
     
-    def generator():
-        while not frontier.empty():
-            yield
-
-    for _ in tqdm(generator()):
-        state = frontier.get()
-        logging.info("****** State ******")
-        state.display_log()
-        explored.add(state.config)
-        if state.is_goal():
-            return (state,nodes_expanded,max_search_depth)
+    while frontier:
+        packed, blank, cost = frontier.popleft()
+        if trace is not None:
+            trace(packed, cost, None)
+        if packed == goal:
+            return (replay(initial_state, table.path(packed, blank, cost)),nodes_expanded,max_search_depth)
         
         nodes_expanded += 1
-        for neighbor in state.expand(RLDU = False):
-            if neighbor.config not in explored and tuple(neighbor.config) not in frontier_config:   
-                frontier.put(neighbor)
-                frontier_config[tuple(neighbor.config)] = True
-                if neighbor.cost > max_search_depth:
-                    max_search_depth = neighbor.cost
-    return None
\ No newline at end of file
+        if nodes_expanded >= report:
+            report = progress.update(nodes_expanded, len(frontier), len(table) - len(frontier), cost)
+        for target, action in moves[blank]:
+            tile = (packed >> (target * bits)) & mask
+            neighbor = packed ^ (tile << (target * bits)) ^ (tile << (blank * bits))
+            if neighbor not in table:
+                table.put(neighbor, cost + 1, action)
+                frontier.append((neighbor, target, cost + 1))
+                if cost + 1 > max_search_depth:
+                    max_search_depth = cost + 1
+    return None
@@ -0,0 +1,66 @@
+# description: Bidirectional Breadth First Search algorithm
+# author: Seminara Luigi
+# date: 2023-02-13
+# tags: python, BFS, bidirectional, search, algorithm
+
+import logging
+from utils.IDA_STAR import replay
+from utils.BA_STAR import action_name, trace
+from utils.tracing import get_tracer
+from utils.progress import get_progress
+
+
+
+def BiBFS(initial_state, goal_state):
+    """Bidirectional breadth-first search growing level-synchronous frontiers from the start and the goal.
+    The smaller frontier is always expanded by a whole layer and every generated state is looked up in the
+    table of the other direction. Both directions have completed all their previous layers, so the first
+    state found in both tables lies on a shortest path and the search stops right away."""
+    if initial_state.is_goal():
+        return (initial_state, 0, 0)
+
+    layers = [[initial_state], [goal_state]]
+    tables = ({initial_state.packed: (0, None)}, {goal_state.packed: (0, None)})
+    depths = [0, 0]
+    nodes_expanded = 0
+    meeting = None
+    tracer = get_tracer()
+    progress = get_progress()
+    report = progress.every if progress is not None else float("inf")
+    record = tracer.start("BiBFS", initial_state) if tracer is not None else None
+
+    while meeting is None and layers[0] and layers[1]:
+        side = 0 if len(layers[0]) <= len(layers[1]) else 1
+        table, other = tables[side], tables[1 - side]
+        next_layer = []
+        for state in layers[side]:
+            nodes_expanded += 1
+            if nodes_expanded >= report:
+                report = progress.update(nodes_expanded, len(layers[0]) + len(layers[1]) + len(next_layer),
+                                         len(tables[0]) + len(tables[1]), depths[0] + depths[1] + 1)
+            if record is not None:
+                record(state.packed, state.cost, None)
+            for neighbor in state.expand(RLDU = False):
+                if neighbor.packed in table:
+                    continue
+                table[neighbor.packed] = (neighbor.cost, state.blank)
+                next_layer.append(neighbor)
+                if neighbor.packed in other:
+                    meeting = neighbor
+                    break
+            if meeting is not None:
+                break
+        layers[side] = next_layer
+        depths[side] += 1
+        logging.info(f"BiBFS {'forward' if side == 0 else 'backward'} layer {depths[side]}: {len(next_layer)} states")
+        if tracer is not None:
+            tracer.event("layer", side=side, depth=depths[side], states=len(next_layer))
+
+    if meeting is None:
+        return None
+
+    # Stitch the path: start -> meeting from the forward table, meeting -> goal from the backward table.
+    blanks = trace(meeting, tables[0])[::-1] + trace(meeting, tables[1])[1:]
+    n = initial_state.n
+    actions = [action_name(blank, target, n) for blank, target in zip(blanks, blanks[1:])]
+    return (replay(initial_state, actions), nodes_expanded, max(depths))
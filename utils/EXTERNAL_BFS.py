@@ -0,0 +1,248 @@
+# description: External-memory breadth first search, the layers are sorted files of packed states
+# author: Seminara Luigi
+# date: 2023-02-25
+# tags: python, BFS, external_memory, numpy, mmap, merge, layers, search, algorithm
+
+import os
+import sys
+import shutil
+import logging
+import argparse
+import tempfile
+import numpy as np
+from puzzle.puzzle_state import PuzzleState
+from utils.LAYER_BFS import MAX_SIZE, successors, contains, path
+from utils.IDA_STAR import replay
+from utils.tracing import get_tracer
+from utils.progress import get_progress
+
+# Memory budget of a search in MB, it bounds the states held in RAM at once, the layers live on disk. The pages of
+# the memory-mapped layers are cached by the OS on top of it, but they can be reclaimed at any time.
+DEFAULT_MEMORY_BUDGET = 512
+
+# Bytes of RAM used per state of an expanded chunk (the state, its successors and the temporary arrays of
+# the sort) and per state read from the runs by a merge step.
+BYTES_PER_STATE = 240
+BYTES_PER_SUCCESSOR = 72
+
+
+
+def open_layer(path):
+    """
+        It maps a file of packed states read-only, the pages are loaded on demand by the OS.
+
+        Args:
+            path: this is the path of the file.
+
+        Returns:
+            numpy.ndarray: the states, an empty array for an empty file.
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    return np.memmap(path, dtype=np.uint64, mode="r")
+
+
+
+class ExternalBFS(object):
+    """
+        A breadth-first search whose layers are sorted files of packed states (see utils.LAYER_BFS) in a directory.
+        A layer is expanded one chunk at a time: the successors of every chunk are sorted and written to a run file,
+        then the runs are merged by a streaming k-way merge that drops the duplicates and the states of the two
+        layers before, which are read back through memory mapping. Only a chunk, or a block of every run, is held
+        in RAM at once, so the memory stays within the budget whatever the size of the layers.
+    """
+
+    def __init__(self, initial_state, directory=None, memory_budget=DEFAULT_MEMORY_BUDGET, keep=True):
+        """
+            The constructor of the ExternalBFS class.
+
+            Args:
+                initial_state: this is the root of the search.
+                directory: this is the directory of the layer files. Defaults to a temporary directory, removed by close.
+                memory_budget: this is the RAM budget in MB. Defaults to DEFAULT_MEMORY_BUDGET.
+                keep: if False only the last two layers are kept on disk, which is enough to go on but not
+                    to rebuild a path. Defaults to True.
+
+            Raises:
+                NotImplementedError: if the board is bigger than MAX_SIZE x MAX_SIZE.
+        """
+        if initial_state.n > MAX_SIZE:
+            raise NotImplementedError(f"ExternalBFS only supports boards up to {MAX_SIZE}x{MAX_SIZE}.")
+        self.n = initial_state.n
+        self.temporary = directory is None
+        self.directory = tempfile.mkdtemp(prefix="bfs_") if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+        budget = memory_budget * 1024 * 1024
+        self.chunk_size = max(1, budget // BYTES_PER_STATE)
+        self.merge_size = max(1, budget // BYTES_PER_SUCCESSOR)
+        self.keep = keep
+        self.sizes = []
+        np.array([initial_state.packed], dtype=np.uint64).tofile(self.layer_path(0))
+        self.sizes.append(1)
+
+
+
+    def layer_path(self, depth):
+        """ It returns the path of the file of a layer. """
+        return os.path.join(self.directory, f"layer_{depth:03d}.u64")
+
+
+
+    def layer(self, depth):
+        """ It returns the memory-mapped states of a layer. """
+        return open_layer(self.layer_path(depth))
+
+
+
+    def expand(self):
+        """
+            It builds the next layer from the last one.
+
+            Returns:
+                int: the number of states of the new layer.
+        """
+        depth = len(self.sizes)
+        current = self.layer(depth - 1)
+        runs = []
+        for start in range(0, len(current), self.chunk_size):
+            run = os.path.join(self.directory, f"run_{depth:03d}_{len(runs):05d}.u64")
+            np.unique(successors(np.asarray(current[start:start + self.chunk_size]), self.n)).tofile(run)
+            runs.append(run)
+        previous = [current] if depth == 1 else [current, self.layer(depth - 2)]
+        size = self.merge(runs, previous, self.layer_path(depth))
+        for run in runs:
+            os.remove(run)
+        if not self.keep and depth >= 2:
+            os.remove(self.layer_path(depth - 2))
+        self.sizes.append(size)
+        return size
+
+
+
+    def merge(self, runs, previous, output):
+        """
+            It merges sorted run files into a sorted file without duplicates and without the states of previous.
+            Every step takes the next block of every run, up to the smallest last value among the blocks, so that
+            every value up to it has been read from all the runs.
+
+            Args:
+                runs: this is the list of the paths of the runs.
+                previous: this is the list of the sorted arrays of the states to drop.
+                output: this is the path of the merged file.
+
+            Returns:
+                int: the number of states written.
+        """
+        sources = [open_layer(run) for run in runs]
+        positions = [0] * len(sources)
+        cursors = [0] * len(previous)
+        block = max(1, self.merge_size // max(1, len(sources)))
+        written = 0
+        with open(output, "wb") as file:
+            while True:
+                active = [i for i, source in enumerate(sources) if positions[i] < len(source)]
+                if not active:
+                    break
+                cutoff = min(sources[i][min(positions[i] + block, len(sources[i])) - 1] for i in active)
+                pieces = []
+                for i in active:
+                    end = min(positions[i] + block, len(sources[i]))
+                    end = positions[i] + int(np.searchsorted(sources[i][positions[i]:end], cutoff, side="right"))
+                    pieces.append(np.asarray(sources[i][positions[i]:end]))
+                    positions[i] = end
+                merged = np.unique(np.concatenate(pieces))
+                for j, layer in enumerate(previous):
+                    end = int(np.searchsorted(layer, cutoff, side="right"))
+                    for start in range(cursors[j], end, block):
+                        merged = np.setdiff1d(merged, np.asarray(layer[start:min(start + block, end)]), assume_unique=True)
+                    cursors[j] = end
+                merged.tofile(file)
+                written += len(merged)
+        return written
+
+
+
+    def run(self, max_depth=None, goal=None):
+        """
+            It expands the layers until the last one is empty, max_depth is reached or goal is found.
+
+            Args:
+                max_depth: this is the depth of the last layer. Defaults to None (every reachable state).
+                goal: this is a packed state that stops the search. Defaults to None.
+
+            Returns:
+                int: the depth of goal, None if it has not been found.
+        """
+        tracer = get_tracer()
+        progress = get_progress()
+        nodes_expanded = sum(self.sizes[:-1])
+        while True:
+            depth = len(self.sizes) - 1
+            logging.info(f"ExternalBFS layer {depth}: {self.sizes[-1]} states")
+            if tracer is not None:
+                tracer.event("layer", depth=depth, states=self.sizes[-1])
+            if goal is not None and contains(self.layer(depth), goal):
+                return depth
+            if self.sizes[-1] == 0 or depth == max_depth:
+                return None
+            nodes_expanded += self.sizes[-1]
+            self.expand()
+            if progress is not None:
+                progress.update(nodes_expanded, self.sizes[-1], nodes_expanded, depth + 1)
+
+
+
+    def close(self):
+        """ It removes the layer files of a temporary directory. """
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+
+def EXTERNAL_BFS(initial_state, directory=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """External-memory BFS (see ExternalBFS): the layers are kept on disk until the goal is found,
+    then the path is rebuilt by binary searches in the memory-mapped layers."""
+    search = ExternalBFS(initial_state, directory, memory_budget)
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.start("ExternalBFS", initial_state)
+    try:
+        depth = search.run(goal=initial_state.goal_packed)
+        if depth is None:
+            return None
+        history = [search.layer(d) for d in range(depth + 1)]
+        actions = path(history, initial_state.goal_packed, initial_state.n)
+        return (replay(initial_state, actions), sum(search.sizes[:depth]), depth)
+    finally:
+        search.close()
+
+
+
+def main(argv=None):
+    """ It prints the number of states at every depth from the goal of a puzzle size. """
+    parser = argparse.ArgumentParser(description="Count the states at every depth from the goal with an external-memory BFS.")
+    parser.add_argument("--ps", type=int, help="Size of the puzzle (e.g. 4 for a 4x4 puzzle)", default=4)
+    parser.add_argument("--depth", type=int, help="Depth of the last layer. Defaults to every reachable state", default=None)
+    parser.add_argument("--memory", type=int, help="RAM budget in MB", default=DEFAULT_MEMORY_BUDGET)
+    parser.add_argument("--directory", type=str, help="Directory of the layer files, they are kept there. Defaults to a temporary directory", default=None)
+    args = parser.parse_args(argv)
+
+    goal = tuple(range(1, args.ps * args.ps)) + (0,)
+    search = ExternalBFS(PuzzleState(goal, args.ps, goal, None), args.directory, args.memory, keep=args.directory is not None)
+    try:
+        print(f"0\t1\t1", flush=True)
+        total = 1
+        while search.sizes[-1] and (args.depth is None or len(search.sizes) <= args.depth):
+            size = search.expand()
+            if not size:
+                break
+            total += size
+            print(f"{len(search.sizes) - 1}\t{size}\t{total}", flush=True)
+    finally:
+        search.close()
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
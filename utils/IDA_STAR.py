@@ -4,67 +4,185 @@
 # tags: python, IDA*, search, algorithm
 
 import logging
-from tqdm import tqdm
+from puzzle.puzzle_state import MutableBoard
+from utils.tracing import get_tracer
+from utils.progress import get_progress
 
-explored = set()
-log = ""
+# Method of PuzzleState that applies each action, used to rebuild the path once the goal is found.
+ACTIONS = {"Up": "move_up", "Down": "move_down", "Left": "move_left", "Right": "move_right"}
 
-def IDA_STAR(initial_state,heuristic):
-    """IDA* search"""
-    
-    global log
-    global explored
-    
+# Number of nodes expanded between two checks of the stop flag and two progress updates of bounded_search.
+STOP_POLL = 4096
+
+
+
+def successors(n):
+    """
+        It returns, for every position of the blank, the list of (target, action) of the legal moves in UDLR order.
+
+        Args:
+            n: this is the dimension of the puzzle.
+    """
+    result = []
+    for i in range(n * n):
+        moves = []
+        if i >= n:
+            moves.append((i - n, "Up"))
+        if i < n * (n - 1):
+            moves.append((i + n, "Down"))
+        if i % n != 0:
+            moves.append((i - 1, "Left"))
+        if i % n != n - 1:
+            moves.append((i + 1, "Right"))
+        result.append(moves)
+    return result
+
+
+
+def replay(initial_state, actions):
+    """
+        It rebuilds the chain of PuzzleState from the initial state following the actions.
+
+        Args:
+            initial_state: this is the initial state of the puzzle.
+            actions: this is the list of the actions.
+
+        Returns:
+            PuzzleState: the final state, linked to the initial one through the parents.
+    """
+    state = initial_state
+    for action in actions:
+        state = getattr(state, ACTIONS[action])()
+    return state
+
+
+
+def bounded_search(board, h, g, threshold, heuristic_delta, moves, blanks=None, stop=None, trace=None, progress=None, shortcuts=None):
+    """
+        It runs a depth-first search bounded by threshold on f = g + h, on an explicit stack.
+        The moves are applied to board and undone in place, the move that brings the blank back to
+        the previous position is pruned and h is updated through heuristic_delta.
+
+        Args:
+            board: this is the MutableBoard the search starts from, it is restored when the search fails without being stopped.
+            h: this is the heuristic value of board.
+            g: this is the cost already paid to reach board.
+            threshold: this is the bound on f.
+            heuristic_delta: this is the function returning the change of h for a move.
+            moves: this is the result of successors.
+            blanks: this is the list of the previous positions of the blank. Defaults to an empty list.
+            stop: this is an object with an is_set method (e.g. a multiprocessing.Event), the search
+                gives up as soon as it is set. Defaults to None.
+            trace: this is the node recorder of a Tracer, called with every node reached. Defaults to None.
+            progress: this is called with the nodes expanded so far and the current depth every STOP_POLL nodes. Defaults to None.
+            shortcuts: this is a dict of the exact distance from the goal by packed state (see utils.solution_cache).
+                The search ends at a state of shortcuts whose exact f is within the threshold, and prunes the
+                other ones with their exact f. Defaults to None.
+
+        Returns:
+            tuple: the list of the actions to the goal or to a state of shortcuts (None if none is found), the smallest f
+                that exceeded the threshold, the number of nodes expanded and the maximum depth reached.
+    """
+    blanks = list(blanks) if blanks else []
+    actions = []
+    deltas = []
+    choice = [0]
+    next_threshold = float("inf")
+    nodes_expanded = 0
+    max_search_depth = g
+    poll = STOP_POLL if stop is not None or progress is not None else float("inf")
+
+    if board.is_goal():
+        return actions, next_threshold, nodes_expanded, max_search_depth
+
+    while choice:
+        i = choice[-1]
+        candidates = moves[board.blank]
+        if i == len(candidates):
+            # Every move of this node has been tried: undo the move that led here.
+            choice.pop()
+            if not actions:
+                break
+            actions.pop()
+            board.slide(blanks.pop())
+            h -= deltas.pop()
+            g -= 1
+            continue
+        choice[-1] = i + 1
+        target, action = candidates[i]
+        if blanks and target == blanks[-1]:
+            continue
+        delta = heuristic_delta(board, target)
+        f = g + 1 + h + delta
+        if f > threshold:
+            if f < next_threshold:
+                next_threshold = f
+            continue
+
+        blanks.append(board.blank)
+        board.slide(target)
+        actions.append(action)
+        deltas.append(delta)
+        h += delta
+        g += 1
+        nodes_expanded += 1
+        if g > max_search_depth:
+            max_search_depth = g
+        if trace is not None:
+            trace(board.packed, g, h)
+        if board.is_goal():
+            return actions, next_threshold, nodes_expanded, max_search_depth
+        if shortcuts is not None and board.packed in shortcuts:
+            f = g + shortcuts[board.packed]
+            if f <= threshold:
+                return actions, next_threshold, nodes_expanded, max_search_depth
+            if f < next_threshold:
+                next_threshold = f
+            actions.pop()
+            board.slide(blanks.pop())
+            h -= deltas.pop()
+            g -= 1
+            continue
+        if nodes_expanded >= poll:
+            poll += STOP_POLL
+            if stop is not None and stop.is_set():
+                break
+            if progress is not None:
+                progress(nodes_expanded, g)
+        choice.append(0)
+
+    return None, next_threshold, nodes_expanded, max_search_depth
+
+
+
+def IDA_STAR(initial_state, heuristic, heuristic_delta, shortcuts=None):
+    """IDA* search on a single board modified in place, with O(depth) memory.
+    The heuristic of each move is derived from the previous one through heuristic_delta.
+    With shortcuts (see bounded_search) the final state may be a state of shortcuts instead of the goal."""
     threshold = heuristic(initial_state)
-    
-    def generator():
-        while True:
-            yield
-    
-    for _ in tqdm(generator()):
-        explored.clear()
-        result = search(initial_state, heuristic, initial_state.cost, threshold)
-        if result[0] == "cutoff":
-            threshold = result[1]
-        elif result == "failure":
-            logging.info(log)
-            return None
-        else:
-            logging.info(log)
-            return (result[1], result[2], result[3])
-    
-
-def search(state, heuristic, g, threshold, nodes_expanded = 0, max_search_depth = 0):
-    global log
-    global explored
-    
-    log += f"****** State with threshold = {threshold}******\n"
-    log = state.display(log)
-    
-    if state.is_goal():
-        logging.info(log)
-        return ("found", state, nodes_expanded, max_search_depth)
-        
-    estimated_cost = g + heuristic(state)
-    
-    if estimated_cost > threshold:
-        log += f"Estimated cost = {estimated_cost} > threshold = {threshold}\n"
-        log += ("/"*50) + "\n"
-        return ("cutoff", estimated_cost)
-    
-    min = float("inf")
-    for neigbhor in state.expand(RLDU = False):
-        if neigbhor not in explored:
-            explored.add(neigbhor)
-            if neigbhor.cost > max_search_depth:
-                max_search_depth = neigbhor.cost
-            result = search(neigbhor, heuristic, neigbhor.cost, threshold, nodes_expanded+1, max_search_depth)
-            if result[0] == "found":
-                return result
-            elif result[0] == "cutoff":
-                if result[1] < min:
-                    min = result[1]
-        
-    if min == float("inf"):
-        return "failure"
-    return ("cutoff", min)
\ No newline at end of file
+    board = MutableBoard(initial_state)
+    moves = successors(initial_state.n)
+    nodes_expanded = 0
+    max_search_depth = 0
+    tracer = get_tracer()
+    trace = tracer.start("IDA*", initial_state) if tracer is not None else None
+    progress = get_progress()
+    report = None
+    if progress is not None:
+        def report(expanded, depth):
+            progress.update(nodes_expanded + expanded, depth, 0, threshold)
+
+    while threshold != float("inf"):
+        actions, next_threshold, expanded, depth = bounded_search(board, initial_state.h, initial_state.cost, threshold, heuristic_delta, moves,
+                                                                  trace=trace, progress=report, shortcuts=shortcuts)
+        nodes_expanded += expanded
+        max_search_depth = max(max_search_depth, depth)
+        logging.info(f"IDA* threshold = {threshold}: {expanded} nodes expanded")
+        if tracer is not None:
+            tracer.event("threshold", threshold=threshold, nodes_expanded=expanded)
+        if progress is not None:
+            progress.update(nodes_expanded, 0, 0, next_threshold)
+        if actions is not None:
+            return (replay(initial_state, actions), nodes_expanded, max_search_depth)
+        threshold = next_threshold
+    return None
@@ -0,0 +1,183 @@
+# description: Level-synchronous breadth first search on arrays of packed states
+# author: Seminara Luigi
+# date: 2023-02-24
+# tags: python, BFS, numpy, vectorized, layers, search, algorithm
+
+import sys
+import logging
+import argparse
+import numpy as np
+from puzzle.puzzle_state import PuzzleState, unpack_config
+from utils.BA_STAR import action_name
+from utils.IDA_STAR import replay
+from utils.state_table import move_offsets
+from utils.tracing import get_tracer
+from utils.progress import get_progress
+
+# A layer is a sorted array of packed states (4 bits per tile, see puzzle.puzzle_state.pack_config),
+# so only the boards up to 4x4 fit in the uint64 of an array.
+MAX_SIZE = 4
+NIBBLE = np.uint64(15)
+
+
+
+def blanks_of(layer, n):
+    """
+        It returns the position of the blank of every state of a layer.
+
+        Args:
+            layer: this is the array of the packed states.
+            n: this is the dimension of the puzzle.
+    """
+    blanks = np.zeros(len(layer), dtype=np.int64)
+    for i in range(1, n * n):
+        blanks[((layer >> np.uint64(4 * i)) & NIBBLE) == 0] = i
+    return blanks
+
+
+
+def successors(layer, n):
+    """
+        It returns the successors of every state of a layer, moving the tile next to the blank with shifts and masks.
+
+        Args:
+            layer: this is the array of the packed states.
+            n: this is the dimension of the puzzle.
+
+        Returns:
+            numpy.ndarray: the packed successors, with duplicates.
+    """
+    blanks = blanks_of(layer, n)
+    rows, cols = blanks // n, blanks % n
+    legal = (rows > 0, rows < n - 1, cols > 0, cols < n - 1)
+    children = []
+    for code, offset in enumerate(move_offsets(n)):
+        packed = layer[legal[code]]
+        # The bit offsets of the blank and of the tile it swaps with.
+        blank = (blanks[legal[code]] * 4).astype(np.uint64)
+        target = ((blanks[legal[code]] + offset) * 4).astype(np.uint64)
+        tile = (packed >> target) & NIBBLE
+        children.append(packed ^ (tile << target) ^ (tile << blank))
+    return np.concatenate(children)
+
+
+
+def layers(initial_state, max_depth=None):
+    """
+        It enumerates the states reachable from the initial state, layer by layer. A layer is the sorted array of
+        the successors of the previous one without duplicates and without the states of the two layers before it:
+        a move always changes the distance from the root by one, so a state reached again lies in one of them.
+
+        Args:
+            initial_state: this is the initial state of the puzzle.
+            max_depth: this is the depth of the last layer. Defaults to None (every reachable state).
+
+        Returns:
+            generator: the tuples (depth, layer).
+
+        Raises:
+            NotImplementedError: if the board is bigger than MAX_SIZE x MAX_SIZE.
+    """
+    n = initial_state.n
+    if n > MAX_SIZE:
+        raise NotImplementedError(f"LayerBFS only supports boards up to {MAX_SIZE}x{MAX_SIZE}.")
+    previous = np.zeros(0, dtype=np.uint64)
+    layer = np.array([initial_state.packed], dtype=np.uint64)
+    depth = 0
+    while len(layer):
+        yield depth, layer
+        if depth == max_depth:
+            return
+        following = np.unique(successors(layer, n))
+        following = np.setdiff1d(following, layer, assume_unique=True)
+        following = np.setdiff1d(following, previous, assume_unique=True)
+        previous, layer = layer, following
+        depth += 1
+
+
+
+def contains(layer, packed):
+    """ It checks if a packed state is in a sorted layer. """
+    i = np.searchsorted(layer, np.uint64(packed))
+    return i < len(layer) and layer[i] == packed
+
+
+
+def path(history, packed, n):
+    """
+        It rebuilds the actions of a shortest path to a state by looking up, layer by layer towards the root,
+        a neighbour of the current state in the layer before it.
+
+        Args:
+            history: this is the list of the layers from the root to the layer of the state.
+            packed: this is the packed state.
+            n: this is the dimension of the puzzle.
+
+        Returns:
+            list: the actions from the root to the state.
+    """
+    actions = []
+    blank = unpack_config(packed, n).index(0)
+    for layer in reversed(history[:-1]):
+        for offset in move_offsets(n):
+            target = blank + offset
+            if not 0 <= target < n * n or (abs(offset) == 1 and target // n != blank // n):
+                continue
+            tile = (packed >> (4 * target)) & 15
+            parent = packed ^ (tile << (4 * target)) ^ (tile << (4 * blank))
+            if contains(layer, parent):
+                actions.append(action_name(target, blank, n))
+                packed, blank = parent, target
+                break
+    actions.reverse()
+    return actions
+
+
+
+def LAYER_BFS(initial_state):
+    """Level-synchronous BFS: every layer is a NumPy array of packed states, its successors are generated with
+    vectorized shifts and masks and deduplicated by sorting (see layers). All the layers are kept to rebuild the
+    path once the goal is found, 8 bytes per state. The size of every layer is logged."""
+    goal = initial_state.goal_packed
+    n = initial_state.n
+    history = []
+    nodes_expanded = 0
+    tracer = get_tracer()
+    progress = get_progress()
+    record = tracer.start("LayerBFS", initial_state) if tracer is not None else None
+
+    for depth, layer in layers(initial_state):
+        history.append(layer)
+        logging.info(f"LayerBFS layer {depth}: {len(layer)} states")
+        if tracer is not None:
+            tracer.event("layer", depth=depth, states=len(layer))
+        if record is not None:
+            for packed in layer.tolist():
+                record(packed, depth, None)
+        if contains(layer, goal):
+            return (replay(initial_state, path(history, goal, n)), nodes_expanded, depth)
+        nodes_expanded += len(layer)
+        if progress is not None:
+            progress.update(nodes_expanded, len(layer), nodes_expanded - len(layer), depth)
+    return None
+
+
+
+def main(argv=None):
+    """ It prints the number of states at every depth from the goal of a puzzle size. """
+    parser = argparse.ArgumentParser(description="Count the states at every depth from the goal with a level-synchronous BFS.")
+    parser.add_argument("--ps", type=int, help="Size of the puzzle (e.g. 3 for a 3x3 puzzle)", default=3)
+    parser.add_argument("--depth", type=int, help="Depth of the last layer. Defaults to every reachable state", default=None)
+    args = parser.parse_args(argv)
+
+    goal = tuple(range(1, args.ps * args.ps)) + (0,)
+    total = 0
+    for depth, layer in layers(PuzzleState(goal, args.ps, goal, None), args.depth):
+        total += len(layer)
+        print(f"{depth}\t{len(layer)}\t{total}", flush=True)
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
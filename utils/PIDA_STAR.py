@@ -0,0 +1,160 @@
+# description: Parallel IDA* search algorithm
+# author: Seminara Luigi
+# date: 2023-02-09
+# tags: python, IDA*, parallel, multiprocessing, search, algorithm
+
+import os
+import logging
+import multiprocessing
+from puzzle.puzzle_state import PuzzleState, MutableBoard
+from utils.IDA_STAR import bounded_search, successors, replay
+from utils.tracing import get_tracer
+from utils.progress import get_progress
+
+# Number of frontier nodes the root is expanded to before the subtrees are distributed to the workers.
+FRONTIER_SIZE = 2000
+
+# State of a worker process, filled by init_worker.
+_worker = {}
+
+
+
+def init_worker(config, n, goal, heuristic_delta, stop):
+    """
+        It initializes a worker process.
+
+        Args:
+            config: this is the initial configuration of the puzzle.
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            heuristic_delta: this is the function returning the change of h for a move.
+            stop: this is the multiprocessing.Event set when a solution has been found.
+    """
+    _worker["root"] = PuzzleState(config, n, goal, None)
+    _worker["moves"] = successors(n)
+    _worker["heuristic_delta"] = heuristic_delta
+    _worker["stop"] = stop
+
+
+
+def search_subtree(task):
+    """
+        It runs a bounded search of the subtree of a frontier node.
+
+        Args:
+            task: this is the tuple (frontier index, positions of the blank from the root to the node, h, threshold).
+
+        Returns:
+            tuple: the frontier index followed by the result of bounded_search.
+    """
+    index, path, h, threshold = task
+    stop = _worker["stop"]
+    if stop.is_set():
+        return (index, None, float("inf"), 0, 0)
+    board = MutableBoard(_worker["root"])
+    for blank in path[1:]:
+        board.slide(blank)
+    result = bounded_search(board, h, len(path) - 1, threshold, _worker["heuristic_delta"], _worker["moves"], path[:-1], stop)
+    return (index,) + result
+
+
+
+def blank_path(state):
+    """
+        It returns the positions of the blank from the root to the state.
+
+        Args:
+            state: this is the state of the puzzle.
+    """
+    path = []
+    while state is not None:
+        path.append(state.blank)
+        state = state.parent
+    path.reverse()
+    return path
+
+
+
+def split_frontier(initial_state, heuristic_delta, size):
+    """
+        It expands the root breadth-first, without moving the blank straight back, until the
+        frontier holds at least size nodes.
+
+        Args:
+            initial_state: this is the initial state of the puzzle, with h already evaluated.
+            heuristic_delta: this is the function returning the change of h for a move.
+            size: this is the minimum number of frontier nodes.
+
+        Returns:
+            tuple: the frontier, the goal state if it is in the first layers (else None) and the number of nodes expanded.
+    """
+    layer = [initial_state]
+    nodes_expanded = 0
+    while True:
+        for state in layer:
+            if state.is_goal():
+                return layer, state, nodes_expanded
+        if len(layer) >= size:
+            return layer, None, nodes_expanded
+        next_layer = []
+        for state in layer:
+            nodes_expanded += 1
+            for child in state.expand(RLDU = False):
+                if state.parent is not None and child.blank == state.parent.blank:
+                    continue
+                child.h = state.h + heuristic_delta(state, child.blank)
+                next_layer.append(child)
+        layer = next_layer
+
+
+
+def PIDA_STAR(initial_state, heuristic, heuristic_delta, workers=None, frontier_size=FRONTIER_SIZE):
+    """Parallel IDA* search: the root is split in frontier_size subtrees that are searched by a
+    pool of workers (defaults to one per core) for every threshold. The threshold iterations are
+    synchronized and the workers are stopped as soon as one of them reaches the goal, which is
+    optimal because every smaller threshold failed.
+    The workers run in other processes, so only the threshold events are traced."""
+    threshold = heuristic(initial_state)
+    frontier, goal_state, nodes_expanded = split_frontier(initial_state, heuristic_delta, frontier_size)
+    max_search_depth = frontier[0].cost
+    if goal_state is not None:
+        return (goal_state, nodes_expanded, max_search_depth)
+    paths = [blank_path(state) for state in frontier]
+    progress = get_progress()
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.start("PIDA*", initial_state)
+
+    stop = multiprocessing.Event()
+    initargs = (initial_state.config, initial_state.n, initial_state.goal, heuristic_delta, stop)
+    with multiprocessing.Pool(workers or os.cpu_count() or 1, initializer=init_worker, initargs=initargs) as pool:
+
+        while threshold != float("inf"):
+            stop.clear()
+            next_threshold = float("inf")
+            tasks = []
+            for i, state in enumerate(frontier):
+                f = state.cost + state.h
+                if f > threshold:
+                    next_threshold = min(next_threshold, f)
+                else:
+                    tasks.append((i, paths[i], state.h, threshold))
+
+            solution = None
+            for index, actions, bound, expanded, depth in pool.imap_unordered(search_subtree, tasks, chunksize=4):
+                nodes_expanded += expanded
+                max_search_depth = max(max_search_depth, depth)
+                next_threshold = min(next_threshold, bound)
+                if progress is not None:
+                    progress.update(nodes_expanded, len(tasks), 0, threshold)
+                if actions is not None:
+                    stop.set()
+                    solution = replay(frontier[index], actions)
+                    break
+            logging.info(f"PIDA* threshold = {threshold}: {nodes_expanded} nodes expanded so far")
+            if tracer is not None:
+                tracer.event("threshold", threshold=threshold, nodes_expanded=nodes_expanded)
+            if solution is not None:
+                return (solution, nodes_expanded, max_search_depth)
+            threshold = next_threshold
+    return None
@@ -0,0 +1,236 @@
+# description: Benchmark of the search algorithms over the experiments
+# author: Seminara Luigi
+# date: 2023-02-17
+# tags: python, benchmark, experiments, regression, multiprocessing
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import logging
+import argparse
+import resource
+import multiprocessing
+from puzzle.puzzle_solver import PuzzleSolver, ALGORITHMS, INFORMED_ALGORITHMS, HEURISTICS, BATCH_HEURISTICS
+
+# Every run is a child process in its own process group, killed when it exceeds the time limit and
+# started with its address space limited to the memory limit.
+DEFAULT_EXPERIMENTS = "./experiments/*.txt"
+DEFAULT_TIME_LIMIT = 60
+DEFAULT_SETUP_LIMIT = 1800
+DEFAULT_MEMORY_LIMIT = 2048
+BENCHMARK_VERSION = 1
+
+# A metric regresses when it grows by more than the tolerance over the baseline and by more than its
+# noise floor (times under 50ms and memory under 16MB are dominated by noise).
+DEFAULT_TOLERANCE = 0.25
+COMPARED_METRICS = {"nodes_expanded": 0, "wall_time": 0.05, "peak_memory_mb": 16}
+
+
+
+def read_experiment(path):
+    """
+        It reads an experiment file, the tiles separated by blanks with 0 as the blank tile.
+
+        Args:
+            path: this is the path of the experiment.
+
+        Returns:
+            tuple: the configuration of the puzzle and its dimension.
+    """
+    with open(path) as file:
+        config = [int(tile) for tile in file.read().split()]
+    return config, int(len(config) ** 0.5)
+
+
+
+def combinations(algorithms, heuristics):
+    """
+        It returns the (algorithm, heuristic) pairs to run: every informed algorithm with every
+        heuristic it supports, the uninformed ones without heuristic.
+
+        Args:
+            algorithms: this is the list of the algorithms.
+            heuristics: this is the list of the heuristics.
+    """
+    pairs = []
+    for algorithm in algorithms:
+        if algorithm in INFORMED_ALGORITHMS:
+            pairs += [(algorithm, heuristic) for heuristic in heuristics if algorithm != 'BatchA*' or heuristic in BATCH_HEURISTICS]
+        else:
+            pairs.append((algorithm, None))
+    return pairs
+
+
+
+def run_case(path, algorithm, heuristic, memory_limit, connection):
+    """
+        It solves an experiment in the current process and sends its record through connection. The tables of the
+        heuristic (distance tables, walking distance, pattern database) are built or loaded first, by evaluating the
+        initial state, then None is sent to start the timer of the run and the search begins.
+
+        Args:
+            path: this is the path of the experiment.
+            algorithm: this is the search algorithm.
+            heuristic: this is the heuristic, None for the uninformed algorithms.
+            memory_limit: this is the limit of the address space in MB.
+            connection: this is the end of the pipe the record is sent to.
+    """
+    os.setpgrp()
+    limit = memory_limit * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    logging.disable(logging.CRITICAL)
+    record = {}
+    try:
+        config, n = read_experiment(path)
+        solver = PuzzleSolver(config, list(range(1, n * n)) + [0], algorithm, heuristic)
+        if solver.heuristic_name is not None:
+            solver.calculate_total_cost(solver.puzzle_state)
+            backward = solver.backward_heuristic()
+            if backward is not None:
+                backward[0](solver.goal_state())
+        connection.send(None)
+        start_time = time.perf_counter()
+        results = solver.search()
+        wall_time = time.perf_counter() - start_time
+        record["wall_time"] = wall_time
+        if results is None:
+            record["status"] = "unsolvable" if not solver.analysis.solvable else "failed"
+        else:
+            final_state, nodes_expanded, _ = results
+            record.update(status="solved", solution_length=final_state.cost, nodes_expanded=nodes_expanded,
+                          nodes_per_second=nodes_expanded / wall_time if wall_time > 0 else 0.0)
+    except MemoryError:
+        record["status"] = "memory"
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["peak_memory_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    connection.send(record)
+
+
+
+def run_benchmark(paths, pairs, time_limit=DEFAULT_TIME_LIMIT, memory_limit=DEFAULT_MEMORY_LIMIT, setup_limit=DEFAULT_SETUP_LIMIT):
+    """
+        It runs every pair on every experiment, one child process per run. The time limit of a run starts
+        once its heuristic tables are ready (see run_case), their building is bounded by setup_limit.
+
+        Args:
+            paths: this is the list of the paths of the experiments.
+            pairs: this is the list of the (algorithm, heuristic) pairs.
+            time_limit: this is the limit of a run in seconds. Defaults to DEFAULT_TIME_LIMIT.
+            memory_limit: this is the limit of a run in MB. Defaults to DEFAULT_MEMORY_LIMIT.
+            setup_limit: this is the limit of the building of the tables of a run in seconds. Defaults to DEFAULT_SETUP_LIMIT.
+
+        Returns:
+            list: the records of the runs.
+    """
+    records = []
+    for path in paths:
+        for algorithm, heuristic in pairs:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=run_case, args=(path, algorithm, heuristic, memory_limit, sender))
+            process.start()
+            sender.close()
+            record = {"instance": os.path.basename(path), "algorithm": algorithm, "heuristic": heuristic}
+            crashed = False
+            try:
+                message = receiver.recv() if receiver.poll(setup_limit) else {"status": "timeout", "wall_time": time_limit}
+                if message is None:
+                    # The tables are ready: the run starts now.
+                    if receiver.poll(time_limit):
+                        message = receiver.recv()
+                    else:
+                        message = {"status": "timeout", "wall_time": time_limit}
+                record.update(message)
+            except EOFError:
+                crashed = True
+            # The whole group is killed, so the workers of the parallel algorithms do not outlive a timeout.
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                process.kill()
+            process.join()
+            receiver.close()
+            if crashed:
+                # The process died without sending its record, e.g. killed by the kernel when it ran out of memory.
+                record["status"] = "memory" if process.exitcode == -signal.SIGKILL else "error"
+            logging.info(f"{record['instance']} {algorithm} {heuristic}: {record['status']} {record.get('wall_time', 0):.2f}s")
+            records.append(record)
+    return records
+
+
+
+def record_key(record):
+    """ It returns the key identifying the run of a record. """
+    return (record["instance"], record["algorithm"], record["heuristic"])
+
+
+
+def compare(records, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+        It compares the records with the records of a baseline run.
+
+        Args:
+            records: this is the list of the records.
+            baseline: this is the list of the records of the baseline.
+            tolerance: this is the relative growth of a metric over the baseline that is tolerated. Defaults to DEFAULT_TOLERANCE.
+
+        Returns:
+            list: the regressions, dicts with the key of the run, the metric, the baseline value and the new value.
+    """
+    previous = {record_key(record): record for record in baseline}
+    regressions = []
+    for record in records:
+        old = previous.get(record_key(record))
+        if old is None or old["status"] != "solved":
+            continue
+        key = dict(zip(("instance", "algorithm", "heuristic"), record_key(record)))
+        if record["status"] != "solved":
+            regressions.append(dict(key, metric="status", baseline=old["status"], value=record["status"]))
+            continue
+        if record["solution_length"] != old["solution_length"]:
+            regressions.append(dict(key, metric="solution_length", baseline=old["solution_length"], value=record["solution_length"]))
+        for metric, floor in COMPARED_METRICS.items():
+            if record[metric] > old[metric] * (1 + tolerance) and record[metric] - old[metric] > floor:
+                regressions.append(dict(key, metric=metric, baseline=old[metric], value=record[metric]))
+    return regressions
+
+
+
+def main(argv=None):
+    """ It runs the benchmark from the command line. """
+    parser = argparse.ArgumentParser(description="Benchmark the search algorithms over the experiments.")
+    parser.add_argument("--experiments", type=str, help="Glob of the experiment files", default=DEFAULT_EXPERIMENTS)
+    parser.add_argument("--algorithms", type=str, help="Algorithms separated by commas. Defaults to all of them", default=",".join(ALGORITHMS))
+    parser.add_argument("--heuristics", type=str, help="Heuristics of the informed algorithms separated by commas. Defaults to all of them", default=",".join(HEURISTICS))
+    parser.add_argument("--time-limit", type=float, help="Time limit of a run in seconds", default=DEFAULT_TIME_LIMIT)
+    parser.add_argument("--memory-limit", type=int, help="Memory limit of a run in MB", default=DEFAULT_MEMORY_LIMIT)
+    parser.add_argument("--setup-limit", type=float, help="Time limit of the building of the heuristic tables of a run in seconds", default=DEFAULT_SETUP_LIMIT)
+    parser.add_argument("--output", type=str, help="Path of the JSON results", default="benchmark.json")
+    parser.add_argument("--baseline", type=str, help="Path of the JSON results of a previous run to compare with", default=None)
+    parser.add_argument("--tolerance", type=float, help="Relative growth of a metric tolerated over the baseline", default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s %(message)s', level=logging.INFO)
+    paths = sorted(glob.glob(args.experiments))
+    pairs = combinations(args.algorithms.split(","), args.heuristics.split(","))
+    records = run_benchmark(paths, pairs, args.time_limit, args.memory_limit, args.setup_limit)
+    with open(args.output, "w") as file:
+        json.dump({"version": BENCHMARK_VERSION, "time_limit": args.time_limit, "memory_limit": args.memory_limit,
+                   "results": records}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(records, json.load(file)["results"], args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['instance']} {r['algorithm']} {r['heuristic']}: {r['metric']} {r['baseline']} -> {r['value']}")
+        if regressions:
+            return 1
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,41 @@
 # description: This file contains the distance metrics used in the A* algorithm
 # author: Seminara Luigi
 # date: 2023-01-18
-# tags: python, distance, manhattan, euclidean, linear_conflict, misplaced_tiles, linear_manhattan_conflict
+# tags: python, distance, manhattan, euclidean, linear_conflict, misplaced_tiles, linear_manhattan_conflict, walking_distance
 
+import os
 import math
+import bisect
+import struct
+import logging
+from puzzle.puzzle_state import tile_bits, MutableBoard
+
+
+# Cache of the DistanceTables, shared by every solver and keyed by (size, packed goal).
+_distance_tables = {}
+
+# Cache of the walking distance tables, keyed by (size, goal line of the blank).
+_walking_distances = {}
+
+# Default directory of the walking distance files. Binary format of a file (all integers are little endian):
+#   header: magic (4s), version (H), n (B), goal line of the blank (B), number of entries (Q)
+#   codes:  the sorted codes of the entries (see walking_distance_code), code_bytes(n) bytes each
+#   values: one byte per entry, the walking distance of the code
+WALKING_DISTANCE_DIRECTORY = "./wd"
+WD_MAGIC = b"NPWD"
+WD_VERSION = 1
+WD_HEADER = struct.Struct("<4sHBBQ")
+
+# Largest board with walking distance tables: the 5x5 tables take minutes to build and gigabytes as a dict.
+WALKING_DISTANCE_MAX_SIZE = 4
+
+# Largest number of states whose walking distance codes are remembered for walking_distance_delta,
+# the memory is emptied when it is full.
+WALKING_DISTANCE_MEMORY = 1 << 16
+
+# Largest number of line signatures of the linear conflict computed ahead (up to 5x5), the signatures of bigger
+# boards are evaluated the first time they are met.
+LINE_CONFLICT_TABLE_LIMIT = 1 << 16
 
 
 def manhattan_distance(point1_x, point1_y, point2_x, point2_y):
@@ -29,30 +61,306 @@ def eculidean_distance(point1_x, point1_y, point2_x, point2_y):
 
 
 
+class DistanceTables(object):
+    """
+        Precomputed lookup tables for a board size and a goal configuration.
+        The tables are indexed as [tile][position] so that a heuristic becomes a sum of lookups.
+    """
+
+    def __init__(self, n, goal):
+        """
+            The constructor of the DistanceTables class.
+
+            Args:
+                n: this is the dimension of the puzzle.
+                goal: this is the goal state of the puzzle.
+        """
+        size = n * n
+        self.n = n
+        self.goal = tuple(goal)
+
+        # Goal position of every tile.
+        self.goal_position = [0] * size
+        for i, item in enumerate(self.goal):
+            self.goal_position[item] = i
+
+        # Distance of every tile from its goal position, for every position of the board.
+        self.manhattan = []
+        self.euclidean = []
+        self.misplaced = []
+        for tile in range(size):
+            goal_row, goal_col = self.goal_position[tile] // n, self.goal_position[tile] % n
+            self.manhattan.append([manhattan_distance(i // n, i % n, goal_row, goal_col) for i in range(size)])
+            self.euclidean.append([eculidean_distance(i // n, i % n, goal_row, goal_col) for i in range(size)])
+            self.misplaced.append([int(tile != self.goal[i]) for i in range(size)])
+
+        # Manhattan distance of the tiles alone, the moves of the blank are not counted.
+        self.tile_manhattan = [[0] * size] + self.manhattan[1:]
+
+        # Linear conflict signatures (see line_conflict_moves): the signature of a row is the sum of the lookups
+        # of its positions in row_signature, the one of a column in col_signature.
+        base = n + 1
+        self.rows = [range(i*n, (i+1)*n) for i in range(n)]
+        self.cols = [range(i, size, n) for i in range(n)]
+        self.row_signature = [[n * base ** (i % n) for i in range(size)]]
+        self.col_signature = [[n * base ** (i // n) for i in range(size)]]
+        for tile in range(1, size):
+            goal_row, goal_col = self.goal_position[tile] // n, self.goal_position[tile] % n
+            self.row_signature.append([(goal_col if goal_row == i // n else n) * base ** (i % n) for i in range(size)])
+            self.col_signature.append([(goal_row if goal_col == i % n else n) * base ** (i // n) for i in range(size)])
+        self.line_conflicts = line_conflict_table(n)
+
+        # Walking distance codes by rows and by columns: the code of a state is the sum of the lookups
+        # of its tiles (see walking_distance_code), so it is updated by a move like the other tables.
+        bits = n.bit_length()
+        self.blank_row, self.blank_col = self.goal_position[0] // n, self.goal_position[0] % n
+        self.walking_codes = {}
+        self.row_code = [[(i // n) << (bits * size) for i in range(size)]]
+        self.col_code = [[(i % n) << (bits * size) for i in range(size)]]
+        for tile in range(1, size):
+            goal_row, goal_col = self.goal_position[tile] // n, self.goal_position[tile] % n
+            self.row_code.append([1 << (bits * ((i // n) * n + goal_row)) for i in range(size)])
+            self.col_code.append([1 << (bits * ((i % n) * n + goal_col)) for i in range(size)])
+
+
+
+def get_distance_tables(state):
+    """ 
+        It returns the DistanceTables of the state's size and goal, building them on the first request
+            @param state: the state of the puzzle
+    """
+    key = (state.n, state.goal_packed)
+    tables = _distance_tables.get(key)
+    if tables is None:
+        tables = _distance_tables[key] = DistanceTables(state.n, state.goal)
+    return tables
+
+
+
+def walking_distance_code(counts, blank, n):
+    """ 
+        It packs a state of the walking distance in an integer. The relaxed puzzle only knows, for every line
+        (row or column) of the board, how many of its tiles belong to every goal line, and the line of the blank:
+        a move takes a tile from a line next to the blank to the line of the blank. The count of the tiles of line
+        r whose goal line is g is stored in the bit field of index r*n+g, the line of the blank above them all.
+            @param counts: the n x n matrix of the counts, by line and goal line
+            @param blank: the line of the blank
+            @param n: the dimension of the puzzle
+    """
+    bits = n.bit_length()
+    code = blank << (bits * n * n)
+    for r in range(n):
+        for g in range(n):
+            code |= counts[r][g] << (bits * (r * n + g))
+    return code
+
+
+
+def code_bytes(n):
+    """ 
+        It is the number of bytes of a walking distance code in a file
+            @param n: the dimension of the puzzle
+    """
+    return (n.bit_length() * n * n + (n - 1).bit_length() + 7) // 8
+
+
+
+def build_walking_distance(n, line):
+    """ 
+        It builds the walking distance table by a breadth-first search from the goal of the relaxed puzzle
+        (see walking_distance_code), whose lines hold their own tiles and the blank is in its goal line.
+            @param n: the dimension of the puzzle
+            @param line: the goal line of the blank
+            @return: the dict of the walking distance of every reachable code
+    """
+    bits = n.bit_length()
+    mask = (1 << bits) - 1
+    shift = bits * n * n
+    goal = walking_distance_code([[(n - (r == line)) * (r == g) for g in range(n)] for r in range(n)], line, n)
+    table = {goal: 0}
+    layer = [goal]
+    distance = 0
+    while layer:
+        distance += 1
+        following = []
+        for code in layer:
+            blank = code >> shift
+            for r in (blank - 1, blank + 1):
+                if not 0 <= r < n:
+                    continue
+                for g in range(n):
+                    if (code >> (bits * (r * n + g))) & mask:
+                        # A tile of line r with goal line g moves to the line of the blank, the blank to line r.
+                        child = code - (1 << (bits * (r * n + g))) + (1 << (bits * (blank * n + g))) + ((r - blank) << shift)
+                        if child not in table:
+                            table[child] = distance
+                            following.append(child)
+        layer = following
+    return table
+
+
+
+def walking_distance_path(n, line):
+    """ 
+        It is the default path of the walking distance file of a board size and goal line of the blank
+            @param n: the dimension of the puzzle
+            @param line: the goal line of the blank
+    """
+    return os.path.join(WALKING_DISTANCE_DIRECTORY, f"{n}x{n}_{line}.wd")
+
+
+
+def save_walking_distance(path, n, line, table):
+    """ 
+        It writes a walking distance file
+            @param path: the path of the file
+            @param n: the dimension of the puzzle
+            @param line: the goal line of the blank
+            @param table: the result of build_walking_distance
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    width = code_bytes(n)
+    codes = sorted(table)
+    # Each process writes its own temporary file, as for the pattern databases.
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(WD_HEADER.pack(WD_MAGIC, WD_VERSION, n, line, len(codes)))
+        file.write(b"".join(code.to_bytes(width, "little") for code in codes))
+        file.write(bytes(table[code] for code in codes))
+    os.replace(temporary, path)
+
+
+
+def load_walking_distance(path, n, line):
+    """ 
+        It reads a walking distance file, it raises ValueError if it is not the file of n and line
+            @param path: the path of the file
+            @param n: the dimension of the puzzle
+            @param line: the goal line of the blank
+            @return: the dict of the walking distance of every code
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version, size, blank, count = WD_HEADER.unpack_from(data, 0)
+    if magic != WD_MAGIC or version != WD_VERSION or (size, blank) != (n, line):
+        raise ValueError(f"{path} is not a walking distance file of version {WD_VERSION} for a {n}x{n} puzzle.")
+    width = code_bytes(n)
+    start = WD_HEADER.size
+    values = data[start + count * width:]
+    return {int.from_bytes(data[start + i * width:start + (i + 1) * width], "little"): values[i] for i in range(count)}
+
+
+
+def get_walking_distance(n, line):
+    """ 
+        It returns the walking distance table of a board size and goal line of the blank. The table is loaded
+        from WALKING_DISTANCE_DIRECTORY, it is built and saved on the first request when the file does not exist.
+        It raises NotImplementedError for the boards bigger than WALKING_DISTANCE_MAX_SIZE
+            @param n: the dimension of the puzzle
+            @param line: the goal line of the blank
+    """
+    key = (n, line)
+    table = _walking_distances.get(key)
+    if table is None:
+        if n > WALKING_DISTANCE_MAX_SIZE:
+            raise NotImplementedError(f"No walking distance tables for a {n}x{n} puzzle, they are built up to {WALKING_DISTANCE_MAX_SIZE}x{WALKING_DISTANCE_MAX_SIZE}.")
+        path = walking_distance_path(n, line)
+        if os.path.exists(path):
+            table = load_walking_distance(path, n, line)
+        else:
+            logging.info(f"Building the walking distance table {path}")
+            table = build_walking_distance(n, line)
+            save_walking_distance(path, n, line, table)
+        _walking_distances[key] = table
+    return table
+
+
+
+def table_sum(table, state):
+    """ 
+        It is the sum of the table lookups of every tile of the state
+            @param table: a [tile][position] table of DistanceTables
+            @param state: the state of the puzzle
+    """
+    return sum(table[item][i] for i, item in enumerate(state.config))
+
+
+
+def line_conflict_moves(signature, n):
+    """ 
+        It is the number of extra moves of the linear conflict of a line (row or column). The signature of a line
+        is a number in base n+1 whose digit j is the goal position, along the line, of the tile at position j when
+        its goal is in the line, n for the other tiles and the blank. The tiles in their goal line that are not
+        in the longest increasing sequence of goal positions must leave the line and come back, 2 moves each,
+        and no smaller set of tiles resolves every conflict
+            @param signature: the signature of the line
+            @param n: the dimension of the puzzle
+    """
+    tiles = 0
+    # Smallest last goal position of an increasing sequence of every length (patience sorting).
+    tails = []
+    for _ in range(n):
+        signature, position = divmod(signature, n + 1)
+        if position < n:
+            tiles += 1
+            i = bisect.bisect_left(tails, position)
+            if i == len(tails):
+                tails.append(position)
+            else:
+                tails[i] = position
+    return 2 * (tiles - len(tails))
+
+
+
+class LineConflicts(dict):
+    """
+        The extra moves of the linear conflict by line signature, evaluated the first time a signature is read.
+        It replaces the list of line_conflict_table on the boards with too many signatures to compute them ahead.
+    """
+
+    def __init__(self, n):
+        """
+            The constructor of the LineConflicts class.
+
+            Args:
+                n: this is the dimension of the puzzle.
+        """
+        super().__init__()
+        self.n = n
+
+
+
+    def __missing__(self, signature):
+        moves = self[signature] = line_conflict_moves(signature, self.n)
+        return moves
+
+
+
+def line_conflict_table(n):
+    """ 
+        It returns the extra moves of the linear conflict of every line signature, a list indexed by signature
+        or a LineConflicts when there are more than LINE_CONFLICT_TABLE_LIMIT signatures
+            @param n: the dimension of the puzzle
+    """
+    if (n + 1) ** n > LINE_CONFLICT_TABLE_LIMIT:
+        return LineConflicts(n)
+    return [line_conflict_moves(signature, n) for signature in range((n + 1) ** n)]
+
+
+
 def linear_conflict_single(state):
     """ 
-        It is the sum of the linear conflicts in each row and column 
+        It is the sum of the linear conflicts in each row and column, read from the table of the line signatures
             @param state: the state of the puzzle
     """
-    n = state.n
     config = state.config
-    goal = state.goal
-    linear_conflicts = 0
-    # Linear Conflict in rows
-    for i in range(n):
-        row = config[i*n:(i+1)*n]
-        goal_row = goal[i*n:(i+1)*n]
-        for j in range(n):
-            if row[j] in goal_row[j+1:]:
-                linear_conflicts += 2
-    # Linear Conflict in columns
-    for i in range(n):
-        col = config[i::n]
-        goal_col = goal[i::n]
-        for j in range(n):
-            if col[j] in goal_col[j+1:]:
-                linear_conflicts += 2
-    return linear_conflicts
+    tables = get_distance_tables(state)
+    conflicts = tables.line_conflicts
+    rows, cols = tables.row_signature, tables.col_signature
+    return (sum(conflicts[sum(rows[config[i]][i] for i in cells)] for cells in tables.rows)
+            + sum(conflicts[sum(cols[config[i]][i] for i in cells)] for cells in tables.cols))
 
 
 
@@ -61,14 +369,16 @@ def misplaced_tiles(state):
         It is the number of tiles that are not in their goal positions
             @param state: the state of the puzzle    
     """
-    n = state.n
-    config = state.config
-    goal = state.goal
-    misplaced_tiles = 0
-    for i in range(n*n):
-        if config[i] != goal[i]:
-            misplaced_tiles += 1
-    return misplaced_tiles
+    return table_sum(get_distance_tables(state).misplaced, state)
+
+
+
+def euclidean_distance_state(state):
+    """ 
+        It is the sum of the euclidean distances of each tile from its goal position
+            @param state: the state of the puzzle
+    """
+    return table_sum(get_distance_tables(state).euclidean, state)
 
 
 
@@ -77,21 +387,169 @@ def manhattan_distance_state(state):
         It is the sum of the manhattan distances of each tile from its goal position
             @param state: the state of the puzzle
     """
-    distances = 0
-    for i, item in enumerate(state.config):
-        current_row = i // state.n
-        current_col = i % state.n
-        goal_idx = state.goal.index(item)
-        goal_row = goal_idx // state.n
-        goal_col = goal_idx % state.n
-        distances += manhattan_distance(current_row, current_col, goal_row, goal_col)
-    return distances
+    return table_sum(get_distance_tables(state).manhattan, state)
     
 
 
 def linear_manhattan_conflict(state):
     """ 
-        It is the sum of the linear conflicts and the manhattan distances of each tile from its goal position
+        It is the sum of the linear conflicts and the manhattan distances of each tile from its goal position.
+        The blank is left out of the manhattan distance, so the sum never overestimates
+            @param state: the state of the puzzle
+    """
+    return linear_conflict_single(state) + table_sum(get_distance_tables(state).tile_manhattan, state)
+
+
+
+def walking_distance(state):
+    """ 
+        It is the sum of the walking distances of the rows and of the columns: the vertical moves needed to bring
+        every tile to its goal row, when the tiles of a row are told apart only by their goal row, plus the
+        horizontal moves needed for the columns. A move is either vertical or horizontal, so the sum never
+        overestimates, and it never changes by more than one per move
             @param state: the state of the puzzle
     """
-    return linear_conflict_single(state) + manhattan_distance_state(state)
\ No newline at end of file
+    tables = get_distance_tables(state)
+    rows = get_walking_distance(state.n, tables.blank_row)
+    cols = get_walking_distance(state.n, tables.blank_col)
+    row_code, col_code = walking_distance_codes(state, tables)
+    return rows[row_code] + cols[col_code]
+
+
+
+def walking_distance_codes(state, tables):
+    """ 
+        It returns the codes of the rows and of the columns of a state. They are read from the codes remembered
+        by walking_distance_delta for the children it evaluated, and summed over the board only for the others
+        (the initial state, or a state forgotten when the memory was emptied)
+            @param state: the state of the puzzle
+            @param tables: the DistanceTables of the state
+    """
+    codes = tables.walking_codes.get(state.packed)
+    if codes is None:
+        codes = (table_sum(tables.row_code, state), table_sum(tables.col_code, state))
+    return codes
+
+
+
+# Incremental evaluation.
+# Every *_delta function returns the change of the matching heuristic when the blank tile of
+# `state` moves to the position `target`, so a child's value is the parent's value plus the delta.
+
+def table_delta(table, state, target):
+    """ 
+        It is the change of a table_sum heuristic for a single move
+            @param table: a [tile][position] table of DistanceTables
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    blank = state.blank
+    tile = table[state.tile_at(target)]
+    blank_tile = table[0]
+    # The tile goes from target to blank, the blank goes from blank to target.
+    return tile[blank] - tile[target] + blank_tile[target] - blank_tile[blank]
+
+
+
+def manhattan_distance_delta(state, target):
+    """ 
+        It is the change of manhattan_distance_state for a single move
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    return table_delta(get_distance_tables(state).manhattan, state, target)
+
+
+
+def euclidean_distance_delta(state, target):
+    """ 
+        It is the change of euclidean_distance_state for a single move
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    return table_delta(get_distance_tables(state).euclidean, state, target)
+
+
+
+def misplaced_tiles_delta(state, target):
+    """ 
+        It is the change of misplaced_tiles for a single move
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    return table_delta(get_distance_tables(state).misplaced, state, target)
+
+
+
+def linear_conflict_delta(state, target):
+    """ 
+        It is the change of linear_conflict_single for a single move. The moved tile keeps its place among the tiles
+        of the line it moves along, so only the line it leaves or the one it enters can change, and only if it is
+        the goal line of the tile: its signature is summed and looked up before and after the move
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    n = state.n
+    tables = get_distance_tables(state)
+    # The cells are read one at a time: unpacking the whole board of a PuzzleState would cost O(n^2) per move,
+    # only the list of a MutableBoard is read directly.
+    tile_at = state.board.__getitem__ if isinstance(state, MutableBoard) else state.tile_at
+    blank = state.blank
+    if blank // n == target // n:
+        signature, lines = tables.col_signature, tables.cols
+        leaving, entering = lines[target % n], lines[blank % n]
+    else:
+        signature, lines = tables.row_signature, tables.rows
+        leaving, entering = lines[target // n], lines[blank // n]
+    tile, blank_tile = signature[tile_at(target)], signature[0]
+    change = blank_tile[target] - tile[target]
+    cells = leaving
+    if not change:
+        change = tile[blank] - blank_tile[blank]
+        cells = entering
+        if not change:
+            return 0
+    conflicts = tables.line_conflicts
+    before = sum(signature[tile_at(i)][i] for i in cells)
+    return conflicts[before + change] - conflicts[before]
+
+
+
+def linear_manhattan_conflict_delta(state, target):
+    """ 
+        It is the change of linear_manhattan_conflict for a single move
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    return linear_conflict_delta(state, target) + table_delta(get_distance_tables(state).tile_manhattan, state, target)
+
+
+
+def walking_distance_delta(state, target):
+    """ 
+        It is the change of walking_distance for a single move. The codes of the child are the codes of the state
+        updated by the lookups of the moved tile and of the blank: a vertical move only changes the code of the rows,
+        a horizontal one the code of the columns, so the change takes two lookups in a single table. The codes of
+        the child are remembered, keyed by its packed board, for the moves that follow it
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    n = state.n
+    tables = get_distance_tables(state)
+    row_code, col_code = walking_distance_codes(state, tables)
+    blank = state.blank
+    if blank // n == target // n:
+        table = get_walking_distance(n, tables.blank_col)
+        before, child = col_code, (row_code, col_code + table_delta(tables.col_code, state, target))
+        after = child[1]
+    else:
+        table = get_walking_distance(n, tables.blank_row)
+        before, child = row_code, (row_code + table_delta(tables.row_code, state, target), col_code)
+        after = child[0]
+    memory = tables.walking_codes
+    if len(memory) >= WALKING_DISTANCE_MEMORY:
+        memory.clear()
+    bits = tile_bits(n)
+    tile = state.tile_at(target)
+    memory[state.packed ^ (tile << (target * bits)) ^ (tile << (blank * bits))] = child
+    return table[after] - table[before]
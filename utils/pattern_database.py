@@ -0,0 +1,478 @@
+# description: Disjoint additive pattern database heuristic
+# author: Seminara Luigi
+# date: 2023-02-02
+# tags: python, pattern_database, heuristic, retrograde, BFS, mmap
+
+import os
+import mmap
+import zlib
+import struct
+import time
+import logging
+from puzzle.puzzle_state import pack_config, tile_bits
+
+# Binary format of a pattern database file (all integers are little endian):
+#   header:   magic (4s), version (H), n (B), number of patterns (B)
+#   goal:     n*n bytes, the goal configuration
+#   patterns: for each pattern, number of tiles (B), encoding (B), tiles (k bytes),
+#             offset of the table from the start of the file (Q), length of the table in bytes (Q)
+#   tables:   the tables, one after the other
+PDB_MAGIC = b"NPDB"
+PDB_VERSION = 1
+HEADER = struct.Struct("<4sHBB")
+PATTERN_HEADER = struct.Struct("<BB")
+TABLE_HEADER = struct.Struct("<QQ")
+
+# Encodings of a table:
+#   ENCODING_BYTE:   one byte per entry holding the distance.
+#   ENCODING_NIBBLE: 4 bits per entry (even ranks in the low nibble) holding half the excess of the
+#                    distance over the Manhattan distance of the pattern tiles. The excess is always even,
+#                    values that do not fit are clamped to 15, which keeps the heuristic admissible.
+ENCODING_BYTE = 0
+ENCODING_NIBBLE = 1
+
+# Default directory of the pattern database files.
+PDB_DIRECTORY = "./pdb"
+
+# Default disjoint partitions of the tiles, by board size.
+DEFAULT_PARTITIONS = {
+    3: ((1, 2, 3, 4), (5, 6, 7, 8)),
+    4: ((1, 2, 3, 5, 6), (4, 7, 8, 11, 12), (9, 10, 13, 14, 15)),
+}
+
+# Largest number of states whose positions and pattern values are remembered by PatternDatabase.evaluate_delta,
+# the memory is emptied when it is full.
+PDB_MEMORY = 1 << 15
+
+# Cache of the loaded pattern databases, keyed by (size, packed goal).
+_pattern_databases = {}
+
+
+
+def table_size(cells, k):
+    """
+        It returns the number of ordered placements of k tiles on cells cells.
+
+        Args:
+            cells: this is the number of cells of the board.
+            k: this is the number of tiles of the pattern.
+    """
+    size = 1
+    for i in range(k):
+        size *= cells - i
+    return size
+
+
+
+def rank(positions, cells):
+    """
+        It is the perfect hash of the positions of the pattern tiles: the rank of the
+        partial permutation in [0, table_size(cells, len(positions))).
+
+        Args:
+            positions: this is the position of every tile of the pattern, in pattern order.
+            cells: this is the number of cells of the board.
+    """
+    index = 0
+    used = 0
+    for i, p in enumerate(positions):
+        index = index * (cells - i) + p - bin(used & ((1 << p) - 1)).count("1")
+        used |= 1 << p
+    return index
+
+
+
+def unrank(index, k, cells):
+    """
+        It is the inverse of rank.
+
+        Args:
+            index: this is the rank of the partial permutation.
+            k: this is the number of tiles of the pattern.
+            cells: this is the number of cells of the board.
+    """
+    digits = [0] * k
+    for i in reversed(range(k)):
+        digits[i] = index % (cells - i)
+        index //= cells - i
+    free = list(range(cells))
+    return tuple(free.pop(d) for d in digits)
+
+
+
+def neighbours(n):
+    """
+        It returns, for every cell of a n x n board, the list of the adjacent cells.
+
+        Args:
+            n: this is the dimension of the puzzle.
+    """
+    result = []
+    for i in range(n * n):
+        row, col = i // n, i % n
+        cells = []
+        if row > 0:
+            cells.append(i - n)
+        if row < n - 1:
+            cells.append(i + n)
+        if col > 0:
+            cells.append(i - 1)
+        if col < n - 1:
+            cells.append(i + 1)
+        result.append(cells)
+    return result
+
+
+
+def blank_region(start, occupied, adjacent):
+    """
+        It returns the bit mask of the cells the blank can reach from start without moving a pattern tile.
+
+        Args:
+            start: this is the position of the blank.
+            occupied: this is the bit mask of the cells holding a pattern tile.
+            adjacent: this is the result of neighbours.
+    """
+    region = 1 << start
+    stack = [start]
+    while stack:
+        cell = stack.pop()
+        for q in adjacent[cell]:
+            bit = 1 << q
+            if not (region | occupied) & bit:
+                region |= bit
+                stack.append(q)
+    return region
+
+
+
+def build_pattern_table(n, goal, tiles):
+    """
+        It builds the table of a pattern by a retrograde breadth-first search from the goal.
+        Only the moves of the pattern tiles are counted, so the tables of disjoint patterns can be added.
+        The abstract state is made of the positions of the pattern tiles and the region of the blank:
+        moving the blank inside its region is free, so every region is represented by its lowest cell.
+
+        Args:
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            tiles: this is the list of the tiles of the pattern.
+
+        Returns:
+            bytearray: the distance of every placement of the pattern tiles, indexed by rank.
+    """
+    cells = n * n
+    adjacent = neighbours(n)
+    table = bytearray(b"\xff") * table_size(cells, len(tiles))
+    visited = bytearray(len(table) * cells)
+
+    start = tuple(list(goal).index(t) for t in tiles)
+    occupied = sum(1 << p for p in start)
+    region = blank_region(list(goal).index(0), occupied, adjacent)
+    layer = [(start, region)]
+    visited[rank(start, cells) * cells + (region & -region).bit_length() - 1] = 1
+    distance = 0
+
+    while layer:
+        next_layer = []
+        for positions, region in layer:
+            index = rank(positions, cells)
+            if table[index] == 255:
+                table[index] = distance
+            occupied = sum(1 << p for p in positions)
+            for i, p in enumerate(positions):
+                for q in adjacent[p]:
+                    if not region >> q & 1:
+                        continue
+                    moved = positions[:i] + (q,) + positions[i + 1:]
+                    moved_region = blank_region(p, occupied ^ (1 << p) ^ (1 << q), adjacent)
+                    key = rank(moved, cells) * cells + (moved_region & -moved_region).bit_length() - 1
+                    if not visited[key]:
+                        visited[key] = 1
+                        next_layer.append((moved, moved_region))
+        logging.debug(f"Pattern {tiles}: {len(layer)} states at distance {distance}")
+        layer = next_layer
+        distance += 1
+    return table
+
+
+
+def write_pattern_database_header(file, n, goal, patterns, lengths, encodings):
+    """
+        It writes the header of a pattern database file.
+
+        Args:
+            file: this is the file opened in binary mode.
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            patterns: this is the list of the patterns (tuples of tiles).
+            lengths: this is the length in bytes of every table.
+            encodings: this is the encoding of every table.
+
+        Returns:
+            list: the offset of every table from the start of the file.
+    """
+    offset = HEADER.size + n * n + sum(PATTERN_HEADER.size + len(p) + TABLE_HEADER.size for p in patterns)
+    offsets = []
+    file.write(HEADER.pack(PDB_MAGIC, PDB_VERSION, n, len(patterns)))
+    file.write(bytes(goal))
+    for pattern, length, encoding in zip(patterns, lengths, encodings):
+        file.write(PATTERN_HEADER.pack(len(pattern), encoding))
+        file.write(bytes(pattern))
+        file.write(TABLE_HEADER.pack(offset, length))
+        offsets.append(offset)
+        offset += length
+    return offsets
+
+
+
+def save_pattern_database(path, n, goal, patterns, tables, encodings=None):
+    """
+        It writes a pattern database file.
+
+        Args:
+            path: this is the path of the file.
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            patterns: this is the list of the patterns (tuples of tiles).
+            tables: this is the table of every pattern.
+            encodings: this is the encoding of every table. Defaults to ENCODING_BYTE for all of them.
+    """
+    if encodings is None:
+        encodings = [ENCODING_BYTE] * len(patterns)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Each process writes its own temporary file, so processes building the same database do not clash.
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        write_pattern_database_header(file, n, goal, patterns, [len(t) for t in tables], encodings)
+        for table in tables:
+            file.write(table)
+    os.replace(temporary, path)
+
+
+
+def pattern_manhattan(n, goal, pattern):
+    """
+        It returns, for every tile of the pattern, the Manhattan distance from its goal position of every cell.
+
+        Args:
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            pattern: this is the tuple of the tiles of the pattern.
+    """
+    result = []
+    for tile in pattern:
+        g = list(goal).index(tile)
+        result.append([abs(i // n - g // n) + abs(i % n - g % n) for i in range(n * n)])
+    return result
+
+
+
+class PatternDatabase(object):
+    """
+        A disjoint additive pattern database loaded from a file. The tables are memory mapped,
+        so several solvers (and processes) loading the same file share the same pages.
+    """
+
+    def __init__(self, path):
+        """
+            The constructor of the PatternDatabase class.
+
+            Args:
+                path: this is the path of the pattern database file.
+
+            Raises:
+                ValueError: if the file is not a pattern database or its version or encoding are not supported.
+        """
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, count = HEADER.unpack_from(self.buffer, 0)
+        if magic != PDB_MAGIC:
+            raise ValueError(f"{path} is not a pattern database file.")
+        if version != PDB_VERSION:
+            raise ValueError(f"Pattern database version {version} is not supported.")
+
+        self.path = path
+        self.n = n
+        self.cells = n * n
+        offset = HEADER.size
+        self.goal = tuple(self.buffer[offset:offset + self.cells])
+        offset += self.cells
+
+        self.patterns = []
+        self.tables = []
+        self.encodings = []
+        self.manhattan = []
+        for _ in range(count):
+            k, encoding = PATTERN_HEADER.unpack_from(self.buffer, offset)
+            offset += PATTERN_HEADER.size
+            if encoding not in (ENCODING_BYTE, ENCODING_NIBBLE):
+                raise ValueError(f"Pattern database encoding {encoding} is not supported.")
+            self.patterns.append(tuple(self.buffer[offset:offset + k]))
+            self.encodings.append(encoding)
+            offset += k
+            start, length = TABLE_HEADER.unpack_from(self.buffer, offset)
+            offset += TABLE_HEADER.size
+            self.tables.append(memoryview(self.buffer)[start:start + length])
+            self.manhattan.append(pattern_manhattan(n, self.goal, self.patterns[-1]))
+
+        # Pattern of every tile, None for the tiles that are not in any pattern.
+        self.tile_pattern = [None] * self.cells
+        for i, pattern in enumerate(self.patterns):
+            for tile in pattern:
+                self.tile_pattern[tile] = i
+
+        # Position of every tile and value of every pattern of the states reached by evaluate_delta, by packed state.
+        self.bits = tile_bits(n)
+        self.memory = {}
+
+
+
+    def lookup(self, p, positions):
+        """
+            It returns the value of the table of a pattern.
+
+            Args:
+                p: this is the index of the pattern.
+                positions: this is the position of every tile of the pattern, in pattern order.
+        """
+        index = rank(positions, self.cells)
+        if self.encodings[p] == ENCODING_BYTE:
+            return self.tables[p][index]
+        excess = (self.tables[p][index >> 1] >> ((index & 1) << 2)) & 15
+        return sum(distances[position] for distances, position in zip(self.manhattan[p], positions)) + 2 * excess
+
+
+
+    def evaluate(self, config):
+        """
+            It returns the heuristic value of a configuration: the sum of the tables of all the patterns.
+
+            Args:
+                config: this is the configuration of the puzzle.
+        """
+        positions = [0] * self.cells
+        for i, item in enumerate(config):
+            positions[item] = i
+        return sum(self.lookup(p, [positions[t] for t in pattern]) for p, pattern in enumerate(self.patterns))
+
+
+
+    def evaluate_delta(self, tile, blank, target, packed):
+        """
+            It returns the change of the heuristic value when the blank moves from blank to target.
+            The positions of the tiles and the values of the patterns of the state are taken from the memory, where
+            they are kept for every state reached by a move: only the moved tile changes place and only its pattern
+            is looked up again. They are computed from the packed configuration for the states that are not in the memory.
+
+            Args:
+                tile: this is the tile at target, the one that moves.
+                blank: this is the position of the blank.
+                target: this is the position the blank moves to.
+                packed: this is the packed configuration before the move.
+        """
+        entry = self.memory.get(packed)
+        if entry is None:
+            bits, mask = self.bits, (1 << self.bits) - 1
+            positions = bytearray(self.cells)
+            for i in range(self.cells):
+                positions[(packed >> (i * bits)) & mask] = i
+            values = tuple(self.lookup(p, [positions[t] for t in pattern]) for p, pattern in enumerate(self.patterns))
+        else:
+            positions, values = entry
+        child = bytearray(positions)
+        child[tile], child[0] = blank, target
+        p = self.tile_pattern[tile]
+        delta = 0
+        if p is not None:
+            value = self.lookup(p, [child[t] for t in self.patterns[p]])
+            delta = value - values[p]
+            values = values[:p] + (value,) + values[p + 1:]
+        if len(self.memory) >= PDB_MEMORY:
+            self.memory.clear()
+        self.memory[packed ^ (tile << (target * self.bits)) ^ (tile << (blank * self.bits))] = (child, values)
+        return delta
+
+
+
+def pattern_database_path(n, goal, patterns):
+    """
+        It returns the default path of the pattern database file of a board size, goal and partition.
+
+        Args:
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            patterns: this is the list of the patterns (tuples of tiles).
+    """
+    sizes = "-".join(str(len(p)) for p in patterns)
+    checksum = zlib.crc32(bytes(goal) + b"".join(bytes(p) for p in patterns))
+    return os.path.join(PDB_DIRECTORY, f"{n}x{n}_{sizes}_{checksum:08x}.pdb")
+
+
+
+def load_pattern_database(path):
+    """
+        It loads a pattern database file and makes it the one used for its size and goal,
+        in place of the default partition.
+
+        Args:
+            path: this is the path of the pattern database file.
+    """
+    database = PatternDatabase(path)
+    _pattern_databases[(database.n, pack_config(database.goal, database.n))] = database
+    return database
+
+
+
+def get_pattern_database(state):
+    """
+        It returns the pattern database of the state's size and goal. The database is loaded from
+        PDB_DIRECTORY, it is built and saved with the default partition when the file does not exist.
+
+        Args:
+            state: this is the state of the puzzle.
+
+        Raises:
+            NotImplementedError: if there is no default partition for the size of the puzzle.
+    """
+    key = (state.n, state.goal_packed)
+    database = _pattern_databases.get(key)
+    if database is None:
+        if state.n not in DEFAULT_PARTITIONS:
+            raise NotImplementedError(f"No default pattern partition for a {state.n}x{state.n} puzzle.")
+        goal = tuple(map(int, state.goal))
+        patterns = DEFAULT_PARTITIONS[state.n]
+        path = pattern_database_path(state.n, goal, patterns)
+        if not os.path.exists(path):
+            logging.warning(f"Building the pattern database {path}, it can take minutes: "
+                            "build it beforehand with python3 -m utils.pdb_builder")
+            tables = []
+            for pattern in patterns:
+                start = time.perf_counter()
+                tables.append(build_pattern_table(state.n, goal, pattern))
+                logging.warning(f"Pattern {pattern} built in {time.perf_counter() - start:.1f}s")
+            save_pattern_database(path, state.n, goal, patterns, tables)
+        database = _pattern_databases[key] = PatternDatabase(path)
+    return database
+
+
+
+def pattern_database(state):
+    """
+        It is the sum of the pattern database values of every pattern of the state
+            @param state: the state of the puzzle
+    """
+    return get_pattern_database(state).evaluate(state.config)
+
+
+
+def pattern_database_delta(state, target):
+    """
+        It is the change of pattern_database for a single move
+            @param state: the state of the puzzle before the move
+            @param target: the position the blank tile moves to
+    """
+    return get_pattern_database(state).evaluate_delta(state.tile_at(target), state.blank, target, state.packed)
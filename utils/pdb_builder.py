@@ -0,0 +1,354 @@
+# description: Parallel and resumable pattern database builder
+# author: Seminara Luigi
+# date: 2023-02-06
+# tags: python, pattern_database, builder, multiprocessing, mmap, checkpoint
+
+import os
+import sys
+import json
+import mmap
+import shutil
+import logging
+import argparse
+import multiprocessing
+from utils.pattern_database import DEFAULT_PARTITIONS, ENCODING_NIBBLE, table_size, rank, unrank, neighbours, blank_region
+from utils.pattern_database import pattern_manhattan, pattern_database_path, write_pattern_database_header
+
+# The retrograde BFS keeps one byte per abstract state (placement of the pattern tiles, lowest cell of the
+# blank region) in a memory-mapped work file: UNSEEN or the distance from the goal. Every layer is split in
+# ranges of placements that the workers scan and expand in parallel. Two workers can only race on writing
+# the same value to the same byte, so no locking is needed. A checkpoint is written after every layer.
+UNSEEN = 255
+CHECKPOINT_VERSION = 1
+
+# Number of ranges each worker receives per layer, more ranges balance the load better.
+RANGES_PER_WORKER = 8
+
+# State of a worker process, filled by init_worker.
+_worker = {}
+
+
+
+def init_worker(n, goal, patterns, work_paths):
+    """
+        It initializes a worker process by memory mapping the work files.
+
+        Args:
+            n: this is the dimension of the puzzle.
+            goal: this is the goal state of the puzzle.
+            patterns: this is the list of the patterns (tuples of tiles).
+            work_paths: this is the path of the work file of every pattern.
+    """
+    _worker["n"] = n
+    _worker["goal"] = goal
+    _worker["patterns"] = patterns
+    _worker["adjacent"] = neighbours(n)
+    _worker["work"] = []
+    for path in work_paths:
+        with open(path, "r+b") as file:
+            _worker["work"].append(mmap.mmap(file.fileno(), 0))
+
+
+
+def expand_range(task):
+    """
+        It expands every abstract state at distance layer whose placement rank is in [lo, hi).
+
+        Args:
+            task: this is the tuple (pattern index, layer, lo, hi).
+
+        Returns:
+            tuple: the number of states expanded and the number of states marked at distance layer + 1.
+    """
+    p, layer, lo, hi = task
+    cells = _worker["n"] * _worker["n"]
+    k = len(_worker["patterns"][p])
+    adjacent = _worker["adjacent"]
+    work = _worker["work"][p]
+    marker = bytes([layer])
+    following = layer + 1
+    expanded = 0
+    generated = 0
+
+    start = work.find(marker, lo * cells, hi * cells)
+    while start != -1:
+        index, rep = divmod(start, cells)
+        expanded += 1
+        positions = unrank(index, k, cells)
+        occupied = sum(1 << position for position in positions)
+        region = blank_region(rep, occupied, adjacent)
+        for i, position in enumerate(positions):
+            for q in adjacent[position]:
+                if not region >> q & 1:
+                    continue
+                moved = positions[:i] + (q,) + positions[i + 1:]
+                moved_region = blank_region(position, occupied ^ (1 << position) ^ (1 << q), adjacent)
+                key = rank(moved, cells) * cells + (moved_region & -moved_region).bit_length() - 1
+                if work[key] == UNSEEN:
+                    work[key] = following
+                    generated += 1
+        start = work.find(marker, start + 1, hi * cells)
+    return expanded, generated
+
+
+
+def encode_range(task):
+    """
+        It writes the 4-bit entries of the placements in [lo, hi) into the output file.
+        lo is even, so two workers never write the same byte.
+
+        Args:
+            task: this is the tuple (pattern index, output path, table offset, lo, hi).
+    """
+    p, path, offset, lo, hi = task
+    n = _worker["n"]
+    cells = n * n
+    pattern = _worker["patterns"][p]
+    manhattan = pattern_manhattan(n, _worker["goal"], pattern)
+    work = _worker["work"][p]
+    nibbles = bytearray((hi - lo + 1) // 2)
+    for index in range(lo, hi):
+        distance = min(work[index * cells:(index + 1) * cells])
+        if distance == UNSEEN:
+            excess = 0
+        else:
+            positions = unrank(index, len(pattern), cells)
+            lower_bound = sum(distances[position] for distances, position in zip(manhattan, positions))
+            excess = min((distance - lower_bound) // 2, 15)
+        nibbles[(index - lo) >> 1] |= excess << (((index - lo) & 1) << 2)
+    with open(path, "r+b") as file:
+        file.seek(offset + lo // 2)
+        file.write(nibbles)
+
+
+
+def split(size, parts, even=False):
+    """
+        It splits [0, size) in at most parts consecutive ranges.
+
+        Args:
+            size: this is the size of the interval.
+            parts: this is the number of ranges.
+            even: if True every range starts at an even number. Defaults to False.
+    """
+    step = max(1, -(-size // parts))
+    if even:
+        step += step & 1
+    return [(lo, min(lo + step, size)) for lo in range(0, size, step)]
+
+
+
+class PatternDatabaseBuilder(object):
+
+    def __init__(self, n, goal, patterns, output, workers=None):
+        """
+            The constructor of the PatternDatabaseBuilder class.
+
+            Args:
+                n: this is the dimension of the puzzle.
+                goal: this is the goal state of the puzzle.
+                patterns: this is the list of the patterns (tuples of tiles).
+                output: this is the path of the pattern database file.
+                workers: this is the number of worker processes. Defaults to the number of cores.
+        """
+        self.n = n
+        self.cells = n * n
+        self.goal = tuple(goal)
+        self.patterns = [tuple(p) for p in patterns]
+        self.output = output
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = output + ".build"
+        self.checkpoint_path = os.path.join(self.directory, "checkpoint.json")
+        self.work_paths = [os.path.join(self.directory, f"pattern_{i}.work") for i in range(len(self.patterns))]
+
+
+
+    def load_checkpoint(self):
+        """
+            It returns the (pattern, layer) the build has to restart from, creating the work files
+            when there is no checkpoint of the same build.
+
+            Raises:
+                ValueError: if the checkpoint belongs to a different build.
+        """
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as file:
+                checkpoint = json.load(file)
+            if (checkpoint["version"] != CHECKPOINT_VERSION or checkpoint["n"] != self.n
+                    or tuple(checkpoint["goal"]) != self.goal or [tuple(p) for p in checkpoint["patterns"]] != self.patterns):
+                raise ValueError(f"{self.directory} holds the checkpoint of a different build.")
+            logging.info(f"Resuming pattern {checkpoint['pattern']} from layer {checkpoint['layer']}")
+            return checkpoint["pattern"], checkpoint["layer"]
+
+        os.makedirs(self.directory, exist_ok=True)
+        adjacent = neighbours(self.n)
+        for pattern, path in zip(self.patterns, self.work_paths):
+            size = table_size(self.cells, len(pattern)) * self.cells
+            with open(path, "wb") as file:
+                chunk = bytes([UNSEEN]) * min(size, 1 << 24)
+                for start in range(0, size, len(chunk)):
+                    file.write(chunk[:size - start])
+                start = tuple(self.goal.index(t) for t in pattern)
+                region = blank_region(self.goal.index(0), sum(1 << p for p in start), adjacent)
+                file.seek(rank(start, self.cells) * self.cells + (region & -region).bit_length() - 1)
+                file.write(bytes([0]))
+        self.save_checkpoint(0, 0)
+        return 0, 0
+
+
+
+    def save_checkpoint(self, pattern, layer):
+        """
+            It records that the build restarts from the given pattern and layer.
+
+            Args:
+                pattern: this is the index of the pattern.
+                layer: this is the next layer to expand.
+        """
+        checkpoint = {"version": CHECKPOINT_VERSION, "n": self.n, "goal": list(self.goal),
+                      "patterns": [list(p) for p in self.patterns], "pattern": pattern, "layer": layer}
+        with open(self.checkpoint_path + ".tmp", "w") as file:
+            json.dump(checkpoint, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.checkpoint_path + ".tmp", self.checkpoint_path)
+
+
+
+    def build(self):
+        """
+            It builds the pattern database file, resuming from the last checkpoint if there is one.
+
+            Returns:
+                str: the path of the pattern database file.
+        """
+        first_pattern, first_layer = self.load_checkpoint()
+        initargs = (self.n, self.goal, self.patterns, self.work_paths)
+        with multiprocessing.Pool(self.workers, initializer=init_worker, initargs=initargs) as pool:
+            for p in range(first_pattern, len(self.patterns)):
+                layer = first_layer if p == first_pattern else 0
+                ranges = split(table_size(self.cells, len(self.patterns[p])), self.workers * RANGES_PER_WORKER)
+                # A resumed layer may find its successors already marked, so the search stops
+                # on the first layer without states rather than on the first one without successors.
+                while layer < UNSEEN - 1:
+                    expanded, generated = 0, 0
+                    for e, g in pool.imap_unordered(expand_range, [(p, layer, lo, hi) for lo, hi in ranges]):
+                        expanded, generated = expanded + e, generated + g
+                    if expanded == 0:
+                        break
+                    layer += 1
+                    self.flush(p)
+                    self.save_checkpoint(p, layer)
+                    logging.info(f"Pattern {self.patterns[p]}: {generated} states at distance {layer}")
+                self.save_checkpoint(p + 1, 0)
+            self.encode(pool)
+        shutil.rmtree(self.directory)
+        return self.output
+
+
+
+    def flush(self, p):
+        """
+            It flushes the work file of a pattern to disk.
+
+            Args:
+                p: this is the index of the pattern.
+        """
+        with open(self.work_paths[p], "r+b") as file:
+            with mmap.mmap(file.fileno(), 0) as work:
+                work.flush()
+
+
+
+    def encode(self, pool):
+        """
+            It writes the pattern database file with 4-bit tables from the work files.
+
+            Args:
+                pool: this is the pool of worker processes.
+        """
+        directory = os.path.dirname(self.output)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        sizes = [table_size(self.cells, len(p)) for p in self.patterns]
+        lengths = [(size + 1) // 2 for size in sizes]
+        path = self.output + ".tmp"
+        with open(path, "wb") as file:
+            offsets = write_pattern_database_header(file, self.n, self.goal, self.patterns, lengths,
+                                                    [ENCODING_NIBBLE] * len(self.patterns))
+            file.truncate(offsets[-1] + lengths[-1])
+        tasks = []
+        for p, (size, offset) in enumerate(zip(sizes, offsets)):
+            tasks += [(p, path, offset, lo, hi) for lo, hi in split(size, self.workers * RANGES_PER_WORKER, even=True)]
+        for _ in pool.imap_unordered(encode_range, tasks):
+            pass
+        os.replace(path, self.output)
+
+
+
+def parse_partition(text):
+    """
+        It parses a partition written as tiles separated by commas and patterns separated by slashes (e.g. 1,2,3/4,5,6).
+
+        Args:
+            text: this is the partition.
+    """
+    return [tuple(int(t) for t in pattern.split(",")) for pattern in text.split("/")]
+
+
+
+def validate_partition(patterns, n):
+    """
+        It checks that the patterns can be added: every tile is in 1..n*n-1 and in one pattern at most.
+        A pattern holding the blank, or two patterns sharing a tile, would count some moves twice and make
+        the database inadmissible.
+
+        Args:
+            patterns: this is the list of the patterns (tuples of tiles).
+            n: this is the dimension of the puzzle.
+
+        Raises:
+            ValueError: if a pattern is empty, a tile is out of range or a tile is in more than one pattern.
+    """
+    seen = set()
+    for pattern in patterns:
+        if not pattern:
+            raise ValueError("A pattern has no tiles.")
+        for tile in pattern:
+            if not 1 <= tile < n * n:
+                raise ValueError(f"Tile {tile} is not a tile of a {n}x{n} puzzle, the tiles go from 1 to {n * n - 1}.")
+            if tile in seen:
+                raise ValueError(f"Tile {tile} is in more than one pattern, the patterns must be disjoint.")
+            seen.add(tile)
+
+
+
+def main(argv=None):
+    """ It builds a pattern database from the command line. """
+    parser = argparse.ArgumentParser(description="Build a disjoint additive pattern database.")
+    parser.add_argument("--ps", type=int, help="Size of the puzzle (e.g. 4 for a 4x4 puzzle)", default=4)
+    parser.add_argument("--partition", type=str, help="Patterns of the database (e.g. 1,2,3/4,5,6). Defaults to the default partition of the size", default=None)
+    parser.add_argument("--workers", type=int, help="Number of worker processes. Defaults to the number of cores", default=None)
+    parser.add_argument("--output", type=str, help="Path of the database. Defaults to the file the solver loads", default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s %(message)s', level=logging.INFO)
+    n = args.ps
+    goal = tuple(list(range(1, n * n)) + [0])
+    if args.partition:
+        try:
+            patterns = parse_partition(args.partition)
+            validate_partition(patterns, n)
+        except ValueError as e:
+            parser.error(f"Invalid partition {args.partition}: {e}")
+    elif n in DEFAULT_PARTITIONS:
+        patterns = DEFAULT_PARTITIONS[n]
+    else:
+        parser.error(f"No default pattern partition for a {n}x{n} puzzle, use --partition.")
+    output = args.output or pattern_database_path(n, goal, patterns)
+    print(PatternDatabaseBuilder(n, goal, patterns, output, args.workers).build())
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,14 @@
 # tags: python, priority_queue, heap, heapq
 
 import heapq
+from collections import deque
+
+# Supported tie-breaking policies of IndexedPriorityQueue:
+# 'deepest' prefers the item with the highest cost (g), 'fifo' the oldest item, 'lifo' the newest one.
+TIE_BREAKING = (None, 'deepest', 'fifo', 'lifo')
+
+# The tie-breaker is stored in the low bits of an integer heap key, below f(x) * TIE_SCALE.
+TIE_SCALE = 1 << 40
 
 class PriorityQueue:
     """A Queue in which the minimum (or maximum) element (as determined by f and
@@ -75,4 +83,309 @@ class PriorityQueue:
             del self.heap[[item == key for _, item in self.heap].index(True)]
         except ValueError:
             raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
\ No newline at end of file
+        heapq.heapify(self.heap)
+
+
+class IndexedPriorityQueue:
+    """A drop-in replacement of PriorityQueue that keeps the position of every item
+    of the heap in a dict. Membership tests and lookups are O(1), deletions and
+    decrease-key are O(log n). Items must be hashable, an item equal to one that
+    is already in the queue replaces it.
+    Ties on f(x) are broken by tie_breaking (see TIE_BREAKING), folded together with
+    f(x) into a single heap key so that a heap comparison is one integer comparison.
+    The 'deepest' policy reads the depth of an item from its cost attribute."""
+
+    def __init__(self, order='min', f=lambda x: x, tie_breaking=None):
+        self.heap = []
+        self.index = {}
+        self.counter = 0
+
+        if order == 'min':
+            self.f = f
+        elif order == 'max':  # now item with max f(x)
+            self.f = lambda x: -f(x)  # will be popped first
+        else:
+            raise ValueError("order must be either 'min' or 'max'.")
+
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError("tie_breaking must be one of " + str(TIE_BREAKING) + ".")
+        self.tie_breaking = tie_breaking
+
+
+
+    def key(self, value, item):
+        """Return the heap key of item, given its f(x) value."""
+        if self.tie_breaking is None:
+            return value
+        if self.tie_breaking == 'deepest':
+            return value * TIE_SCALE + (TIE_SCALE - 1 - item.cost)
+        self.counter += 1
+        if self.tie_breaking == 'fifo':
+            return value * TIE_SCALE + self.counter
+        return value * TIE_SCALE + (TIE_SCALE - self.counter)
+
+
+
+    def append(self, item):
+        """Insert item at its correct position."""
+        if item in self.index:
+            self.decrease_key(item)
+            return
+        value = self.f(item)
+        self.heap.append([self.key(value, item), value, item])
+        self.index[item] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+
+
+    def extend(self, items):
+        """Insert each item in items at its correct position."""
+        for item in items:
+            self.append(item)
+
+
+
+    def pop(self):
+        """Pop and return the item (with min or max f(x) value)
+        depending on the order."""
+        if self.heap:
+            return self._remove(0)[2]
+        else:
+            raise Exception('Trying to pop from empty PriorityQueue.')
+
+
+
+    def peek(self):
+        """Return the item pop would return, without removing it."""
+        if self.heap:
+            return self.heap[0][2]
+        else:
+            raise Exception('Trying to peek into empty PriorityQueue.')
+
+
+
+    def decrease_key(self, item):
+        """Replace the entry equal to item with item itself and move it to
+        the position given by its new f(x) value."""
+        try:
+            i = self.index.pop(item)
+        except KeyError:
+            raise KeyError(str(item) + " is not in the priority queue")
+        entry = self.heap[i]
+        old_key = entry[0]
+        value = self.f(item)
+        entry[0], entry[1], entry[2] = self.key(value, item), value, item
+        self.index[item] = i
+        if entry[0] < old_key:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+
+
+    def __len__(self):
+        """Return current capacity of PriorityQueue."""
+        return len(self.heap)
+
+
+
+    def __contains__(self, key):
+        """Return True if the key is in PriorityQueue."""
+        return key in self.index
+
+
+
+    def __getitem__(self, key):
+        """Returns the value associated with key in PriorityQueue.
+        Raises KeyError if key is not present."""
+        try:
+            return self.heap[self.index[key]][1]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
+
+
+
+    def __delitem__(self, key):
+        """Delete the entry of key."""
+        try:
+            self._remove(self.index[key])
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
+
+
+
+    def _remove(self, i):
+        """Remove and return the entry at position i of the heap."""
+        heap = self.heap
+        entry = heap[i]
+        last = heap.pop()
+        del self.index[entry[2]]
+        if i < len(heap):
+            heap[i] = last
+            self.index[last[2]] = i
+            if last[0] < entry[0]:
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+        return entry
+
+
+
+    def _sift_up(self, i):
+        """Move the entry at position i towards the root until the heap property holds."""
+        heap, index = self.heap, self.index
+        entry = heap[i]
+        key = entry[0]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if key < heap[parent][0]:
+                heap[i] = heap[parent]
+                index[heap[i][2]] = i
+                i = parent
+            else:
+                break
+        heap[i] = entry
+        index[entry[2]] = i
+
+
+
+    def _sift_down(self, i):
+        """Move the entry at position i towards the leaves until the heap property holds."""
+        heap, index = self.heap, self.index
+        size = len(heap)
+        entry = heap[i]
+        key = entry[0]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if heap[child][0] < key:
+                heap[i] = heap[child]
+                index[heap[i][2]] = i
+                i = child
+            else:
+                break
+        heap[i] = entry
+        index[entry[2]] = i
+
+
+
+
+class BucketQueue:
+    """An open list for integer f(x) values: an array of buckets indexed by f(x),
+    each split in sub-buckets indexed by the cost (g) of the items. Push is O(1) and
+    pop-min is amortized O(1). It has the same API of IndexedPriorityQueue, only the
+    'min' order is supported and f(x) must be a non-negative integer.
+    With the 'deepest' policy the sub-bucket with the highest cost is served first
+    (newest item first inside it), 'fifo' and 'lifo' ignore the cost.
+    Deleted and replaced items are dropped lazily when their bucket is reached."""
+
+    def __init__(self, order='min', f=lambda x: x, tie_breaking='deepest'):
+        self.buckets = []
+        self.top_g = []
+        self.index = {}
+        self.min_f = 0
+
+        if order != 'min':
+            raise ValueError("order must be 'min' for a BucketQueue.")
+        self.f = f
+
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError("tie_breaking must be one of " + str(TIE_BREAKING) + ".")
+        self.tie_breaking = tie_breaking
+
+
+
+    def append(self, item):
+        """Insert item in the bucket of its f(x) value."""
+        value = self.f(item)
+        g = item.cost if self.tie_breaking == 'deepest' else 0
+        while len(self.buckets) <= value:
+            self.buckets.append([])
+            self.top_g.append(0)
+        bucket = self.buckets[value]
+        while len(bucket) <= g:
+            bucket.append(deque())
+        bucket[g].append(item)
+        if g > self.top_g[value]:
+            self.top_g[value] = g
+        if value < self.min_f or not self.index:
+            self.min_f = value
+        self.index[item] = (value, g, item)
+
+
+
+    def extend(self, items):
+        """Insert each item in items in the bucket of its f(x) value."""
+        for item in items:
+            self.append(item)
+
+
+
+    def pop(self):
+        """Pop and return the item with min f(x) value."""
+        if not self.index:
+            raise Exception('Trying to pop from empty BucketQueue.')
+        fifo = self.tie_breaking == 'fifo'
+        while True:
+            bucket = self.buckets[self.min_f]
+            g = self.top_g[self.min_f]
+            while g > 0 and not bucket[g]:
+                g -= 1
+            self.top_g[self.min_f] = g
+            if not bucket or not bucket[g]:
+                self.min_f += 1
+                continue
+            item = bucket[g].popleft() if fifo else bucket[g].pop()
+            entry = self.index.get(item)
+            # Skip the stale copies left behind by decrease_key and __delitem__.
+            if entry is not None and entry[2] is item and entry[0] == self.min_f and entry[1] == g:
+                del self.index[item]
+                return item
+
+
+
+    def decrease_key(self, item):
+        """Replace the entry equal to item with item itself, moving it to the
+        bucket of its new f(x) value."""
+        if item not in self.index:
+            raise KeyError(str(item) + " is not in the priority queue")
+        self.append(item)
+
+
+
+    def __len__(self):
+        """Return current capacity of BucketQueue."""
+        return len(self.index)
+
+
+
+    def __contains__(self, key):
+        """Return True if the key is in BucketQueue."""
+        return key in self.index
+
+
+
+    def __getitem__(self, key):
+        """Returns the value associated with key in BucketQueue.
+        Raises KeyError if key is not present."""
+        try:
+            return self.index[key][0]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
+
+
+
+    def __delitem__(self, key):
+        """Delete the entry of key."""
+        try:
+            del self.index[key]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
+
+
+
+# Open list implementations that can be selected for A*.
+OPEN_LISTS = {'heap': IndexedPriorityQueue, 'bucket': BucketQueue}
@@ -0,0 +1,213 @@
+# description: Progress and telemetry reports of the search algorithms
+# author: Seminara Luigi
+# date: 2023-02-16
+# tags: python, progress, telemetry, tqdm, logging, metrics
+
+import time
+import logging
+import resource
+
+# The search algorithms call Progress.update at most every REPORT_EVERY expansions and the sinks
+# receive a report at most every REPORT_INTERVAL seconds, so the cost per expansion is one integer comparison.
+REPORT_EVERY = 1024
+REPORT_INTERVAL = 0.5
+
+# The active Progress, None when the reports are off.
+_progress = None
+
+# Resident set size of the process, in pages, on Linux: the second field of this file.
+STATM_PATH = "/proc/self/statm"
+
+
+
+def memory_mb():
+    """
+        It returns the memory in use by the process in MB, its current resident set size. Without STATM_PATH
+        (not Linux) it is the peak resident set size, the only one reported by getrusage.
+    """
+    try:
+        with open(STATM_PATH) as file:
+            return int(file.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+
+class Progress(object):
+
+    def __init__(self, sinks, every=REPORT_EVERY, interval=REPORT_INTERVAL):
+        """
+            The constructor of the Progress class.
+            A sink is any callable taking a report, a dict with the keys algorithm, nodes_expanded,
+            nodes_per_second, elapsed, frontier, closed, bound, memory_mb (current), peak_memory_mb and done.
+
+            Args:
+                sinks: this is the list of the sinks (e.g. TqdmSink, LoggingSink or a metrics exporter).
+                every: this is the number of expansions between two updates. Defaults to REPORT_EVERY.
+                interval: this is the minimum time in seconds between two reports. Defaults to REPORT_INTERVAL.
+
+            Raises:
+                ValueError: if every is not a positive integer.
+        """
+        if every < 1:
+            raise ValueError("every must be a positive integer.")
+        self.sinks = list(sinks)
+        self.every = every
+        self.interval = interval
+        self.algorithm = None
+        self.start_time = self.last_time = time.perf_counter()
+        self.last_nodes = 0
+        self.last = (0, 0, 0, None)
+
+
+
+    def start(self, algorithm):
+        """
+            It starts the reports of a search.
+
+            Args:
+                algorithm: this is the name of the search algorithm.
+        """
+        self.algorithm = algorithm
+        self.start_time = self.last_time = time.perf_counter()
+        self.last_nodes = 0
+        self.last = (0, 0, 0, None)
+
+
+
+    def update(self, nodes_expanded, frontier=0, closed=0, bound=None):
+        """
+            It records the state of the search and sends a report to the sinks if the last one is
+            older than the interval.
+
+            Args:
+                nodes_expanded: this is the number of nodes expanded so far.
+                frontier: this is the size of the frontier (the depth of the stack for IDA*). Defaults to 0.
+                closed: this is the number of closed nodes. Defaults to 0.
+                bound: this is the current bound on f (e.g. the f of the last node or the IDA* threshold). Defaults to None.
+
+            Returns:
+                int: the number of expansions at which update has to be called next.
+        """
+        self.last = (nodes_expanded, frontier, closed, bound)
+        if time.perf_counter() - self.last_time >= self.interval:
+            self.report(False)
+        return nodes_expanded + self.every
+
+
+
+    def finish(self, nodes_expanded=None):
+        """
+            It sends the last report of a search.
+
+            Args:
+                nodes_expanded: this is the number of nodes expanded by the search. Defaults to the last update.
+        """
+        if nodes_expanded is not None:
+            self.last = (nodes_expanded,) + self.last[1:]
+        self.report(True)
+
+
+
+    def report(self, done):
+        """
+            It sends a report of the last update to every sink.
+
+            Args:
+                done: True if the search is over.
+        """
+        now = time.perf_counter()
+        nodes_expanded, frontier, closed, bound = self.last
+        elapsed = now - self.start_time
+        window = now - self.last_time
+        rate = (nodes_expanded - self.last_nodes) / window if window > 0 else 0.0
+        report = {"algorithm": self.algorithm, "nodes_expanded": nodes_expanded, "nodes_per_second": rate,
+                  "elapsed": elapsed, "frontier": frontier, "closed": closed, "bound": bound,
+                  "memory_mb": memory_mb(), "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "done": done}
+        self.last_time, self.last_nodes = now, nodes_expanded
+        for sink in self.sinks:
+            sink(report)
+
+
+
+class TqdmSink(object):
+
+    def __init__(self, **kwargs):
+        """
+            The constructor of the TqdmSink class, a sink showing the reports on a tqdm bar.
+
+            Args:
+                kwargs: these are the arguments of the tqdm bar.
+        """
+        self.kwargs = kwargs
+        self.bar = None
+
+
+
+    def __call__(self, report):
+        """ It moves the bar to the nodes expanded of the report. """
+        if self.bar is None:
+            from tqdm import tqdm
+            self.bar = tqdm(desc=report["algorithm"], unit=" nodes", **self.kwargs)
+        self.bar.set_postfix(frontier=report["frontier"], closed=report["closed"], bound=report["bound"],
+                             memory=f"{report['memory_mb']:.0f}MB", refresh=False)
+        self.bar.update(report["nodes_expanded"] - self.bar.n)
+        if report["done"]:
+            self.bar.close()
+            self.bar = None
+
+
+
+class LoggingSink(object):
+
+    def __init__(self, logger=None, level=logging.INFO):
+        """
+            The constructor of the LoggingSink class, a sink writing the reports to a logger.
+
+            Args:
+                logger: this is the logger. Defaults to the root logger.
+                level: this is the level of the records. Defaults to logging.INFO.
+        """
+        self.logger = logger or logging.getLogger()
+        self.level = level
+
+
+
+    def __call__(self, report):
+        """ It logs the report. """
+        self.logger.log(self.level, f"{report['algorithm']}{' done' if report['done'] else ''}: "
+                                    f"{report['nodes_expanded']} nodes expanded ({report['nodes_per_second']:.0f}/s), "
+                                    f"frontier {report['frontier']}, closed {report['closed']}, bound {report['bound']}, "
+                                    f"{report['memory_mb']:.0f}MB, {report['elapsed']:.2f}s")
+
+
+
+def enable_progress(*sinks, every=REPORT_EVERY, interval=REPORT_INTERVAL):
+    """
+        It makes a new Progress with the given sinks the active one.
+
+        Args:
+            sinks: these are the sinks of the reports.
+            every: this is the number of expansions between two updates. Defaults to REPORT_EVERY.
+            interval: this is the minimum time in seconds between two reports. Defaults to REPORT_INTERVAL.
+
+        Returns:
+            Progress: the active Progress.
+    """
+    global _progress
+    _progress = Progress(sinks, every, interval)
+    return _progress
+
+
+
+def disable_progress():
+    """ It turns the reports off. """
+    global _progress
+    _progress = None
+
+
+
+def get_progress():
+    """ It returns the active Progress, None when the reports are off. """
+    return _progress
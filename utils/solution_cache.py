@@ -0,0 +1,233 @@
+# description: Persistent cache of optimal solutions, shared by the reflections across the main diagonal
+# author: Seminara Luigi
+# date: 2023-02-21
+# tags: python, cache, sqlite, symmetry, solution
+
+import os
+import sqlite3
+from puzzle.puzzle_state import tile_bits, pack_config
+
+# Default location and size of the cache.
+DEFAULT_CACHE_PATH = "./cache/solutions.sqlite"
+DEFAULT_MAX_ENTRIES = 1000000
+
+# Default number of the most recent entries of a size and goal kept in memory as shortcuts of the searches.
+DEFAULT_MAX_SHORTCUTS = 1 << 16
+
+# Moves are stored as a string of letters. Reflecting the board across the main diagonal swaps rows and
+# columns, so a move of the blank up becomes a move to the left and a move down a move to the right.
+MOVE_LETTERS = {"Up": "U", "Down": "D", "Left": "L", "Right": "R"}
+LETTER_MOVES = {letter: move for move, letter in MOVE_LETTERS.items()}
+REFLECTED_LETTERS = str.maketrans("UDLR", "LRUD")
+
+
+
+def reflect(config, goal, n):
+    """
+        It returns the reflection of a configuration across the main diagonal, with the tiles renamed so that the
+        goal is mapped to itself: the tile whose goal cell is (r, c) becomes the tile whose goal cell is (c, r).
+        The reflection of a board is solved by the reflection of its solution.
+
+        Args:
+            config: this is the configuration of the puzzle.
+            goal: this is the goal state of the puzzle.
+            n: this is the dimension of the puzzle.
+
+        Returns:
+            tuple: the reflected configuration, None if the blank of the goal is not on the diagonal.
+    """
+    goal_position = [0] * (n * n)
+    for i, tile in enumerate(goal):
+        goal_position[tile] = i
+    if goal_position[0] // n != goal_position[0] % n:
+        return None
+    reflected = [0] * (n * n)
+    for i, tile in enumerate(config):
+        g = goal_position[tile]
+        reflected[(i % n) * n + i // n] = goal[(g % n) * n + g // n]
+    return tuple(reflected)
+
+
+
+def canonical(config, goal, n):
+    """
+        It returns the canonical key of a configuration: the smallest packed form among the configuration
+        and its reflection.
+
+        Args:
+            config: this is the configuration of the puzzle.
+            goal: this is the goal state of the puzzle.
+            n: this is the dimension of the puzzle.
+
+        Returns:
+            tuple: the key and True if it is the key of the reflection.
+    """
+    packed = pack_config(config, n)
+    reflected = reflect(config, goal, n)
+    if reflected is not None:
+        packed_reflected = pack_config(reflected, n)
+        if packed_reflected < packed:
+            return packed_reflected, True
+    return packed, False
+
+
+
+class SolutionCache(object):
+    """
+        A persistent cache of optimal solutions stored in SQLite, keyed by the board size, the goal and the canonical
+        packed configuration. The database runs in WAL mode, so any number of processes can read it while one writes.
+        When the cache exceeds max_entries the oldest entries are evicted. The connection is opened lazily by every
+        process, so a cache can be inherited by forked workers.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_shortcuts=DEFAULT_MAX_SHORTCUTS):
+        """
+            The constructor of the SolutionCache class.
+
+            Args:
+                path: this is the path of the database. Defaults to DEFAULT_CACHE_PATH.
+                max_entries: this is the maximum number of solutions kept. Defaults to DEFAULT_MAX_ENTRIES.
+                max_shortcuts: this is the maximum number of entries of a size and goal returned by shortcuts.
+                    Defaults to DEFAULT_MAX_SHORTCUTS.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_shortcuts = max_shortcuts
+        self.pid = None
+        self.connection = None
+        self.distances = {}
+        self.last_rowids = {}
+
+
+
+    def connect(self):
+        """ It returns the connection of the current process, creating the database if it does not exist. """
+        if self.connection is None or self.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS solutions (n INTEGER NOT NULL, goal BLOB NOT NULL, "
+                                    "state BLOB NOT NULL, moves TEXT NOT NULL, UNIQUE (n, goal, state))")
+            self.pid = os.getpid()
+            self.distances = {}
+            self.last_rowids = {}
+        return self.connection
+
+
+
+    def key(self, config, goal, n):
+        """
+            It returns the database key of a configuration and whether it is the key of its reflection.
+
+            Args:
+                config: this is the configuration of the puzzle.
+                goal: this is the goal state of the puzzle.
+                n: this is the dimension of the puzzle.
+        """
+        size = (n * n * tile_bits(n) + 7) // 8
+        packed, reflected = canonical(config, goal, n)
+        return (n, pack_config(goal, n).to_bytes(size, "little"), packed.to_bytes(size, "little")), reflected
+
+
+
+    def lookup(self, config, goal, n):
+        """
+            It returns the cached solution of a configuration.
+
+            Args:
+                config: this is the configuration of the puzzle.
+                goal: this is the goal state of the puzzle.
+                n: this is the dimension of the puzzle.
+
+            Returns:
+                list: the actions of an optimal solution, None if the configuration is not cached.
+        """
+        goal = tuple(map(int, goal))
+        key, reflected = self.key(config, goal, n)
+        row = self.connect().execute("SELECT moves FROM solutions WHERE n = ? AND goal = ? AND state = ?", key).fetchone()
+        if row is None:
+            return None
+        letters = row[0].translate(REFLECTED_LETTERS) if reflected else row[0]
+        return [LETTER_MOVES[letter] for letter in letters]
+
+
+
+    def store(self, config, goal, n, actions):
+        """
+            It stores an optimal solution of a configuration and, since every part of an optimal path is optimal,
+            the solution of every configuration along it. The oldest entries are evicted if the cache is full.
+
+            Args:
+                config: this is the configuration of the puzzle.
+                goal: this is the goal state of the puzzle.
+                n: this is the dimension of the puzzle.
+                actions: this is the list of the actions of an optimal solution.
+        """
+        goal = tuple(map(int, goal))
+        config = list(map(int, config))
+        blank = config.index(0)
+        offsets = {"Up": -n, "Down": n, "Left": -1, "Right": 1}
+        letters = "".join(MOVE_LETTERS[action] for action in actions)
+        rows = []
+        for i, action in enumerate(actions):
+            key, reflected = self.key(config, goal, n)
+            rows.append(key + (letters[i:].translate(REFLECTED_LETTERS) if reflected else letters[i:],))
+            target = blank + offsets[action]
+            config[blank], config[target] = config[target], 0
+            blank = target
+        connection = self.connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # Replacing an entry gives it a new rowid, so the rowids follow the order of the last writes.
+            connection.executemany("INSERT OR REPLACE INTO solutions (n, goal, state, moves) VALUES (?, ?, ?, ?)", rows)
+            connection.execute("DELETE FROM solutions WHERE rowid <= (SELECT MAX(rowid) FROM solutions) - ?", (self.max_entries,))
+
+
+
+    def shortcuts(self, goal, n):
+        """
+            It returns the exact distance from the goal of the most recent cached configurations of a size and goal,
+            both orientations included, for the searches to stop as soon as they reach one of them. The dict is
+            kept in memory and only the entries written since the last call are read, through the rowids, which
+            follow the order of the writes. Past max_shortcuts entries it is emptied and refilled with the newest ones.
+            An entry evicted from the database may stay in the dict: its distance is still exact.
+
+            Args:
+                goal: this is the goal state of the puzzle.
+                n: this is the dimension of the puzzle.
+
+            Returns:
+                dict: the distance by packed configuration.
+        """
+        goal = tuple(map(int, goal))
+        connection = self.connect()
+        key = (n, goal)
+        distances = self.distances.get(key)
+        last_rowid = self.last_rowids.get(key, 0)
+        bits = tile_bits(n)
+        mask = (1 << bits) - 1
+        size = (n * n * bits + 7) // 8
+        rows = connection.execute("SELECT rowid, state, LENGTH(moves) FROM solutions WHERE n = ? AND goal = ? AND rowid > ? "
+                                  "ORDER BY rowid DESC LIMIT ?", (n, pack_config(goal, n).to_bytes(size, "little"), last_rowid,
+                                                                  self.max_shortcuts)).fetchall()
+        if distances is None or len(distances) + 2 * len(rows) > 2 * self.max_shortcuts:
+            distances = self.distances[key] = {}
+        for rowid, state, distance in reversed(rows):
+            packed = int.from_bytes(state, "little")
+            distances[packed] = distance
+            reflected = reflect(tuple((packed >> (i * bits)) & mask for i in range(n * n)), goal, n)
+            if reflected is not None:
+                distances[pack_config(reflected, n)] = distance
+            last_rowid = rowid
+        self.last_rowids[key] = last_rowid
+        return distances
+
+
+
+    def close(self):
+        """ It closes the connection of the current process. """
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
@@ -0,0 +1,195 @@
+# description: Compact open/closed table of the search algorithms, mapping a packed state to its cost and parent move
+# author: Seminara Luigi
+# date: 2023-02-22
+# tags: python, hash_table, open_addressing, closed_set, path
+
+from array import array
+from puzzle.puzzle_state import tile_bits
+
+# The move that reached a state is stored in 2 bits, next to its cost: entry = cost << 2 | move.
+MOVES = ("Up", "Down", "Left", "Right")
+MOVE_CODES = {action: code for code, action in enumerate(MOVES)}
+
+# Initial number of slots of a PackedTable and the largest fraction of them in use before it grows.
+INITIAL_CAPACITY = 1 << 12
+MAX_LOAD = 0.5
+
+# Multiplier of the Fibonacci hashing of the packed states.
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+HASH_MASK = (1 << 64) - 1
+
+
+
+def move_offsets(n):
+    """
+        It returns the change of the position of the blank for every move code.
+
+        Args:
+            n: this is the dimension of the puzzle.
+    """
+    return (-n, n, -1, 1)
+
+
+
+class PackedTable(object):
+    """
+        An open addressing hash table with linear probing from packed states to their entries, stored in two flat
+        arrays: 8 bytes for the key and 4 bytes for the entry of every slot. It only holds states that fit in
+        64 bits (boards up to 4x4). The key 0 marks an empty slot, no board packs to 0.
+        It has the subset of the dict API used by StateTable.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        """
+            The constructor of the PackedTable class.
+
+            Args:
+                capacity: this is the initial number of slots, a power of two. Defaults to INITIAL_CAPACITY.
+        """
+        self.size = 0
+        self.allocate(capacity)
+
+
+
+    def allocate(self, capacity):
+        """ It replaces the arrays with empty ones of capacity slots. """
+        self.keys = array("Q", bytes(8 * capacity))
+        self.entries = array("I", bytes(4 * capacity))
+        self.mask = capacity - 1
+        self.shift = 64 - (capacity.bit_length() - 1)
+        self.limit = int(capacity * MAX_LOAD)
+
+
+
+    def slot(self, key):
+        """ It returns the slot holding key, or the empty slot where it belongs. """
+        keys, mask = self.keys, self.mask
+        i = ((key * HASH_MULTIPLIER) & HASH_MASK) >> self.shift
+        while True:
+            k = keys[i]
+            if k == key or k == 0:
+                return i
+            i = (i + 1) & mask
+
+
+
+    def get(self, key, default=None):
+        """ It returns the entry of key, default if it is not in the table. """
+        i = self.slot(key)
+        return self.entries[i] if self.keys[i] else default
+
+
+
+    def __setitem__(self, key, entry):
+        """ It sets the entry of key, growing the table when it gets too full. It raises ValueError for the key 0. """
+        i = self.slot(key)
+        if not self.keys[i]:
+            if not key:
+                raise ValueError("The key 0 marks the empty slots of a PackedTable.")
+            if self.size >= self.limit:
+                self.grow()
+                i = self.slot(key)
+            self.keys[i] = key
+            self.size += 1
+        self.entries[i] = entry
+
+
+
+    def grow(self):
+        """ It doubles the number of slots and inserts the keys again. """
+        keys, entries = self.keys, self.entries
+        self.allocate(2 * len(keys))
+        for key, entry in zip(keys, entries):
+            if key:
+                i = self.slot(key)
+                self.keys[i] = key
+                self.entries[i] = entry
+
+
+
+    def __contains__(self, key):
+        return bool(self.keys[self.slot(key)])
+
+
+
+    def __len__(self):
+        return self.size
+
+
+
+class StateTable(object):
+    """
+        The table of every state reached by a search, open and closed alike, with the cost (g) of the best path
+        found to it and the move that ends that path. It replaces the PuzzleState objects linked by their parents:
+        the path to a state is rebuilt by undoing the stored moves from it back to the initial state.
+        Boards up to 4x4 are stored in a PackedTable, bigger boards in a dict.
+    """
+
+    def __init__(self, n):
+        """
+            The constructor of the StateTable class.
+
+            Args:
+                n: this is the dimension of the puzzle.
+        """
+        self.n = n
+        self.bits = tile_bits(n)
+        self.table = PackedTable() if n * n * self.bits <= 64 else {}
+
+
+
+    def put(self, packed, cost, action=None):
+        """
+            It records the cost of a state and the action that reached it.
+
+            Args:
+                packed: this is the packed state.
+                cost: this is the cost of the path to the state.
+                action: this is the last action of the path. Defaults to None (the initial state).
+        """
+        self.table[packed] = cost << 2 | MOVE_CODES.get(action, 0)
+
+
+
+    def cost(self, packed):
+        """ It returns the cost of a state, None if it has not been reached. """
+        entry = self.table.get(packed)
+        return None if entry is None else entry >> 2
+
+
+
+    def path(self, packed, blank, cost):
+        """
+            It rebuilds the actions of the path to a state by undoing its stored moves.
+
+            Args:
+                packed: this is the packed state.
+                blank: this is the position of the blank in the state.
+                cost: this is the cost of the path to the state.
+
+            Returns:
+                list: the actions from the initial state to the state.
+        """
+        bits, mask = self.bits, (1 << self.bits) - 1
+        offsets = move_offsets(self.n)
+        actions = []
+        for _ in range(cost):
+            move = self.table.get(packed) & 3
+            actions.append(MOVES[move])
+            # Undo the move: the blank goes back to where it came from.
+            previous = blank - offsets[move]
+            tile = (packed >> (previous * bits)) & mask
+            packed ^= (tile << (previous * bits)) ^ (tile << (blank * bits))
+            blank = previous
+        actions.reverse()
+        return actions
+
+
+
+    def __contains__(self, packed):
+        return packed in self.table
+
+
+
+    def __len__(self):
+        return len(self.table)
@@ -0,0 +1,167 @@
+# description: Level-gated tracing of the search algorithms
+# author: Seminara Luigi
+# date: 2023-02-15
+# tags: python, tracing, jsonl, binary, sampling
+
+import json
+import struct
+from puzzle.puzzle_state import tile_bits
+
+# Trace levels: TRACE_SEARCH records one event per iteration of a search (threshold, layer, meeting),
+# TRACE_NODES also records every expanded node.
+TRACE_OFF = 0
+TRACE_SEARCH = 1
+TRACE_NODES = 2
+TRACE_LEVELS = {"off": TRACE_OFF, "search": TRACE_SEARCH, "nodes": TRACE_NODES}
+
+# Trace file formats:
+#   'jsonl':  one JSON object per line. The first line is the header {"trace": version, "algorithm", "n"}, node
+#             records are {"i": index, "g": cost, "h": heuristic, "s": packed state} and events {"event": name, ...}.
+#   'binary': the header TRACE_HEADER followed by the records. A node record is a NODE_RECORD (kind 0, index, g, h,
+#             NaN if there is no heuristic) followed by the packed state in state_bytes little-endian bytes.
+#             An event record is kind 1 followed by the length of a JSON object and the JSON object itself.
+TRACE_FORMATS = ("jsonl", "binary")
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<4sHBH")
+NODE_RECORD = struct.Struct("<BQId")
+EVENT_RECORD = struct.Struct("<BI")
+
+# The active tracer, None when tracing is off.
+_tracer = None
+
+
+
+class Tracer(object):
+
+    def __init__(self, path, level=TRACE_NODES, fmt="jsonl", sample=1):
+        """
+            The constructor of the Tracer class.
+
+            Args:
+                path: this is the path of the trace file.
+                level: this is the trace level (TRACE_SEARCH or TRACE_NODES). Defaults to TRACE_NODES.
+                fmt: this is the format of the file (see TRACE_FORMATS). Defaults to 'jsonl'.
+                sample: only one expanded node every sample nodes is recorded. Defaults to 1.
+
+            Raises:
+                ValueError: if the level, format or sampling rate is not valid.
+        """
+        if level not in (TRACE_SEARCH, TRACE_NODES):
+            raise ValueError("level must be TRACE_SEARCH or TRACE_NODES.")
+        if fmt not in TRACE_FORMATS:
+            raise ValueError("fmt must be one of " + str(TRACE_FORMATS) + ".")
+        if sample < 1:
+            raise ValueError("sample must be a positive integer.")
+        self.level = level
+        self.fmt = fmt
+        self.sample = sample
+        self.state_bytes = 0
+        self.file = open(path, "w" if fmt == "jsonl" else "wb")
+
+
+
+    def start(self, algorithm, initial_state):
+        """
+            It writes the header of a search and returns the function that records an expanded node.
+
+            Args:
+                algorithm: this is the name of the search algorithm.
+                initial_state: this is the initial state of the puzzle.
+
+            Returns:
+                function: the node recorder node(packed, g, h), None below TRACE_NODES.
+        """
+        n = initial_state.n
+        bits = tile_bits(n)
+        self.state_bytes = (n * n * bits + 7) // 8
+        if self.fmt == "jsonl":
+            self.file.write(json.dumps({"trace": TRACE_VERSION, "algorithm": algorithm, "n": n}) + "\n")
+        else:
+            name = algorithm.encode()
+            self.file.write(TRACE_HEADER.pack(b"NTRC", TRACE_VERSION, n, len(name)) + name)
+        if self.level < TRACE_NODES:
+            return None
+
+        sample = self.sample
+        write = self.file.write
+        count = [0]
+        if self.fmt == "jsonl":
+            def node(packed, g, h):
+                i = count[0]
+                count[0] = i + 1
+                if i % sample == 0:
+                    write(f'{{"i": {i}, "g": {g}, "h": {"null" if h is None else h}, "s": {packed}}}\n')
+        else:
+            pack, size = NODE_RECORD.pack, self.state_bytes
+            def node(packed, g, h):
+                i = count[0]
+                count[0] = i + 1
+                if i % sample == 0:
+                    write(pack(0, i, g, float("nan") if h is None else h) + packed.to_bytes(size, "little"))
+        return node
+
+
+
+    def event(self, name, **fields):
+        """
+            It records an event of the search.
+
+            Args:
+                name: this is the name of the event.
+                fields: these are the values of the event, they must be JSON serializable.
+        """
+        fields["event"] = name
+        if self.fmt == "jsonl":
+            self.file.write(json.dumps(fields) + "\n")
+        else:
+            data = json.dumps(fields).encode()
+            self.file.write(EVENT_RECORD.pack(1, len(data)) + data)
+
+
+
+    def close(self):
+        """ It closes the trace file. """
+        self.file.close()
+
+
+
+def enable_tracing(path, level=TRACE_NODES, fmt="jsonl", sample=1):
+    """
+        It makes a new Tracer the active one, closing the previous one.
+
+        Args:
+            path: this is the path of the trace file.
+            level: this is the trace level, a TRACE_LEVELS value or name. Defaults to TRACE_NODES.
+            fmt: this is the format of the file (see TRACE_FORMATS). Defaults to 'jsonl'.
+            sample: only one expanded node every sample nodes is recorded. Defaults to 1.
+
+        Returns:
+            Tracer: the active tracer, None if level is TRACE_OFF.
+    """
+    global _tracer
+    disable_tracing()
+    level = TRACE_LEVELS.get(level, level)
+    if level != TRACE_OFF:
+        _tracer = Tracer(path, level, fmt, sample)
+    return _tracer
+
+
+
+def disable_tracing(close=True):
+    """
+        It turns tracing off.
+
+        Args:
+            close: if False the file of the active tracer is left open, e.g. in a forked process
+                that must not flush the buffer it shares with its parent. Defaults to True.
+    """
+    global _tracer
+    if _tracer is not None and close:
+        _tracer.close()
+    _tracer = None
+
+
+
+def get_tracer():
+    """ It returns the active tracer, None when tracing is off. """
+    return _tracer